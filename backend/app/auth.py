@@ -4,9 +4,19 @@
 import hashlib
 import hmac
 import json
+import time
 from urllib.parse import parse_qsl
 from fastapi import Header, HTTPException
-from .config import BOT_TOKEN
+from .cache import TTLCache
+from .config import BOT_TOKEN, INIT_DATA_MAX_AGE, INIT_DATA_CACHE_SIZE
+
+# Секрет зависит только от токена бота — считаем один раз при старте
+SECRET_KEY = hmac.new(b"WebAppData", (BOT_TOKEN or "").encode(), hashlib.sha256).digest()
+
+# Mini App присылает один и тот же X-Tg-Init-Data на всю сессию:
+# кэшируем заголовок -> данные пользователя до истечения auth_date
+MAX_CACHE_TTL = 3600
+verified_init_data = TTLCache(maxsize=INIT_DATA_CACHE_SIZE, ttl=MAX_CACHE_TTL)
 
 
 def validate_telegram_data(x_tg_init_data: str = Header(...)):
@@ -17,6 +27,10 @@ def validate_telegram_data(x_tg_init_data: str = Header(...)):
     if not x_tg_init_data:
         raise HTTPException(401, "No init data")
 
+    cached = verified_init_data.get(x_tg_init_data)
+    if cached is not None:
+        return cached
+
     try:
         parsed_data = dict(parse_qsl(x_tg_init_data))
         hash_check = parsed_data.pop('hash')
@@ -25,13 +39,31 @@ def validate_telegram_data(x_tg_init_data: str = Header(...)):
         data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(parsed_data.items()))
 
         # Вычисление HMAC
-        secret_key = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
-        calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+        calculated_hash = hmac.new(SECRET_KEY, data_check_string.encode(), hashlib.sha256).hexdigest()
 
-        if calculated_hash != hash_check:
+        if not hmac.compare_digest(calculated_hash, hash_check):
             raise HTTPException(403, "Invalid hash")
 
+        # Проверка свежести: старые initData не принимаем
+        ttl = MAX_CACHE_TTL
+        if INIT_DATA_MAX_AGE > 0:
+            expires_in = int(parsed_data.get('auth_date', 0)) + INIT_DATA_MAX_AGE - time.time()
+            if expires_in <= 0:
+                raise HTTPException(403, "Init data expired")
+            ttl = min(ttl, expires_in)
+
         user_data = json.loads(parsed_data['user'])
+        verified_init_data.set(x_tg_init_data, user_data, ttl=ttl)
         return user_data
     except Exception as e:
-        raise HTTPException(403, f"Validation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(403, f"Validation failed: {str(e)}")
+
+
+def optional_telegram_user(x_tg_init_data: str = Header(None)):
+    """Пользователь из initData, если заголовок есть и валиден; иначе None (для публичных ручек)."""
+    if not x_tg_init_data:
+        return None
+    try:
+        return validate_telegram_data(x_tg_init_data)
+    except HTTPException:
+        return None
@@ -5,4 +5,54 @@ load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") # ВАЖНО: Service Role для бэка
-BOT_TOKEN = os.getenv("BOT_TOKEN") # Для валидации initData
\ No newline at end of file
+BOT_TOKEN = os.getenv("BOT_TOKEN") # Для валидации initData
+
+# Очередь уведомлений Telegram
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+
+# Проверка initData: срок годности auth_date и кэш уже проверенных заголовков
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))  # 0 — кэш выключен
+
+# Кэш профиля/услуг/графика мастера
+MASTER_CACHE_TTL = int(os.getenv("MASTER_CACHE_TTL", "300"))
+MASTER_CACHE_SIZE = int(os.getenv("MASTER_CACHE_SIZE", "5000"))
+PUBLIC_CACHE_MAX_AGE = int(os.getenv("PUBLIC_CACHE_MAX_AGE", "60"))  # Cache-Control публичных ручек мастера
+
+# Битовые карты занятости дня (живут недолго: другие реплики их не обновляют)
+OCCUPANCY_TTL = int(os.getenv("OCCUPANCY_TTL", "60"))
+OCCUPANCY_CACHE_SIZE = int(os.getenv("OCCUPANCY_CACHE_SIZE", "20000"))
+
+# Брони слотов на время заполнения формы записи (в памяти процесса)
+SLOT_HOLD_TTL = int(os.getenv("SLOT_HOLD_TTL", "300"))
+SLOT_HOLD_MAX = int(os.getenv("SLOT_HOLD_MAX", "20000"))
+
+# Идемпотентность POST /appointments: недавние записи по (клиент, ключ) в памяти
+IDEMPOTENCY_CACHE_TTL = int(os.getenv("IDEMPOTENCY_CACHE_TTL", "3600"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# Кэш результатов аналитики (сбрасывается при изменении записей мастера)
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "2000"))
+
+# SSE-поток изменений свободных слотов
+SSE_HEARTBEAT_SEC = int(os.getenv("SSE_HEARTBEAT_SEC", "15"))
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "5000"))
+SSE_MAX_PER_TOPIC = int(os.getenv("SSE_MAX_PER_TOPIC", "200"))  # подписчиков на (мастер, день)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "32"))
+
+# Загрузка фото: лимит размера и пул процессов для сжатия
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "15"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", "8"))  # сжатий в работе + в ожидании, общий лимит ImageProcessor
+IMAGE_QUEUE_TIMEOUT = float(os.getenv("IMAGE_QUEUE_TIMEOUT", "15"))
+
+# Уборка фото, на которые больше не ссылается профиль (после грейс-периода: загруженные,
+# но еще не сохраненные в профиль фото не трогаем)
+PHOTO_SWEEP_HOURS = int(os.getenv("PHOTO_SWEEP_HOURS", "24"))
+PHOTO_SWEEP_GRACE_HOURS = int(os.getenv("PHOTO_SWEEP_GRACE_HOURS", "24"))
+
+# Напоминания: таймеры в памяти + редкая сверка с базой
+REMINDER_RECONCILE_MINUTES = int(os.getenv("REMINDER_RECONCILE_MINUTES", "10"))
@@ -1,4 +1,36 @@
-from supabase import create_client, Client
+from supabase import acreate_client, AsyncClient
+from supabase.lib.client_options import AsyncClientOptions
 from .config import SUPABASE_URL, SUPABASE_KEY
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+# Один асинхронный клиент на процесс: внутри него живет httpx.AsyncClient
+# (keep-alive + HTTP/2), поэтому запросы к PostgREST не блокируют event loop
+# и переиспользуют уже открытые соединения.
+_client: AsyncClient | None = None
+
+
+async def init_db() -> AsyncClient:
+    global _client
+    if _client is None:
+        _client = await acreate_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=AsyncClientOptions(postgrest_client_timeout=10),
+        )
+    return _client
+
+
+async def close_db():
+    global _client
+    if _client is not None:
+        await _client.postgrest.aclose()
+        # Storage (фото, уборка) держит свою httpx-сессию; создается лениво — закрываем, если был создан
+        storage = getattr(_client, '_storage', None)
+        if storage is not None:
+            await storage.session.aclose()
+        _client = None
+
+
+def get_db() -> AsyncClient:
+    if _client is None:
+        raise RuntimeError("Database client is not initialized, call init_db() on startup")
+    return _client
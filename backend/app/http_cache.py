@@ -0,0 +1,34 @@
+# backend/app/http_cache.py
+import hashlib
+import json
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+from .config import PUBLIC_CACHE_MAX_AGE
+
+
+def etag_of(payload) -> str:
+    """Сильный ETag по содержимому ответа (одинаковые данные — одинаковый тег на любой реплике)."""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    # Сравнение для If-None-Match — слабое: W/"x" и "x" считаются одним тегом
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return etag in tags
+
+
+def cached_json(request: Request, payload, etag: str, max_age: int = PUBLIC_CACHE_MAX_AGE) -> Response:
+    """JSON-ответ с ETag и Cache-Control; 304 без тела, если у клиента (или CDN) та же версия."""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={max_age * 10}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=payload, headers=headers)
@@ -0,0 +1,142 @@
+# backend/app/images.py
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from .config import MAX_UPLOAD_MB, IMAGE_WORKERS, IMAGE_MAX_PENDING, IMAGE_QUEUE_TIMEOUT
+from .utils import compress_image, make_photo_variants
+
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+READ_CHUNK = 256 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # границы частей и заголовки multipart/form-data сверх самого файла
+
+
+def _too_large(max_bytes: int) -> str:
+    return f"Файл больше {max_bytes // (1024 * 1024)} МБ"
+
+
+class ImageProcessor:
+    """
+    Сжатие фото вне event loop: пул процессов (Pillow держит GIL на декодировании)
+    и семафор на число задач в работе. Если пул забит дольше IMAGE_QUEUE_TIMEOUT,
+    загрузка получает 503, а не копит очередь в памяти.
+    """
+
+    def __init__(self, workers: int = IMAGE_WORKERS, max_pending: int = IMAGE_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+        # Метрики
+        self.in_flight = 0
+        self.processed = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def compress(self, image_bytes: bytes, max_size: int = 1024, quality: int = 80) -> bytes:
+        return await self._run(compress_image, image_bytes, max_size, quality)
+
+    async def variants(self, image_bytes: bytes) -> dict:
+        """Варианты фото разных размеров в JPEG и WebP (см. utils.make_photo_variants)."""
+        return await self._run(make_photo_variants, image_bytes)
+
+    async def _run(self, fn, *args):
+        self.start()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=IMAGE_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(503, "Сервер занят обработкой фото, попробуйте еще раз")
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool, fn, *args)
+            self.processed += 1
+            return result
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+        }
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Читает уже принятый файл в память кусками; больше max_bytes — 413.
+    К этому моменту Starlette уже сохранил тело запроса во временный файл: не принять
+    лишнее по сети — задача UploadSizeLimit, здесь проверяется размер самого файла.
+    """
+    too_large = HTTPException(413, _too_large(max_bytes))
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    chunks = []
+    total = 0
+    while chunk := await file.read(READ_CHUNK):
+        total += len(chunk)
+        if total > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class UploadSizeLimit:
+    """
+    ASGI-middleware для multipart-загрузок: отклоняет тело больше лимита до разбора формы.
+    Запрос с Content-Length больше лимита получает 413 сразу, не читая тело; без
+    Content-Length (chunked) прием обрывается 413, как только прочитано больше лимита.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        if not headers.get('content-type', '').startswith('multipart/form-data'):
+            return await self.app(scope, receive, send)
+
+        detail = _too_large(self.max_bytes - MULTIPART_OVERHEAD)
+        declared = headers.get('content-length', '')
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # Разбор формы пробрасывает HTTPException, ответ отдаст обработчик исключений FastAPI
+                    raise HTTPException(413, detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+image_processor = ImageProcessor()
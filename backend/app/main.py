@@ -4,19 +4,39 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler  # [NEW]
 
-from app.db import supabase
-from app.auth import validate_telegram_data
+from app.db import init_db, close_db
+from app.notifications import dispatcher
+from app.images import image_processor, read_upload, UploadSizeLimit
+from app.services.photo_service import PhotoService
+from app.services.availability_events import availability_broker
+from app.services.slot_holds import slot_holds
+from app.services.schedule_service import master_cache
+from app.services.occupancy import occupancy_cache
+from app.services.analytics_service import analytics_cache
+from app.auth import validate_telegram_data, verified_init_data
 from app.routers import admin, client, analytics
-from app.reminders import check_reminders  # [NEW] Импортируем нашу функцию
+from app.reminders import reminder_scheduler
+from app.config import REMINDER_RECONCILE_MINUTES, PHOTO_SWEEP_HOURS
 
 
 # [NEW] Настройка жизненного цикла (Startup/Shutdown)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Запуск планировщика
+    # Асинхронный клиент Supabase (общий пул соединений на процесс)
+    await init_db()
+    # Воркеры очереди уведомлений Telegram
+    await dispatcher.start()
+    # Пул процессов для сжатия фото
+    image_processor.start()
+
+    # Таймеры напоминаний (загружаем подтвержденные записи на сутки вперед)
+    await reminder_scheduler.start()
+
+    # Запуск планировщика: редкая сверка таймеров с базой
     scheduler = AsyncIOScheduler()
-    # Добавляем задачу: запускать check_reminders каждую минуту
-    scheduler.add_job(check_reminders, 'interval', minutes=1)
+    scheduler.add_job(reminder_scheduler.reconcile, 'interval', minutes=REMINDER_RECONCILE_MINUTES)
+    # Уборка фото, которые не попали в профиль
+    scheduler.add_job(PhotoService.sweep_all, 'interval', hours=PHOTO_SWEEP_HOURS)
     scheduler.start()
     print("⏰ Scheduler started!")
 
@@ -24,11 +44,18 @@ async def lifespan(app: FastAPI):
 
     # Остановка (если нужно)
     scheduler.shutdown()
+    await reminder_scheduler.stop()
+    await dispatcher.stop()
+    image_processor.stop()
+    await close_db()
 
 
 # Передаем lifespan в приложение
 app = FastAPI(title="Grooming TMA API", lifespan=lifespan)
 
+# Слишком большие загрузки фото отклоняются до разбора multipart-формы
+# (добавлена до CORS, чтобы ответ 413 тоже получил CORS-заголовки)
+app.add_middleware(UploadSizeLimit)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -47,15 +74,29 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return {
+        "notifications": dispatcher.metrics(),
+        "auth_cache": verified_init_data.stats(),
+        "master_cache": master_cache.stats(),
+        "occupancy_cache": occupancy_cache.stats(),
+        "analytics_cache": analytics_cache.stats(),
+        "reminder_timers": len(reminder_scheduler),
+        "image_processing": image_processor.metrics(),
+        "availability_stream": availability_broker.metrics(),
+        "slot_holds": slot_holds.metrics(),
+    }
+
+
 @app.post("/uploads/avatar")
 async def upload_avatar_legacy(file: UploadFile = File(...), user=Depends(validate_telegram_data)):
-    file_content = await file.read()
-    file_path = f"{user['id']}/avatar.png"
+    file_content = await read_upload(file)
     try:
-        supabase.storage.from_("avatars").upload(
-            file_path, file_content, file_options={"content-type": file.content_type, "upsert": "true"}
-        )
-        public_url = supabase.storage.from_("avatars").get_public_url(file_path)
+        # Путь — по хешу содержимого: повторная загрузка того же файла не пишет в Storage
+        public_url = await PhotoService.upload_avatar(user['id'], file_content)
         return {"avatar_url": public_url}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,185 @@
+# backend/app/notifications.py
+import asyncio
+import time
+from collections import deque
+
+import httpx
+
+from .config import BOT_TOKEN, TELEGRAM_API_URL, NOTIFY_WORKERS, NOTIFY_QUEUE_SIZE
+
+# Лимиты Bot API: ~30 сообщений/сек на бота и ~1 сообщение/сек в один чат
+GLOBAL_RATE_PER_SEC = 25
+PER_CHAT_INTERVAL_SEC = 1.0
+MAX_ATTEMPTS = 5
+MAX_RATE_LIMITED = 5  # 429 подряд на одно сообщение, после которых оно отбрасывается
+BACKOFF_BASE_SEC = 1.0
+
+
+class NotificationDispatcher:
+    """
+    In-process outbox для сообщений Telegram.
+    Эндпоинты кладут сообщение в ограниченную очередь и сразу возвращают ответ,
+    а воркеры разбирают ее через одну keep-alive сессию httpx,
+    соблюдая лимиты Bot API и повторяя отправку при ошибках.
+    """
+
+    def __init__(self, token: str, api_url: str = TELEGRAM_API_URL,
+                 workers: int = NOTIFY_WORKERS, queue_size: int = NOTIFY_QUEUE_SIZE):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.workers_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._client: httpx.AsyncClient | None = None
+        self._workers: list[asyncio.Task] = []
+
+        # Rate limiting
+        self._global_lock = asyncio.Lock()
+        self._next_global_slot = 0.0
+        self._paused_until = 0.0
+        self._chat_next_slot: dict[int, float] = {}
+
+        # Метрики
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self._latencies = deque(maxlen=500)
+
+    async def start(self):
+        if self._workers:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=self.workers_count, max_keepalive_connections=self.workers_count),
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Дожидается отправки очереди (не дольше drain_timeout) и закрывает сессию."""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"Notification queue not drained, {self.queue.qsize()} messages lost")
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, chat_id: int, text: str) -> bool:
+        """Неблокирующая постановка в очередь. False — если очередь переполнена."""
+        if not self.token:
+            print("WARNING: BOT_TOKEN not set, notification skipped")
+            return False
+        try:
+            self.queue.put_nowait((chat_id, text, 1, time.monotonic()))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Notification queue is full, message to {chat_id} dropped")
+            return False
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "workers": len(self._workers),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "rate_limited": self.rate_limited,
+            "send_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+                "p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else 0,
+            },
+        }
+
+    # --- Внутреннее ---
+
+    async def _worker(self):
+        while True:
+            chat_id, text, attempt, enqueued_at = await self.queue.get()
+            try:
+                await self._deliver(chat_id, text, attempt)
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to send notification to {chat_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _deliver(self, chat_id: int, text: str, attempt: int):
+        rate_limited = 0
+        while True:
+            await self._wait_for_slot(chat_id)
+            started = time.monotonic()
+            try:
+                response = await self._client.post(
+                    f"{self.api_url}/bot{self.token}/sendMessage",
+                    json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"},
+                )
+            except httpx.HTTPError as e:
+                error = str(e) or e.__class__.__name__
+            else:
+                self._latencies.append(time.monotonic() - started)
+                if response.status_code == 200:
+                    self.sent += 1
+                    return
+                if response.status_code == 429:
+                    # Telegram сообщает, сколько ждать: {"parameters": {"retry_after": N}}
+                    self.rate_limited += 1
+                    rate_limited += 1
+                    if rate_limited >= MAX_RATE_LIMITED:
+                        # Чат продолжает отвечать 429 — не держим воркер и очередь бесконечно
+                        self.failed += 1
+                        print(f"Notification to {chat_id} dropped after {rate_limited} rate limit responses")
+                        return
+                    retry_after = self._retry_after(response)
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    continue
+                if response.status_code < 500:
+                    # 400/403: чат не найден, бот заблокирован — повтор не поможет
+                    self.failed += 1
+                    print(f"Telegram API Error: {response.text}")
+                    return
+                error = f"HTTP {response.status_code}"
+
+            if attempt >= MAX_ATTEMPTS:
+                self.failed += 1
+                print(f"Failed to send notification to {chat_id} after {attempt} attempts: {error}")
+                return
+            self.retried += 1
+            await asyncio.sleep(BACKOFF_BASE_SEC * 2 ** (attempt - 1))
+            attempt += 1
+
+    async def _wait_for_slot(self, chat_id: int):
+        # Глобальный лимит: выдаем слоты по очереди с интервалом 1/GLOBAL_RATE_PER_SEC
+        async with self._global_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_global_slot, self._paused_until)
+            self._next_global_slot = slot + 1 / GLOBAL_RATE_PER_SEC
+
+        # Лимит на чат: не чаще одного сообщения в секунду
+        chat_slot = max(slot, self._chat_next_slot.get(chat_id, 0.0))
+        self._chat_next_slot[chat_id] = chat_slot + PER_CHAT_INTERVAL_SEC
+        if len(self._chat_next_slot) > 10000:
+            self._chat_next_slot = {k: v for k, v in self._chat_next_slot.items() if v > now}
+
+        delay = chat_slot - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> float:
+        try:
+            return float(response.json().get('parameters', {}).get('retry_after', 1))
+        except Exception:
+            return 1.0
+
+
+dispatcher = NotificationDispatcher(BOT_TOKEN)
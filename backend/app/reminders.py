@@ -1,94 +1,221 @@
 # backend/app/reminders.py
 import asyncio
+import heapq
+import time
 from datetime import datetime, timedelta, timezone
-from app.db import supabase
+from app.repositories.appointments import AppointmentRepository
 from app.utils import send_telegram_message
 import pytz
 
 
+def format_5h(pet_name, service_name, salon_name, local_time):
+    return (
+        f"👋 Напоминаем!\n\n"
+        f"Сегодня в <b>{local_time}</b> ждем <b>{pet_name}</b> на {service_name}.\n"
+        f"📍 {salon_name}"
+    )
+
+
+def format_1h(pet_name, service_name, salon_name, local_time):
+    return (
+        f"⏳ Через час ждем вас!\n\n"
+        f"<b>{pet_name}</b>, {service_name} в <b>{local_time}</b>.\n"
+        f"Пожалуйста, не опаздывайте."
+    )
+
+
+# at_h — когда напоминание должно сработать (часов до начала),
+# from_h/to_h — окно, в котором таймер еще может его отправить, flag — отметка об отправке
+REMINDERS = [
+    {"kind": "5h", "flag": "reminder_5h_sent", "at_h": 5, "from_h": 4.5, "to_h": 5.5, "format": format_5h},
+    {"kind": "1h", "flag": "reminder_1h_sent", "at_h": 1, "from_h": 0.9, "to_h": 1.5, "format": format_1h},
+]
+REMINDERS_BY_KIND = {r["kind"]: r for r in REMINDERS}
+
+# Таймеры держим на сутки вперед; более дальние записи подхватит сверка
+SCHEDULE_HORIZON = timedelta(hours=24)
+
+
 async def check_reminders():
     """
-    Фоновая задача: проверяет записи и шлет напоминания за 5ч и 1ч.
+    Страховочный проход по окнам напоминаний (основную работу делают таймеры ReminderScheduler).
+    Из базы берутся только просроченные записи — от from_h до at_h до начала, еще без флага,
+    поэтому стоимость тика зависит от числа напоминаний к отправке, а не от всех записей на сутки.
+    Планировщик крутится в каждом воркере и реплике, поэтому запись сначала захватывается
+    (флаг ставится атомарно), и отправляет ее только тот, кто захватил.
     """
     print(f"[{datetime.now().strftime('%H:%M')}] Checking reminders...")
 
     try:
-        # 1. Получаем все АКТИВНЫЕ (confirmed) записи на ближайшие 24 часа
-        # Чтобы не тянуть всю базу, берем диапазон: от "сейчас" до "завтра"
         now_utc = datetime.now(timezone.utc)
-        tomorrow_utc = now_utc + timedelta(days=1)
+        await asyncio.gather(*(process_reminder_batch(reminder, now_utc) for reminder in REMINDERS))
+    except Exception as e:
+        print(f"Error in reminder loop: {e}")
 
-        res = supabase.table("appointments") \
-            .select("*, services(name), masters(timezone, salon_name)") \
-            .eq("status", "confirmed") \
-            .gte("starts_at", now_utc.isoformat()) \
-            .lte("starts_at", tomorrow_utc.isoformat()) \
-            .execute()
 
-        appointments = res.data
+async def process_reminder_batch(reminder: dict, now_utc, ids: list = None):
+    window_start = now_utc + timedelta(hours=reminder["from_h"])
+    # Таймер захватывает свои записи во всем окне; сверка — только те, чей момент at_h
+    # уже наступил, иначе она отправляла бы напоминания раньше таймеров
+    window_end = now_utc + timedelta(hours=reminder["to_h"] if ids is not None else reminder["at_h"])
 
-        for appt in appointments:
-            await process_single_appointment(appt, now_utc)
+    claimed = await AppointmentRepository.claim_due_reminders(
+        reminder["kind"], window_start.isoformat(), window_end.isoformat(), ids
+    )
+    if not claimed:
+        return
 
-    except Exception as e:
-        print(f"Error in reminder loop: {e}")
+    # Отправка только ставит сообщения в очередь; если очередь не приняла сообщение,
+    # снимаем флаг одним UPDATE, чтобы напоминание подхватил следующий тик
+    failed_ids = []
+    for appt in claimed:
+        try:
+            text = build_message(appt, reminder["format"])
+        except ValueError:
+            continue
+        if not await send_safe(appt['client_telegram_id'], text):
+            failed_ids.append(appt['id'])
+    await AppointmentRepository.mark_many(failed_ids, {reminder["flag"]: False})
 
 
-async def process_single_appointment(appt, now_utc):
+def build_message(appt, formatter):
     # Парсим время начала (оно в ISO формате с часовым поясом)
-    try:
-        start_time = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00'))
-    except ValueError:
-        return
-
-    # Считаем, сколько осталось времени
-    time_left = start_time - now_utc
-    total_seconds = time_left.total_seconds()
-    hours_left = total_seconds / 3600
+    start_time = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00'))
 
     # Данные для сообщения
-    client_id = appt['client_telegram_id']
-    pet_name = appt.get('pet_name', 'питомца')
-    service_name = appt.get('services', {}).get('name', 'услугу') if appt.get('services') else 'услугу'
-    salon_name = appt.get('masters', {}).get('salon_name', 'Grooming Salon')
+    pet_name = appt.get('pet_name') or 'питомца'
+    service_name = appt.get('service_name') or 'услугу'
+    salon_name = appt.get('salon_name') or 'Grooming Salon'
 
     # Форматируем локальное время для клиента
-    tz_str = appt.get('masters', {}).get('timezone', 'Asia/Almaty')
+    tz_str = appt.get('timezone') or 'Asia/Almaty'
     try:
         local_time = start_time.astimezone(pytz.timezone(tz_str)).strftime('%H:%M')
     except:
         local_time = start_time.strftime('%H:%M')
 
-    # --- ЛОГИКА 5 ЧАСОВ ---
-    # Если осталось от 4.5 до 5.5 часов И еще не отправляли
-    if 4.5 <= hours_left <= 5.5 and not appt['reminder_5h_sent']:
-        msg = (
-            f"👋 Напоминаем!\n\n"
-            f"Сегодня в <b>{local_time}</b> ждем <b>{pet_name}</b> на {service_name}.\n"
-            f"📍 {salon_name}"
-        )
-        if await send_safe(client_id, msg):
-            supabase.table("appointments").update({"reminder_5h_sent": True}).eq("id", appt['id']).execute()
-
-    # --- ЛОГИКА 1 ЧАС ---
-    # Если осталось от 0.9 до 1.5 часов И еще не отправляли
-    elif 0.9 <= hours_left <= 1.5 and not appt['reminder_1h_sent']:
-        msg = (
-            f"⏳ Через час ждем вас!\n\n"
-            f"<b>{pet_name}</b>, {service_name} в <b>{local_time}</b>.\n"
-            f"Пожалуйста, не опаздывайте."
-        )
-        if await send_safe(client_id, msg):
-            supabase.table("appointments").update({"reminder_1h_sent": True}).eq("id", appt['id']).execute()
+    return formatter(pet_name, service_name, salon_name, local_time)
 
 
 async def send_safe(chat_id, text):
     """Обертка для отправки, чтобы не падать при ошибках сети"""
     try:
-        # send_telegram_message синхронная, но в треде ок.
-        # В идеале переписать на aiohttp, но пока оставим requests для простоты.
-        send_telegram_message(chat_id, text)
-        return True
+        # Сообщение уходит в очередь app.notifications, отправка — в фоне
+        return send_telegram_message(chat_id, text)
     except Exception as e:
         print(f"Failed to send reminder to {chat_id}: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class ReminderScheduler:
+    """
+    Таймеры напоминаний в памяти: куча (время срабатывания, id записи, вид напоминания).
+    Заполняется при старте подтвержденными записями на сутки вперед и обновляется
+    при подтверждении/отмене записи; сверка раз в несколько минут догружает записи,
+    подтвержденные на других репликах. В момент срабатывания напоминание захватывается
+    через claim_due_reminders, поэтому при нескольких репликах оно уходит один раз.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._planned = {}  # (appointment_id, kind) -> fire_at; устаревшие элементы кучи пропускаются
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        try:
+            await self.reload()
+        except Exception as e:
+            print(f"Failed to load reminders: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def reload(self):
+        now_utc = datetime.now(timezone.utc)
+        rows = await AppointmentRepository.list_upcoming_confirmed(
+            now_utc.isoformat(), (now_utc + SCHEDULE_HORIZON).isoformat()
+        )
+        for appt in rows:
+            self.schedule(appt)
+
+    async def reconcile(self):
+        """Периодическая сверка: догружаем таймеры и проходим по окнам на случай пропусков."""
+        try:
+            await self.reload()
+        except Exception as e:
+            print(f"Reminder reload failed: {e}")
+        await check_reminders()
+
+    def schedule(self, appt: dict):
+        """Ставит таймеры для подтвержденной записи (прошлые и уже отправленные — пропускаются)."""
+        if appt.get('status') != 'confirmed':
+            self.unschedule(appt['id'])
+            return
+        try:
+            starts_at = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00')).timestamp()
+        except (ValueError, AttributeError, KeyError):
+            return
+
+        now = time.time()
+        for reminder in REMINDERS:
+            key = (appt['id'], reminder["kind"])
+            fire_at = starts_at - reminder["at_h"] * 3600
+            if fire_at < now:
+                # Опоздали к точному моменту: шлем сразу, пока не вышли из окна
+                if starts_at - now < reminder["from_h"] * 3600:
+                    self._planned.pop(key, None)
+                    continue
+                fire_at = now
+            if appt.get(reminder["flag"]) or fire_at > now + SCHEDULE_HORIZON.total_seconds():
+                self._planned.pop(key, None)
+                continue
+            if self._planned.get(key) == fire_at:
+                continue
+
+            self._planned[key] = fire_at
+            heapq.heappush(self._heap, (fire_at, appt['id'], reminder["kind"]))
+            if self._heap[0][0] == fire_at:
+                self._wakeup.set()
+
+    def unschedule(self, appt_id: int):
+        for reminder in REMINDERS:
+            self._planned.pop((appt_id, reminder["kind"]), None)
+
+    def __len__(self):
+        return len(self._planned)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Забираем все сработавшие таймеры и захватываем их пачкой по виду напоминания
+            now = time.time()
+            due = {}
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, appt_id, kind = heapq.heappop(self._heap)
+                if self._planned.get((appt_id, kind)) != fire_at:
+                    continue
+                del self._planned[(appt_id, kind)]
+                due.setdefault(kind, []).append(appt_id)
+
+            now_utc = datetime.now(timezone.utc)
+            for kind, ids in due.items():
+                try:
+                    await process_reminder_batch(REMINDERS_BY_KIND[kind], now_utc, ids)
+                except Exception as e:
+                    print(f"Error sending reminders {kind} {ids}: {e}")
+
+
+reminder_scheduler = ReminderScheduler()
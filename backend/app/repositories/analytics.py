@@ -0,0 +1,31 @@
+from app.db import get_db
+
+
+class AnalyticsRepository:
+    @staticmethod
+    async def dashboard(master_id: int, date_from: str, daily_from: str, daily_to: str) -> dict:
+        """Агрегаты дашборда из дневной сводки master_daily_stats (см. get_dashboard_stats в database/shema.sql)."""
+        res = await get_db().rpc("get_dashboard_stats", {
+            "p_master_id": master_id,
+            "p_from": date_from,
+            "p_daily_from": daily_from,
+            "p_daily_to": daily_to,
+        }).execute()
+        return res.data or {}
+
+    @staticmethod
+    async def series(master_id: int, date_from: str, date_to: str, granularity: str) -> dict:
+        """Итоги и ряд по дням/неделям/месяцам за период (см. get_analytics_series)."""
+        res = await get_db().rpc("get_analytics_series", {
+            "p_master_id": master_id,
+            "p_from": date_from,
+            "p_to": date_to,
+            "p_granularity": granularity,
+        }).execute()
+        return res.data or {}
+
+    @staticmethod
+    async def rebuild_daily_stats(master_id: int = None) -> int:
+        """Полный пересчет дневной сводки: для одного мастера или для всех (master_id=None)."""
+        res = await get_db().rpc("rebuild_master_daily_stats", {"p_master_id": master_id}).execute()
+        return res.data or 0
@@ -0,0 +1,118 @@
+from app.db import get_db
+
+# Поля карточки записи в админке (см. frontend/src/features/admin/appointments.ts)
+LIST_FIELDS = (
+    "id, starts_at, status, client_name, client_phone, client_username, "
+    "pet_name, pet_breed, comment, services(name, category)"
+)
+
+
+class AppointmentRepository:
+    @staticmethod
+    async def create(data: dict):
+        """
+        Запись клиента одним RPC: проверки услуги, рабочих часов и пересечений + вставка.
+        Возвращает строку записи с service_name и master_timezone. См. create_booking в database/shema.sql.
+        """
+        res = await get_db().rpc("create_booking", {
+            "p_master_id": data['master_telegram_id'],
+            "p_client_id": data['client_telegram_id'],
+            "p_service_id": data['service_id'],
+            "p_starts_at": data['starts_at'],
+            "p_client_name": data.get('client_name'),
+            "p_client_phone": data['client_phone'],
+            "p_client_username": data.get('client_username'),
+            "p_pet_name": data.get('pet_name'),
+            "p_pet_breed": data.get('pet_breed'),
+            "p_comment": data.get('comment'),
+            "p_idempotency_key": data.get('idempotency_key'),
+        }).execute()
+        return res.data or None
+
+    @staticmethod
+    async def list_for_master(master_id: int, limit: int, after: tuple = None, desc: bool = False,
+                              status: str = None, start_iso: str = None, end_iso: str = None):
+        """
+        Страница записей мастера в порядке (starts_at, id); after — (starts_at, id) последней
+        строки предыдущей страницы. Возвращает до limit + 1 строк: лишняя значит, что есть еще.
+        """
+        query = get_db().table("appointments") \
+            .select(LIST_FIELDS) \
+            .eq("master_telegram_id", master_id)
+        if status:
+            query = query.eq("status", status)
+        if start_iso:
+            query = query.gte("starts_at", start_iso)
+        if end_iso:
+            query = query.lt("starts_at", end_iso)
+        if after:
+            op = "lt" if desc else "gt"
+            starts_at, aid = after
+            query = query.or_(f'starts_at.{op}."{starts_at}",and(starts_at.eq."{starts_at}",id.{op}.{aid})')
+
+        res = await query \
+            .order("starts_at", desc=desc) \
+            .order("id", desc=desc) \
+            .limit(limit + 1) \
+            .execute()
+        return res.data
+
+    @staticmethod
+    async def set_status(ids: list, master_id: int, status: str):
+        """
+        Меняет статус пачки записей мастера одним UPDATE ... RETURNING (см. set_appointments_status
+        в shema.sql). Возвращает только реально измененные строки, с service_name.
+        """
+        res = await get_db().rpc("set_appointments_status", {
+            "p_master_id": master_id,
+            "p_ids": ids,
+            "p_status": status,
+        }).execute()
+        return res.data or []
+
+    @staticmethod
+    async def list_busy(master_id: int, start_iso: str, end_iso: str):
+        """Неотмененные записи мастера в интервале [start, end): [{id, starts_at, duration_min}]."""
+        res = await get_db().table("appointments") \
+            .select("id, starts_at, services(duration_min)") \
+            .eq("master_telegram_id", master_id) \
+            .neq("status", "cancelled") \
+            .gte("starts_at", start_iso) \
+            .lt("starts_at", end_iso) \
+            .order("starts_at") \
+            .execute()
+        return [
+            {"id": b['id'], "starts_at": b['starts_at'], "duration_min": (b.get('services') or {}).get('duration_min')}
+            for b in res.data
+        ]
+
+    @staticmethod
+    async def list_upcoming_confirmed(start_iso: str, end_iso: str):
+        res = await get_db().table("appointments") \
+            .select("id, starts_at, status, reminder_5h_sent, reminder_1h_sent") \
+            .eq("status", "confirmed") \
+            .gte("starts_at", start_iso) \
+            .lte("starts_at", end_iso) \
+            .execute()
+        return res.data
+
+    @staticmethod
+    async def claim_due_reminders(kind: str, start_iso: str, end_iso: str, ids: list = None):
+        """
+        Атомарно ставит флаг напоминания kind ('5h'/'1h') подтвержденным записям в окне [start, end]
+        и возвращает только захваченные этим вызовом строки (см. claim_due_reminders в shema.sql).
+        ids сужает захват до конкретных записей.
+        """
+        res = await get_db().rpc("claim_due_reminders", {
+            "p_kind": kind,
+            "p_from": start_iso,
+            "p_to": end_iso,
+            "p_ids": ids,
+        }).execute()
+        return res.data or []
+
+    @staticmethod
+    async def mark_many(ids: list, data: dict):
+        """Одно UPDATE ... WHERE id IN (...) на всю пачку."""
+        if ids:
+            await get_db().table("appointments").update(data).in_("id", ids).execute()
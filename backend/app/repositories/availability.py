@@ -0,0 +1,16 @@
+from app.db import get_db
+
+
+class AvailabilityRepository:
+    @staticmethod
+    async def load_inputs(master_id: int, date_from: str, date_to: str) -> dict:
+        """
+        Один RPC-вызов вместо четырех запросов (masters, services, working_hours, appointments).
+        См. get_availability_inputs в database/shema.sql.
+        """
+        res = await get_db().rpc("get_availability_inputs", {
+            "p_master_id": master_id,
+            "p_from": date_from,
+            "p_to": date_to,
+        }).execute()
+        return res.data or {}
@@ -0,0 +1,49 @@
+from app.db import get_db
+
+PUBLIC_PROFILE_FIELDS = "salon_name, description, avatar_url, address, phone, timezone, photos, is_premium"
+
+
+class MasterRepository:
+    @staticmethod
+    async def get(telegram_id: int, columns: str = "*"):
+        """Возвращает строку мастера или None."""
+        res = await get_db().table("masters") \
+            .select(columns) \
+            .eq("telegram_id", telegram_id) \
+            .limit(1) \
+            .execute()
+        return res.data[0] if res.data else None
+
+    @staticmethod
+    async def get_public(telegram_id: int):
+        return await MasterRepository.get(telegram_id, PUBLIC_PROFILE_FIELDS)
+
+    @staticmethod
+    async def create(data: dict):
+        res = await get_db().table("masters").insert(data).execute()
+        return res.data[0]
+
+    @staticmethod
+    async def update(telegram_id: int, data: dict):
+        res = await get_db().table("masters").update(data).eq("telegram_id", telegram_id).execute()
+        return res.data
+
+    @staticmethod
+    async def set_timezone(telegram_id: int, timezone: str) -> int:
+        """Меняет таймзону и пересчитывает дневную сводку аналитики в одной транзакции (см. set_master_timezone)."""
+        res = await get_db().rpc("set_master_timezone", {"p_master_id": telegram_id, "p_timezone": timezone}).execute()
+        return res.data or 0
+
+    @staticmethod
+    async def list_ids(page_size: int = 1000) -> list:
+        """telegram_id всех мастеров (постранично: PostgREST ограничивает размер ответа)."""
+        ids = []
+        while True:
+            res = await get_db().table("masters") \
+                .select("telegram_id") \
+                .order("telegram_id") \
+                .range(len(ids), len(ids) + page_size - 1) \
+                .execute()
+            ids.extend(row['telegram_id'] for row in res.data)
+            if len(res.data) < page_size:
+                return ids
@@ -0,0 +1,44 @@
+from app.db import get_db
+
+
+class ServiceRepository:
+    @staticmethod
+    async def list_active(master_id: int, columns: str = "*"):
+        res = await get_db().table("services") \
+            .select(columns) \
+            .eq("master_telegram_id", master_id) \
+            .eq("is_active", True) \
+            .order("id") \
+            .execute()
+        return res.data
+
+    @staticmethod
+    async def count_active(master_id: int) -> int:
+        res = await get_db().table("services") \
+            .select("id", count="exact") \
+            .eq("master_telegram_id", master_id) \
+            .eq("is_active", True) \
+            .execute()
+        return res.count or 0
+
+    @staticmethod
+    async def get(service_id: int, columns: str = "*", master_id: int = None):
+        """Возвращает услугу или None. Если передан master_id — проверяет владельца."""
+        query = get_db().table("services").select(columns).eq("id", service_id)
+        if master_id is not None:
+            query = query.eq("master_telegram_id", master_id)
+        res = await query.limit(1).execute()
+        return res.data[0] if res.data else None
+
+    @staticmethod
+    async def create(data: dict):
+        res = await get_db().table("services").insert(data).execute()
+        return res.data
+
+    @staticmethod
+    async def update(service_id: int, master_id: int, data: dict):
+        res = await get_db().table("services").update(data) \
+            .eq("id", service_id) \
+            .eq("master_telegram_id", master_id) \
+            .execute()
+        return res.data
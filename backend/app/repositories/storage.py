@@ -0,0 +1,64 @@
+from typing import Optional
+
+from storage3.exceptions import StorageApiError
+
+from app.db import get_db
+
+BUCKET = "avatars"
+LIST_PAGE = 1000
+
+
+def _is_missing(exc: StorageApiError) -> bool:
+    # Storage отвечает на отсутствующий объект 404, а иногда 400 "Object not found"
+    return str(exc.status) in ("400", "404")
+
+
+class StorageRepository:
+    @staticmethod
+    async def upload(path: str, content: bytes, content_type: str, upsert: bool = False,
+                     bucket: str = BUCKET, cache_seconds: int = None):
+        options = {"content-type": content_type}
+        if upsert:
+            options["upsert"] = "true"
+        if cache_seconds:
+            options["cache-control"] = str(cache_seconds)
+        await get_db().storage.from_(bucket).upload(path=path, file=content, file_options=options)
+
+    @staticmethod
+    async def public_url(path: str, bucket: str = BUCKET) -> str:
+        return await get_db().storage.from_(bucket).get_public_url(path)
+
+    @staticmethod
+    async def download(path: str, bucket: str = BUCKET) -> Optional[bytes]:
+        """Содержимое объекта или None, если его нет."""
+        try:
+            return await get_db().storage.from_(bucket).download(path)
+        except StorageApiError as e:
+            if _is_missing(e):
+                return None
+            raise
+
+    @staticmethod
+    async def list(prefix: str, bucket: str = BUCKET) -> list:
+        """Все элементы одного уровня папки prefix (у вложенных папок id = None)."""
+        storage = get_db().storage.from_(bucket)
+        entries, offset = [], 0
+        while True:
+            page = await storage.list(prefix, {"limit": LIST_PAGE, "offset": offset})
+            entries.extend(page)
+            if len(page) < LIST_PAGE:
+                return entries
+            offset += LIST_PAGE
+
+    @staticmethod
+    async def remove(paths: list, bucket: str = BUCKET):
+        if paths:
+            await get_db().storage.from_(bucket).remove(paths)
+
+    @staticmethod
+    def object_path(url: str, bucket: str = BUCKET) -> Optional[str]:
+        """Путь объекта по его публичному URL (None — если URL не из нашего бакета)."""
+        marker = f"/storage/v1/object/public/{bucket}/"
+        if not url or marker not in url:
+            return None
+        return url.split(marker, 1)[1].split('?', 1)[0]
@@ -0,0 +1,15 @@
+from app.db import get_db
+
+
+class WorkingHoursRepository:
+    @staticmethod
+    async def list(master_id: int, columns: str = "*"):
+        res = await get_db().table("working_hours").select(columns).eq("master_telegram_id", master_id).execute()
+        return res.data
+
+    @staticmethod
+    async def replace(master_id: int, rows: list):
+        db = get_db()
+        await db.table("working_hours").delete().eq("master_telegram_id", master_id).execute()
+        if rows:
+            await db.table("working_hours").insert(rows).execute()
@@ -0,0 +1,34 @@
+# backend/app/rollup.py
+"""
+Пересчет дневной сводки аналитики (master_daily_stats).
+Обычно сводку поддерживает триггер на appointments; команда нужна для первичного
+заполнения после миграции и для ручной починки:
+
+    python -m app.rollup            # все мастера
+    python -m app.rollup 123456789  # один мастер
+
+Мастера пересчитываются по одному за вызов: каждый вызов — короткая транзакция,
+которая блокирует запись только к этому мастеру.
+"""
+import asyncio
+import sys
+
+from app.db import init_db, close_db
+from app.repositories.analytics import AnalyticsRepository
+from app.repositories.masters import MasterRepository
+
+
+async def rebuild(master_id: int = None):
+    await init_db()
+    try:
+        master_ids = [master_id] if master_id else await MasterRepository.list_ids()
+        rows = 0
+        for tg_id in master_ids:
+            rows += await AnalyticsRepository.rebuild_daily_stats(tg_id)
+        print(f"Rebuilt {rows} daily rows" + (f" for master {master_id}" if master_id else f" for {len(master_ids)} masters"))
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild(int(sys.argv[1]) if len(sys.argv) > 1 else None))
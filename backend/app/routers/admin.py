@@ -1,14 +1,25 @@
 # (c) 2026 Владимир Коваленко. Все права защищены.
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from typing import List
-from datetime import datetime
-from app.utils import send_telegram_message, compress_image
-import pytz
-import uuid
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta
+from app.utils import send_telegram_message, get_timezone
+from app.images import read_upload
+import base64
+import json
+from PIL import Image, UnidentifiedImageError
 
 from app.auth import validate_telegram_data
-from app.db import supabase
-from app.utils import send_telegram_message
+from app.repositories.masters import MasterRepository
+from app.repositories.services import ServiceRepository
+from app.repositories.working_hours import WorkingHoursRepository
+from app.repositories.appointments import AppointmentRepository
+from app.services.schedule_service import ScheduleService
+from app.services.booking_events import booking_changed
+from app.services.photo_service import PhotoService
+from app.services.analytics_service import AnalyticsService
+from app.services.appointment_service import is_slot_conflict
+from app.services.availability_service import parse_date
+from app.schemas.appointment import AppointmentBulkAction
 from app.schemas.master import (
     MasterProfileUpdate, ServiceCreate, ServiceUpdate, WorkingHourItem
 )
@@ -20,17 +31,16 @@ router = APIRouter(prefix="/me", tags=["Admin"])
 async def get_my_profile(user=Depends(validate_telegram_data)):
     tg_id = user['id']
     # Добавляем is_premium в выборку
-    res = supabase.table("masters").select("*, is_premium").eq("telegram_id", tg_id).execute()
-    if not res.data:
+    profile = await MasterRepository.get(tg_id, "*, is_premium")
+    if not profile:
         # Авто-регистрация
         new_user = {
             "telegram_id": tg_id,
             "username": user.get("username"),
             "full_name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()
         }
-        res = supabase.table("masters").insert(new_user).execute()
-        return {"user": user, "profile": res.data[0]}
-    return {"user": user, "profile": res.data[0]}
+        profile = await MasterRepository.create(new_user)
+    return {"user": user, "profile": profile}
 
 
 @router.patch("/profile")
@@ -40,24 +50,37 @@ async def update_profile(data: MasterProfileUpdate, user=Depends(validate_telegr
 
     if 'photos' in update_data:
         if update_data['photos'] and len(update_data['photos']) > 0:
-            update_data['avatar_url'] = update_data['photos'][0]
+            first = update_data['photos'][0]
+            update_data['avatar_url'] = first['url'] if isinstance(first, dict) else first
         else:
             update_data['avatar_url'] = None
 
-    res = supabase.table("masters").update(update_data).eq("telegram_id", tg_id).execute()
-    return res.data
+    previous = await ScheduleService.get_profile(tg_id)
+
+    # Дневная сводка аналитики разложена по локальным дням — таймзона меняется вместе
+    # с пересчетом сводки мастера одной транзакцией; при ошибке профиль не трогаем
+    if 'timezone' in update_data and previous and previous.get('timezone') != update_data['timezone']:
+        try:
+            await MasterRepository.set_timezone(tg_id, update_data['timezone'])
+        except Exception as e:
+            print(f"Timezone change failed for {tg_id}: {e}")
+            raise HTTPException(status_code=500, detail="Не удалось сменить часовой пояс, попробуйте еще раз")
+        AnalyticsService.invalidate(tg_id)
+
+    updated = await MasterRepository.update(tg_id, update_data)
+    ScheduleService.invalidate(tg_id)
+    return updated
 
 
 @router.post("/upload-photo")
 async def upload_photo(file: UploadFile = File(...), user=Depends(validate_telegram_data)):
     # 1. Проверка лимитов
     tg_id = user['id']
-    res = supabase.table("masters").select("photos, is_premium").eq("telegram_id", tg_id).single().execute()
+    master = await MasterRepository.get(tg_id, "photos, is_premium")
     
-    if not res.data:
+    if not master:
         raise HTTPException(status_code=404, detail="Master not found")
         
-    master = res.data
     current_photos = master.get('photos') or []
     is_premium = master.get('is_premium', False)
     
@@ -76,53 +99,40 @@ async def upload_photo(file: UploadFile = File(...), user=Depends(validate_teleg
         )
     # -----------------------
 
-    # 2. Сжатие и Загрузка
+    # 2. Чтение с лимитом размера; варианты 128/384/1024 (JPEG + WebP) готовятся в пуле процессов
+    original_bytes = await read_upload(file)
     try:
-        original_bytes = await file.read()
-        
-        # Сжимаем
-        compressed_bytes = compress_image(original_bytes, max_size=1024, quality=80)
-        
-        file_path = f"{user['id']}/{uuid.uuid4()}.jpg"
-        bucket_name = "avatars"
-
-        supabase.storage.from_(bucket_name).upload(
-            path=file_path,
-            file=compressed_bytes,
-            file_options={"content-type": "image/jpeg"}
-        )
-        
-        public_url = supabase.storage.from_(bucket_name).get_public_url(file_path)
-        return {"url": public_url}
-        
+        photo = await PhotoService.upload(tg_id, original_bytes)
+    except HTTPException:
+        raise
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise HTTPException(status_code=400, detail="Не удалось прочитать изображение")
     except Exception as e:
         print(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail="Failed to upload photo")
 
+    # url — для старых клиентов, photo — манифест вариантов для masters.photos
+    return {"url": photo["url"], "photo": photo}
+
 # --- Services ---
 
 @router.get("/services")
 async def get_services(user=Depends(validate_telegram_data)):
-    res = supabase.table("services") \
-        .select("*") \
-        .eq("master_telegram_id", user['id']) \
-        .eq("is_active", True) \
-        .order("id") \
-        .execute()
-    return res.data
+    # Кабинет читает из базы: кэш мастера локален для процесса, а правка могла прийти на другую реплику
+    services = await ServiceRepository.list_active(user['id'])
+    ScheduleService.store(user['id'], services=services)
+    return services
 
 
 @router.post("/services")
 async def create_service(srv: ServiceCreate, user=Depends(validate_telegram_data)):
     # 1. Получаем статус мастера
-    master_info = supabase.table("masters").select("is_premium").eq("telegram_id", user['id']).single().execute()
-    is_premium = master_info.data.get('is_premium', False)
+    master_info = await MasterRepository.get(user['id'], "is_premium") or {}
+    is_premium = master_info.get('is_premium', False)
 
     # 2. Если НЕ Premium — проверяем количество
     if not is_premium:
-        count_res = supabase.table("services").select("id", count="exact").eq("master_telegram_id", user['id']).eq(
-            "is_active", True).execute()
-        current_count = count_res.count
+        current_count = await ServiceRepository.count_active(user['id'])
 
         if current_count >= 10:
             raise HTTPException(status_code=403,
@@ -132,8 +142,9 @@ async def create_service(srv: ServiceCreate, user=Depends(validate_telegram_data
     data = srv.model_dump()
     data['master_telegram_id'] = user['id']
     data['is_active'] = True
-    res = supabase.table("services").insert(data).execute()
-    return res.data
+    created = await ServiceRepository.create(data)
+    ScheduleService.invalidate(user['id'])
+    return created
 
 
 @router.patch("/services/{service_id}")
@@ -147,24 +158,19 @@ async def update_service(
     if not update_data:
         raise HTTPException(status_code=400, detail="No data provided")
 
-    res = supabase.table("services").update(update_data) \
-        .eq("id", service_id) \
-        .eq("master_telegram_id", user['id']) \
-        .execute()
+    updated = await ServiceRepository.update(service_id, user['id'], update_data)
+    ScheduleService.invalidate(user['id'])
 
-    if not res.data:
+    if not updated:
         raise HTTPException(status_code=404, detail="Service not found or access denied")
 
-    return res.data[0]
+    return updated[0]
 
 
 @router.delete("/services/{sid}")
 async def delete_service(sid: int, user=Depends(validate_telegram_data)):
-    res = supabase.table("services") \
-        .update({"is_active": False}) \
-        .eq("id", sid) \
-        .eq("master_telegram_id", user['id']) \
-        .execute()
+    await ServiceRepository.update(sid, user['id'], {"is_active": False})
+    ScheduleService.invalidate(user['id'])
     return {"status": "archived"}
 
 
@@ -172,15 +178,16 @@ async def delete_service(sid: int, user=Depends(validate_telegram_data)):
 
 @router.get("/working-hours")
 async def get_hours(user=Depends(validate_telegram_data)):
-    res = supabase.table("working_hours").select("*").eq("master_telegram_id", user['id']).execute()
-    return res.data
+    hours = await WorkingHoursRepository.list(user['id'])
+    ScheduleService.store(user['id'], hours=hours)
+    return hours
 
 
 @router.post("/working-hours")
 async def set_hours(hours: List[WorkingHourItem], user=Depends(validate_telegram_data)):
     # 1. Проверяем подписку
-    master_info = supabase.table("masters").select("is_premium").eq("telegram_id", user['id']).single().execute()
-    is_premium = master_info.data.get('is_premium', False)
+    master_info = await MasterRepository.get(user['id'], "is_premium") or {}
+    is_premium = master_info.get('is_premium', False)
 
     data_list = []
     for h in hours:
@@ -195,105 +202,163 @@ async def set_hours(hours: List[WorkingHourItem], user=Depends(validate_telegram
         data_list.append(item)
 
     # Дальше сохранение как обычно...
-    supabase.table("working_hours").delete().eq("master_telegram_id", user['id']).execute()
-    if data_list:
-        supabase.table("working_hours").insert(data_list).execute()
+    await WorkingHoursRepository.replace(user['id'], data_list)
+    ScheduleService.invalidate(user['id'])
     return {"status": "updated"}
 
 
 # --- Appointments ---
 
+def _encode_cursor(row: dict) -> str:
+    raw = json.dumps([row['starts_at'], row['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    # Курсор приходит от клиента: кроме [starts_at: str, id: int] ничего не принимаем
+    if not (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], str) and type(value[1]) is int):
+        raise HTTPException(400, "Invalid cursor")
+    try:
+        return datetime.fromisoformat(value[0].replace('Z', '+00:00')).isoformat(), value[1]
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+
 @router.get("/appointments")
-async def get_my_appointments(user=Depends(validate_telegram_data)):
-    res = supabase.table("appointments") \
-        .select("*, services(name)") \
-        .eq("master_telegram_id", user['id']) \
-        .order("starts_at", desc=False) \
-        .execute()
-    return res.data
+async def get_my_appointments(
+    status: Optional[Literal['pending', 'confirmed', 'completed', 'cancelled']] = None,
+    date_from: Optional[str] = Query(None, alias="from"),  # локальные даты мастера, включительно
+    date_to: Optional[str] = Query(None, alias="to"),
+    order: Literal['asc', 'desc'] = 'asc',
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user=Depends(validate_telegram_data),
+):
+    """Страница записей мастера: {items, next_cursor}. Для следующей страницы передайте next_cursor."""
+    tg_id = user['id']
+    start_iso = end_iso = None
+    if date_from or date_to:
+        profile = await ScheduleService.get_profile(tg_id)
+        tz = get_timezone(profile.get('timezone') if profile else None)
+        if date_from:
+            start_iso = tz.localize(parse_date(date_from, "from")).isoformat()
+        if date_to:
+            end_iso = tz.localize(parse_date(date_to, "to") + timedelta(days=1)).isoformat()
+
+    rows = await AppointmentRepository.list_for_master(
+        tg_id, limit,
+        after=_decode_cursor(cursor) if cursor else None,
+        desc=order == 'desc',
+        status=status,
+        start_iso=start_iso,
+        end_iso=end_iso,
+    )
+    items = rows[:limit]
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(items[-1]) if len(rows) > limit else None,
+    }
+
+
+# Действие в кабинете -> новый статус записи
+STATUS_ACTIONS = {"confirm": "confirmed", "complete": "completed", "cancel": "cancelled"}
+
+
+def _client_notice(appt: dict, master_tz) -> Optional[str]:
+    """Сообщение клиенту о смене статуса записи (о завершении не пишем)."""
+    service_name = appt.get('service_name') or "Груминг"
+    pet_name = appt.get('pet_name', 'Не указано')
+    try:
+        utc_dt = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00'))
+        date_str = utc_dt.astimezone(master_tz).strftime('%d.%m.%Y в %H:%M')
+    except (KeyError, ValueError, AttributeError):
+        date_str = str(appt.get('starts_at', ''))
+
+    if appt['status'] == 'confirmed':
+        return (
+            f"✅ <b>Ваша запись подтверждена!</b>\n\n"
+            f"🐶 Питомец: <b>{pet_name}</b>\n"
+            f"✂️ Услуга: {service_name}\n"
+            f"🗓 Время: {date_str}\n\n"
+            f"📍 Ждем вас!"
+        )
+    if appt['status'] == 'cancelled':
+        return (
+            f"🚫 <b>Запись отменена</b>\n\n"
+            f"К сожалению, мастер отменил вашу запись.\n\n"
+            f"🐶 Питомец: <b>{pet_name}</b>\n"
+            f"✂️ Услуга: {service_name}\n"
+            f"🗓 Время: {date_str}\n\n"
+            f"Пожалуйста, выберите другое удобное время."
+        )
+    return None
 
 
-@router.post("/appointments/{aid}/confirm")
-async def confirm_appointment(aid: int, user=Depends(validate_telegram_data)):
-    res = supabase.table("appointments").update({"status": "confirmed"}) \
-        .eq("id", aid).eq("master_telegram_id", user['id']).execute()
+async def _apply_status(master_id: int, ids: list, status: str) -> list:
+    """
+    Одна пачка: UPDATE ... RETURNING с названием услуги, таймзона мастера из кэша один раз,
+    уведомления клиентам уходят в очередь отправки, не дожидаясь Telegram.
+    """
+    try:
+        updated = await AppointmentRepository.set_status(ids, master_id, status)
+    except Exception as e:
+        # Конфликт по времени записи (idx_unique_slot / BK003)
+        if is_slot_conflict(e):
+            raise HTTPException(status_code=409, detail="Время записи уже занято другой записью")
+        print(f"Status update error for {master_id}: {e}")
+        raise HTTPException(status_code=500, detail="Не удалось изменить статус записей")
+    if not updated:
+        return updated
 
-    if res.data:
-        try:
-            master_res = supabase.table("masters").select("timezone").eq("telegram_id", user['id']).single().execute()
-            tz_name = master_res.data.get('timezone', 'Asia/Almaty') if master_res.data else 'Asia/Almaty'
-
-            details = supabase.table("appointments").select("*, services(name)").eq("id", aid).single().execute()
-            appt = details.data
-
-            if appt.get('client_telegram_id'):
-                service_name = appt.get('services', {}).get('name', 'Груминг') if appt.get('services') else "Груминг"
-                pet_name = appt.get('pet_name', 'Не указано')
-
-                try:
-                    utc_dt = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00'))
-                    master_tz = pytz.timezone(tz_name)
-                    local_dt = utc_dt.astimezone(master_tz)
-                    date_str = local_dt.strftime('%d.%m.%Y в %H:%M')
-                except:
-                    date_str = str(appt['starts_at'])
-
-                msg = (
-                    f"✅ <b>Ваша запись подтверждена!</b>\n\n"
-                    f"🐶 Питомец: <b>{pet_name}</b>\n"
-                    f"✂️ Услуга: {service_name}\n"
-                    f"🗓 Время: {date_str}\n\n"
-                    f"📍 Ждем вас!"
-                )
+    for appt in updated:
+        await booking_changed(appt)
+
+    try:
+        master = await ScheduleService.get_profile(master_id) or {}
+        master_tz = get_timezone(master.get('timezone'))
+        for appt in updated:
+            msg = _client_notice(appt, master_tz)
+            if msg and appt.get('client_telegram_id'):
                 send_telegram_message(appt['client_telegram_id'], msg)
-        except Exception as e:
-            print(f"Notify error: {e}")
-    return res.data
+    except Exception as e:
+        print(f"Notify error: {e}")
+    return updated
+
+
+@router.post("/appointments/bulk/{action}")
+async def bulk_update_appointments(
+    action: Literal['confirm', 'complete', 'cancel'],
+    data: AppointmentBulkAction,
+    user=Depends(validate_telegram_data),
+):
+    """
+    Подтверждение/завершение/отмена до 200 записей за раз. Возвращает измененные записи
+    и пропущенные id: чужие, несуществующие и те, чей статус не допускает действие
+    (например, подтверждение отмененной записи).
+    """
+    ids = list(dict.fromkeys(data.ids))
+    updated = await _apply_status(user['id'], ids, STATUS_ACTIONS[action])
+    changed = {a['id'] for a in updated}
+    return {"updated": updated, "skipped": [i for i in ids if i not in changed]}
+
+
+@router.post("/appointments/{aid}/confirm")
+async def confirm_appointment(aid: int, user=Depends(validate_telegram_data)):
+    return await _apply_status(user['id'], [aid], "confirmed")
 
 
 # --- НОВОЕ: Завершение записи ---
 @router.post("/appointments/{aid}/complete")
 async def complete_appointment(aid: int, user=Depends(validate_telegram_data)):
-    res = supabase.table("appointments").update({"status": "completed"}) \
-        .eq("id", aid).eq("master_telegram_id", user['id']).execute()
-    return res.data
+    return await _apply_status(user['id'], [aid], "completed")
 # --------------------------------
 
 
 @router.post("/appointments/{aid}/cancel")
 async def cancel_appointment(aid: int, user=Depends(validate_telegram_data)):
-    res = supabase.table("appointments").update({"status": "cancelled"}) \
-        .eq("id", aid).eq("master_telegram_id", user['id']).execute()
-
-    if res.data:
-        try:
-            master_res = supabase.table("masters").select("timezone").eq("telegram_id", user['id']).single().execute()
-            tz_name = master_res.data.get('timezone', 'Asia/Almaty') if master_res.data else 'Asia/Almaty'
-
-            details = supabase.table("appointments").select("*, services(name)").eq("id", aid).single().execute()
-            appt = details.data
-
-            if appt and appt.get('client_telegram_id'):
-                service_name = appt.get('services', {}).get('name', 'Груминг') if appt.get('services') else "Груминг"
-                pet_name = appt.get('pet_name', 'Не указано')
-
-                try:
-                    utc_dt = datetime.fromisoformat(appt['starts_at'].replace('Z', '+00:00'))
-                    master_tz = pytz.timezone(tz_name)
-                    local_dt = utc_dt.astimezone(master_tz)
-                    date_str = local_dt.strftime('%d.%m.%Y в %H:%M')
-                except:
-                    date_str = str(appt.get('starts_at', ''))
-
-                msg = (
-                    f"🚫 <b>Запись отменена</b>\n\n"
-                    f"К сожалению, мастер отменил вашу запись.\n\n"
-                    f"🐶 Питомец: <b>{pet_name}</b>\n"
-                    f"✂️ Услуга: {service_name}\n"
-                    f"🗓 Время: {date_str}\n\n"
-                    f"Пожалуйста, выберите другое удобное время."
-                )
-                send_telegram_message(appt['client_telegram_id'], msg)
-        except Exception:
-            pass
-    return res.data
+    return await _apply_status(user['id'], [aid], "cancelled")
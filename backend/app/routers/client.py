@@ -1,161 +1,162 @@
 # (c) 2026 Владимир Коваленко. Все права защищены.
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
 import pytz
 
-from app.auth import validate_telegram_data
-from app.db import supabase
-from app.utils import send_telegram_message
-from app.schemas.appointment import AppointmentCreate
+from app.auth import validate_telegram_data, optional_telegram_user
+from app.utils import send_telegram_message, get_timezone
+from app.http_cache import cached_json
+from app.config import SSE_HEARTBEAT_SEC
+from app.schemas.appointment import AppointmentCreate, SlotHoldCreate
 from app.services.appointment_service import AppointmentService
+from app.services.availability_service import AvailabilityService, parse_date
+from app.services.availability_events import availability_broker, sse_event
+from app.services.schedule_service import ScheduleService
+from app.services.slot_holds import slot_holds
 
 router = APIRouter(tags=["Client"])
 
 
 @router.get("/masters/{master_id}")
-async def get_master_public_profile(master_id: int):
+async def get_master_public_profile(master_id: int, request: Request):
     # Добавляем is_premium в выборку
-    res = supabase.table("masters") \
-        .select("salon_name, description, avatar_url, address, phone, timezone, photos, is_premium") \
-        .eq("telegram_id", master_id) \
-        .execute()
-    if not res.data:
+    profile = await ScheduleService.get_profile(master_id)
+    if not profile:
         raise HTTPException(status_code=404, detail="Master not found")
-    return res.data[0]
+    return cached_json(request, profile, ScheduleService.etag('profile', master_id, profile))
 
 
 @router.get("/masters/{master_id}/services")
-async def get_master_services(master_id: int):
-    res = supabase.table("services") \
-        .select("*") \
-        .eq("master_telegram_id", master_id) \
-        .eq("is_active", True) \
-        .execute()
-    return res.data
+async def get_master_services(master_id: int, request: Request):
+    services = await ScheduleService.get_services(master_id)
+    return cached_json(request, services, ScheduleService.etag('services', master_id, services))
 
 
 @router.get("/masters/{master_id}/schedule")
-async def get_master_schedule(master_id: int):
-    res = supabase.table("working_hours").select("day_of_week, start_time, end_time").eq("master_telegram_id",
-                                                                                         master_id).execute()
-    return res.data
+async def get_master_schedule(master_id: int, request: Request):
+    hours = await ScheduleService.get_hours(master_id)
+    schedule = _public_schedule(hours)
+    return cached_json(request, schedule, ScheduleService.etag('schedule', master_id, hours, schedule))
 
 
-# backend/app/routers/client.py
+def _public_schedule(hours: list) -> list:
+    return [
+        {"day_of_week": h['day_of_week'], "start_time": h['start_time'], "end_time": h['end_time']}
+        for h in hours
+    ]
 
-# ... (импорты остаются те же)
 
-@router.get("/masters/{master_id}/availability")
-async def get_master_availability(master_id: int, service_id: int, date: str):  # [ИЗМЕНЕНО] Добавили service_id
-    # 1. Получаем настройки мастера
-    master_res = supabase.table("masters").select("timezone, is_premium").eq("telegram_id",
-                                                                             master_id).single().execute()
-    if not master_res.data:
-        raise HTTPException(404, "Master not found")
-
-    master_data = master_res.data
-    tz_name = master_data.get('timezone', 'Asia/Almaty')
-    is_premium = master_data.get('is_premium', False)
-
-    # [НОВОЕ] 1.1 Получаем длительность запрашиваемой услуги
-    srv_res = supabase.table("services").select("duration_min").eq("id", service_id).single().execute()
-    if not srv_res.data:
-        raise HTTPException(404, "Service not found")
-    requested_duration = srv_res.data.get('duration_min', 60)
+@router.get("/masters/{master_id}/bootstrap")
+async def get_master_bootstrap(
+        master_id: int,
+        service_id: Optional[int] = None,
+        days: int = Query(7, ge=1, le=AvailabilityService.MAX_RANGE_DAYS),
+):
+    """
+    Все для первого экрана Mini App одним ответом: профиль, услуги, график и свободные слоты
+    на days дней вперед (с сегодняшнего дня мастера) для service_id или первой активной услуги.
+    Если service_id не среди активных услуг, в ответе service_id = null и пустые слоты.
+    """
+    profile, services, hours = await asyncio.gather(
+        ScheduleService.get_profile(master_id),
+        ScheduleService.get_services(master_id),
+        ScheduleService.get_hours(master_id),
+    )
+    if not profile:
+        raise HTTPException(status_code=404, detail="Master not found")
 
-    try:
-        master_tz = pytz.timezone(tz_name)
-    except pytz.UnknownTimeZoneError:
-        master_tz = pytz.timezone('Asia/Almaty')
+    if service_id is None and services:
+        service_id = services[0]['id']
+    # Услуга из ссылки могла быть архивирована или удалена: отдаем остальное без слотов
+    if not any(srv['id'] == service_id for srv in services):
+        service_id = None
 
-    try:
-        naive_date = datetime.strptime(date, "%Y-%m-%d")
-        target_date = master_tz.localize(naive_date)
-    except ValueError:
-        raise HTTPException(400, "Invalid date format YYYY-MM-DD")
-
-    # 2. Генерируем сетку
-    weekday_iso = target_date.isoweekday()
-    wh_res = supabase.table("working_hours") \
-        .select("*") \
-        .eq("master_telegram_id", master_id) \
-        .eq("day_of_week", weekday_iso) \
-        .execute()
-
-    if not wh_res.data:
-        return []
-
-    schedule = wh_res.data[0]
-
-    db_slot = schedule.get('slot_minutes', 30)
-    slot_min = 30 if not is_premium else db_slot
-
-    start_parts = list(map(int, schedule['start_time'].split(':')))
-    end_parts = list(map(int, schedule['end_time'].split(':')))
-
-    work_start = target_date.replace(hour=start_parts[0], minute=start_parts[1], second=0)
-    work_end = target_date.replace(hour=end_parts[0], minute=end_parts[1], second=0)
-
-    potential_slots = []
-    current = work_start
-    while current < work_end:
-        potential_slots.append(current)
-        current += timedelta(minutes=slot_min)
-
-    # 3. Получаем занятые интервалы
-    day_start_utc = target_date.astimezone(pytz.utc)
-    day_end_utc = (target_date + timedelta(days=1)).astimezone(pytz.utc)
-
-    busy_res = supabase.table("appointments") \
-        .select("starts_at, services(duration_min)") \
-        .eq("master_telegram_id", master_id) \
-        .neq("status", "cancelled") \
-        .gte("starts_at", day_start_utc.isoformat()) \
-        .lt("starts_at", day_end_utc.isoformat()) \
-        .execute()
-
-    busy_intervals = []
-    for b in busy_res.data:
-        t_str = b['starts_at'].replace('Z', '+00:00')
+    # Профиль, услуги и часы уже в кэше — из базы читаются только записи за эти дни
+    availability = {}
+    if service_id is not None:
+        today = datetime.now(get_timezone(profile.get('timezone'))).date()
         try:
-            appt_start = datetime.fromisoformat(t_str).astimezone(master_tz)
-            duration = 60
-            if b.get('services') and b['services'].get('duration_min'):
-                duration = b['services']['duration_min']
-
-            appt_end = appt_start + timedelta(minutes=duration)
-            busy_intervals.append((appt_start, appt_end))
-        except ValueError:
-            pass
+            availability = await AvailabilityService.get_range(
+                master_id, service_id, today.isoformat(), (today + timedelta(days=days - 1)).isoformat()
+            )
+        except HTTPException as e:
+            # Кэш мастера обновился между запросами и услуги уже нет
+            if e.status_code != 404:
+                raise
+            service_id = None
+
+    return {
+        "profile": profile,
+        "services": services,
+        "schedule": _public_schedule(hours),
+        "service_id": service_id,
+        "availability": availability,
+    }
+
+
+@router.get("/masters/{master_id}/availability/range")
+async def get_master_availability_range(
+        master_id: int,
+        service_id: int,
+        date_from: str = Query(..., alias="from"),
+        date_to: str = Query(..., alias="to"),
+        counts_only: bool = False,
+):
+    return await AvailabilityService.get_range(master_id, service_id, date_from, date_to, counts_only)
+
+
+@router.get("/masters/{master_id}/availability/stream")
+async def stream_master_availability(master_id: int, date: str):
+    """
+    SSE-поток изменений занятости мастера на дату (YYYY-MM-DD, локальная дата мастера):
+    taken/released с интервалом [starts_at, ends_at) и resync — «перезапросите слоты».
+    Раз в SSE_HEARTBEAT_SEC шлется комментарий, чтобы прокси не закрывали соединение.
+    Число потоков ограничено на тему (мастер, день) и на весь процесс.
+    """
+    day = parse_date(date).date().isoformat()
+    queue = availability_broker.subscribe(master_id, day)
+    if queue is None:
+        raise HTTPException(503, "Too many subscribers")
+
+    async def events():
+        try:
+            yield "retry: 5000\nevent: ready\ndata: {}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_event(event)
+        finally:
+            availability_broker.unsubscribe(master_id, day, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
-    # 4. Фильтруем слоты (С учетом "хвоста" новой услуги)
-    now_in_master_tz = datetime.now(master_tz)
-    free_slots = []
 
-    for slot in potential_slots:
-        # Пропускаем прошлое
-        if slot <= now_in_master_tz:
-            continue
+@router.get("/masters/{master_id}/availability")
+async def get_master_availability(master_id: int, service_id: int, date: str, user=Depends(optional_telegram_user)):
+    # Свою бронь клиент видит свободной, чужие — нет
+    return await AvailabilityService.get_day(master_id, service_id, date, user['id'] if user else None)
 
-        # Вычисляем, когда закончится НОВАЯ услуга, если начать её в этот слот
-        requested_end = slot + timedelta(minutes=requested_duration)
 
-        # Если услуга вылезает за рабочий день — скрываем слот
-        if requested_end > work_end:
-            continue
+@router.post("/masters/{master_id}/holds")
+async def hold_slot(master_id: int, data: SlotHoldCreate, user=Depends(validate_telegram_data)):
+    """Бронь слота на время заполнения формы; POST /appointments на это время ее погашает."""
+    return await AvailabilityService.hold(master_id, data.service_id, data.starts_at, user['id'])
 
-        # Проверка пересечений
-        is_overlap = False
-        for (busy_start, busy_end) in busy_intervals:
-            # Формула пересечения: (StartA < EndB) и (StartB < EndA)
-            if slot < busy_end and busy_start < requested_end:
-                is_overlap = True
-                break
 
-        if not is_overlap:
-            free_slots.append(slot.isoformat())
+@router.delete("/masters/{master_id}/holds")
+async def release_slot_hold(master_id: int, user=Depends(validate_telegram_data)):
+    slot_holds.release(master_id, user['id'])
+    return {"status": "ok"}
 
-    return free_slots
 
 @router.post("/appointments")
 async def create_appointment_public(
@@ -167,24 +168,14 @@ async def create_appointment_public(
         client_id=user['id'],
         client_username=user.get('username')
     )
+    # Повтор запроса (тот же idempotency_key): мастер уже уведомлен
+    if new_appt.get('replayed'):
+        return new_appt
 
     try:
-        service_name = "Услуга"
-        try:
-            srv_res = supabase.table("services").select("name").eq("id", new_appt['service_id']).single().execute()
-            if srv_res.data:
-                service_name = srv_res.data.get('name', 'Услуга')
-        except:
-            pass
-
-        tz_name = 'Asia/Almaty'
-        try:
-            master_res = supabase.table("masters").select("timezone").eq("telegram_id", new_appt[
-                'master_telegram_id']).single().execute()
-            if master_res.data and master_res.data.get('timezone'):
-                tz_name = master_res.data['timezone']
-        except:
-            pass
+        # Название услуги и таймзону мастера create_booking возвращает вместе с записью
+        service_name = new_appt.get('service_name') or "Услуга"
+        tz_name = new_appt.get('master_timezone') or 'Asia/Almaty'
 
         try:
             utc_dt = datetime.fromisoformat(new_appt['starts_at'].replace('Z', '+00:00'))
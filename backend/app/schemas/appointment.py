@@ -1,5 +1,5 @@
-from pydantic import BaseModel, field_validator
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 from datetime import datetime
 import re
 
@@ -23,3 +23,12 @@ class AppointmentCreate(BaseModel):
         if not re.match(r'^[\d\+\(\)\-\s]{10,20}$', v):
             raise ValueError('Некорректный формат телефона')
         return v
+
+
+class SlotHoldCreate(BaseModel):
+    service_id: int
+    starts_at: datetime
+
+
+class AppointmentBulkAction(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=200)
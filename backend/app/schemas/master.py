@@ -1,5 +1,19 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Union
+
+# --- Фото мастера ---
+class PhotoVariant(BaseModel):
+    w: int
+    h: int
+    jpeg: str
+    webp: Optional[str] = None
+
+class PhotoManifest(BaseModel):
+    id: str
+    url: str  # самый крупный JPEG — для старых клиентов и avatar_url
+    width: int
+    height: int
+    variants: List[PhotoVariant]  # по возрастанию ширины
 
 # --- Профиль Мастера ---
 class MasterProfileUpdate(BaseModel):
@@ -8,7 +22,7 @@ class MasterProfileUpdate(BaseModel):
     phone: Optional[str] = None
     description: Optional[str] = None
     avatar_url: Optional[str] = None
-    photos: Optional[List[str]] = None
+    photos: Optional[List[Union[str, PhotoManifest]]] = None  # старые фото — просто URL
     timezone: Optional[str] = None
 
 # --- Услуги ---
@@ -0,0 +1,151 @@
+from datetime import date, datetime, timedelta
+
+from app.cache import TTLCache
+from app.config import ANALYTICS_CACHE_TTL, ANALYTICS_CACHE_SIZE
+from app.repositories.analytics import AnalyticsRepository
+from app.utils import get_timezone
+
+# Готовые ответы аналитики: (master_telegram_id, поколение, вид, параметры запроса) -> ответ.
+# Любое изменение записи мастера увеличивает его поколение (см. booking_changed): прежние ответы
+# больше не читаются и вытесняются по LRU. TTL ограничивает устаревание из-за записей,
+# измененных на других репликах.
+analytics_cache = TTLCache(maxsize=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL)
+_generations: dict[int, int] = {}
+
+
+def local_today(timezone_name: str = None) -> date:
+    """Сегодняшняя дата в таймзоне мастера (в тех же днях хранится master_daily_stats)."""
+    return datetime.now(get_timezone(timezone_name)).date()
+
+
+def period_starts(date_from: date, date_to: date, granularity: str) -> list:
+    """Начала всех периодов, пересекающих [date_from, date_to], как их считает date_trunc."""
+    if granularity == 'week':
+        current = date_from - timedelta(days=date_from.weekday())
+    elif granularity == 'month':
+        current = date_from.replace(day=1)
+    else:
+        current = date_from
+
+    starts = []
+    while current <= date_to:
+        starts.append(current)
+        if granularity == 'week':
+            current += timedelta(days=7)
+        elif granularity == 'month':
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            current += timedelta(days=1)
+    return starts
+
+
+class AnalyticsService:
+    @staticmethod
+    async def _cached(master_id: int, key: tuple, loader):
+        generation = _generations.get(master_id, 0)
+        key = (master_id, generation) + key
+        result = analytics_cache.get(key)
+        if result is not None:
+            return result
+
+        result = await loader()
+        # Пока считали, записи мастера могли измениться — тогда результат не кэшируем
+        if _generations.get(master_id, 0) == generation:
+            analytics_cache.set(key, result)
+        return result
+
+    @staticmethod
+    def invalidate(master_id: int):
+        _generations[master_id] = _generations.get(master_id, 0) + 1
+
+    @staticmethod
+    async def dashboard(master_id: int, timezone_name: str, days: int) -> dict:
+        today = local_today(timezone_name)
+        return await AnalyticsService._cached(
+            master_id, ('dashboard', days, today),
+            lambda: AnalyticsService._build_dashboard(master_id, today, days),
+        )
+
+    @staticmethod
+    async def series(master_id: int, date_from: date, date_to: date, granularity: str) -> dict:
+        return await AnalyticsService._cached(
+            master_id, ('series', date_from, date_to, granularity),
+            lambda: AnalyticsService._build_series(master_id, date_from, date_to, granularity),
+        )
+
+    @staticmethod
+    async def _build_dashboard(master_id: int, today: date, days: int) -> dict:
+        # Все агрегаты читаются из master_daily_stats: не больше строки на день периода
+        week_start = today - timedelta(days=6)
+        stats = await AnalyticsRepository.dashboard(
+            master_id,
+            (today - timedelta(days=days)).isoformat(),
+            week_start.isoformat(),
+            today.isoformat(),
+        )
+
+        # KPIs
+        total_completed = stats.get('completed', 0)
+        revenue = stats.get('revenue', 0)
+        avg_check = round(revenue / total_completed) if total_completed else 0
+
+        # Популярные услуги
+        top_services = [{"name": s['name'], "count": s['count']} for s in stats.get('top_services', [])]
+
+        # Статусы (для Pie Chart)
+        statuses = {
+            "completed": total_completed,
+            "cancelled": stats.get('cancelled', 0),
+            "pending": stats.get('pending', 0),
+        }
+
+        # Динамика по дням (для Bar Chart) - последние 7 дней
+        daily_counts = stats.get('daily', {})
+        daily_stats = []
+        for i in range(6, -1, -1):
+            d = today - timedelta(days=i)
+            daily_stats.append({
+                "day": d.strftime("%d %b"),  # 21 Окт
+                "value": daily_counts.get(d.isoformat(), 0),
+                "is_today": i == 0
+            })
+
+        return {
+            "is_premium": True,
+            "kpi": {
+                "revenue": revenue,
+                "avg_check": avg_check,
+                "total_completed": total_completed
+            },
+            "top_services": top_services,
+            "status_distribution": statuses,
+            "daily_dynamics": daily_stats
+        }
+
+    @staticmethod
+    async def _build_series(master_id: int, date_from: date, date_to: date, granularity: str) -> dict:
+        stats = await AnalyticsRepository.series(
+            master_id, date_from.isoformat(), date_to.isoformat(), granularity
+        )
+        totals = stats.get('totals') or {}
+        completed = totals.get('completed', 0)
+        totals['avg_check'] = round(totals.get('revenue', 0) / completed) if completed else 0
+
+        # Пустые периоды база не возвращает — дополняем нулями, чтобы график был непрерывным
+        buckets = {b['period']: b for b in stats.get('buckets', [])}
+        series = []
+        for start in period_starts(date_from, date_to, granularity):
+            b = buckets.get(start.isoformat(), {})
+            row = {k: b.get(k, 0) for k in ('pending', 'confirmed', 'completed', 'cancelled', 'revenue')}
+            row['total'] = row['pending'] + row['confirmed'] + row['completed'] + row['cancelled']
+            series.append({"period": start.isoformat(), **row})
+
+        return {
+            "is_premium": True,
+            "from": date_from.isoformat(),
+            "to": date_to.isoformat(),
+            "granularity": granularity,
+            "totals": totals,
+            "top_services": stats.get('top_services', []),
+            "series": series,
+        }
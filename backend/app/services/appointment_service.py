@@ -1,12 +1,60 @@
 from fastapi import HTTPException
-from app.db import supabase
+from app.cache import TTLCache
+from app.config import IDEMPOTENCY_CACHE_TTL, IDEMPOTENCY_CACHE_SIZE
+from app.repositories.appointments import AppointmentRepository
+from app.services.schedule_service import ScheduleService
+from app.services.booking_events import booking_changed
+from app.services.occupancy import DEFAULT_DURATION
+from app.services.slot_holds import slot_holds
 from app.schemas.appointment import AppointmentCreate
+import asyncio
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+# (client_telegram_id, idempotency_key) -> созданная запись: повтор отдается без запроса в базу.
+# После вытеснения/рестарта и на других репликах повтор распознает create_booking.
+recent_bookings = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_CACHE_TTL)
+
+# Те же ключи, пока первый запрос еще выполняется: параллельный дубль ждет его результат
+_in_flight: dict[tuple, asyncio.Task] = {}
+
+
+def is_slot_conflict(e: Exception) -> bool:
+    """Ошибка базы «время уже занято»: пересечение в create_booking (BK003) или idx_unique_slot (23505)."""
+    code = getattr(e, 'code', None) or ''
+    return code in ('BK003', '23505') or "duplicate key" in str(e).lower()
+
 
 class AppointmentService:
     @staticmethod
     async def create(data: AppointmentCreate, client_id: int, client_username: str = None):
+        """
+        Создает запись. Повтор запроса с тем же idempotency_key возвращает исходную запись
+        с replayed=True — без проверок, повторной вставки и уведомления мастеру.
+        """
+        if not data.idempotency_key:
+            return await AppointmentService._create(data, client_id, client_username)
+
+        key = (client_id, data.idempotency_key)
+        created = recent_bookings.get(key)
+        if created is not None:
+            return {**created, "replayed": True}
+
+        task = _in_flight.get(key)
+        if task is not None:
+            return {**await asyncio.shield(task), "replayed": True}
+
+        task = asyncio.ensure_future(AppointmentService._create(data, client_id, client_username))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+        # shield: если первый клиент отключится, дубли все равно дождутся результата.
+        # Ошибка (HTTPException) уходит и дублям; кэшируется только созданная запись
+        created = await asyncio.shield(task)
+        recent_bookings.set(key, {k: v for k, v in created.items() if k != 'replayed'})
+        return created
+
+    @staticmethod
+    async def _create(data: AppointmentCreate, client_id: int, client_username: str = None):
         """
         Создает запись с проверками безопасности и целостности данных.
         """
@@ -35,28 +83,43 @@ class AppointmentService:
             "pet_breed": appt_dict.get('pet_breed'),
             "comment": appt_dict.get('comment'),
             "starts_at": appt_dict['starts_at'].isoformat(),
-            "status": "pending",
             "idempotency_key": appt_dict.get('idempotency_key') or str(uuid.uuid4())
         }
 
-        # 3. Проверяем, что услуга принадлежит мастеру
-        service_check = supabase.table("services").select("id") \
-            .eq("id", insert_data['service_id']) \
-            .eq("master_telegram_id", insert_data['master_telegram_id']) \
-            .execute()
-
-        if not service_check.data:
-            raise HTTPException(status_code=400, detail="Услуга не найдена или не принадлежит этому мастеру")
+        # 3. Время держит бронь другого клиента — отвечаем 409 без запроса в базу.
+        # Длительность нужна только если у мастера есть брони (услуга берется из кэша мастера)
+        master_id = insert_data['master_telegram_id']
+        if slot_holds.has_holds(master_id):
+            service = await ScheduleService.get_service(master_id, insert_data['service_id']) or {}
+            booking_end = booking_time + timedelta(minutes=service.get('duration_min') or DEFAULT_DURATION)
+            if slot_holds.conflict(master_id, booking_time, booking_end, client_id):
+                raise HTTPException(status_code=409, detail="Извините, это время уже занято")
 
-        # 4. Вставка в БД с обработкой дублей
+        # 4. Проверки услуги, рабочих часов, пересечений и вставка — один RPC (create_booking)
         try:
-            res = supabase.table("appointments").insert(insert_data).execute()
-            if res.data:
-                return res.data[0]
+            created = await AppointmentRepository.create(insert_data)
         except Exception as e:
-            error_str = str(e).lower()
-            if "duplicate key" in error_str or "23505" in error_str:
+            code = getattr(e, 'code', None) or ''
+            if code == 'BK001':
+                raise HTTPException(status_code=400, detail="Услуга не найдена или не принадлежит этому мастеру")
+            if code == 'BK002':
+                raise HTTPException(status_code=400, detail="Это время вне графика работы мастера")
+            if is_slot_conflict(e):
                 raise HTTPException(status_code=409, detail="Извините, это время уже занято")
-            
+
             print(f"Database Error: {e}")
             raise HTTPException(status_code=500, detail="Ошибка сохранения записи")
+
+        # RPC отработал, но записи не вернул — для клиента это та же ошибка сохранения
+        if not created:
+            print(f"create_booking returned no row for client {client_id}")
+            raise HTTPException(status_code=500, detail="Ошибка сохранения записи")
+
+        # Повтор, распознанный базой (ключ уже есть в appointments): ничего не пересчитываем
+        if created.get('replayed'):
+            return created
+
+        # Бронь клиента погашена записью
+        slot_holds.consume(insert_data['master_telegram_id'], client_id)
+        await booking_changed(created)
+        return created
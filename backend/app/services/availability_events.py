@@ -0,0 +1,108 @@
+import asyncio
+import json
+from datetime import timedelta
+
+from app.config import SSE_MAX_SUBSCRIBERS, SSE_MAX_PER_TOPIC, SSE_QUEUE_SIZE
+from app.services.occupancy import DEFAULT_DURATION, parse_start
+from app.services.schedule_service import ScheduleService
+from app.utils import get_timezone
+
+RESYNC = {"type": "resync"}
+
+
+class AvailabilityBroker:
+    """
+    In-process pub/sub изменений занятости: тема — (master_id, локальная дата YYYY-MM-DD).
+    У каждого подписчика своя ограниченная очередь; если клиент не успевает читать,
+    очередь сбрасывается и он получает resync (перезапросить слоты целиком).
+    Поток открыт без авторизации, поэтому кроме общего лимита есть лимит на тему:
+    один мастер/день не выбирает весь пул. Лимита на IP нет — запросы браузеров приходят
+    через прокси фронтенда, и все клиенты выглядят для бэкенда одним адресом.
+    События приходят только от записей, измененных на этой реплике.
+    """
+
+    def __init__(self, max_subscribers: int = SSE_MAX_SUBSCRIBERS, queue_size: int = SSE_QUEUE_SIZE,
+                 max_per_topic: int = SSE_MAX_PER_TOPIC):
+        self.max_subscribers = max_subscribers
+        self.max_per_topic = max_per_topic
+        self.queue_size = queue_size
+        self._topics: dict[tuple, set[asyncio.Queue]] = {}
+        self._count = 0
+
+        # Метрики
+        self.published = 0
+        self.resyncs = 0
+        self.rejected = 0
+
+    def subscribe(self, master_id: int, date: str):
+        """Очередь событий темы или None, если достигнут лимит: общий или на тему."""
+        if (self._count >= self.max_subscribers
+                or len(self._topics.get((master_id, date), ())) >= self.max_per_topic):
+            self.rejected += 1
+            return None
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._topics.setdefault((master_id, date), set()).add(queue)
+        self._count += 1
+        return queue
+
+    def unsubscribe(self, master_id: int, date: str, queue: asyncio.Queue):
+        subscribers = self._topics.get((master_id, date))
+        if not subscribers or queue not in subscribers:
+            return
+        subscribers.discard(queue)
+        self._count -= 1
+        if not subscribers:
+            del self._topics[(master_id, date)]
+
+    def has_subscribers(self, master_id: int, date: str) -> bool:
+        return (master_id, date) in self._topics
+
+    def publish(self, master_id: int, date: str, event: dict):
+        for queue in self._topics.get((master_id, date), ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+                self.resyncs += 1
+        self.published += 1
+
+    async def publish_change(self, appt: dict):
+        """
+        Дельта занятости по измененной записи: новая запись занимает интервал (taken),
+        отмена освобождает (released). Подтверждение/завершение занятость не меняют.
+        """
+        status = appt.get('status') or 'pending'
+        if status not in ('pending', 'cancelled'):
+            return
+        master_id = appt.get('master_telegram_id')
+        profile = await ScheduleService.get_profile(master_id) or {}
+        start = parse_start(appt.get('starts_at'), get_timezone(profile.get('timezone')))
+        if start is None or not self.has_subscribers(master_id, start.date().isoformat()):
+            return
+
+        service = await ScheduleService.get_service(master_id, appt.get('service_id')) or {}
+        duration = service.get('duration_min') or DEFAULT_DURATION
+        self.publish(master_id, start.date().isoformat(), {
+            "type": "released" if status == 'cancelled' else "taken",
+            "appointment_id": appt.get('id'),
+            "starts_at": start.isoformat(),
+            "ends_at": (start + timedelta(minutes=duration)).isoformat(),
+        })
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": self._count,
+            "topics": len(self._topics),
+            "published": self.published,
+            "resyncs": self.resyncs,
+            "rejected": self.rejected,
+        }
+
+
+def sse_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+availability_broker = AvailabilityBroker()
@@ -0,0 +1,187 @@
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+import pytz
+
+from app.repositories.availability import AvailabilityRepository
+from app.repositories.appointments import AppointmentRepository
+from app.services.occupancy import OccupancyService, DayOccupancy, DEFAULT_DURATION
+from app.services.schedule_service import ScheduleService
+from app.services.slot_holds import slot_holds
+from app.utils import get_timezone
+
+
+def compute_free_slots(target_date, schedule: dict, slot_min: int, requested_duration: int,
+                       occupancy: DayOccupancy, now, held: int = 0) -> list:
+    """
+    Свободные слоты дня: сетка из рабочих часов, у которой в битовой карте занятости
+    (и в маске чужих броней held) свободен весь отрезок [слот, слот + длительность услуги).
+    """
+    start_parts = list(map(int, schedule['start_time'].split(':')))
+    end_parts = list(map(int, schedule['end_time'].split(':')))
+
+    work_start = target_date.replace(hour=start_parts[0], minute=start_parts[1], second=0)
+    work_end = target_date.replace(hour=end_parts[0], minute=end_parts[1], second=0)
+
+    step = timedelta(minutes=slot_min)
+    duration = timedelta(minutes=requested_duration)
+
+    free_slots = []
+    slot = work_start
+    while slot < work_end:
+        # Услуга вылезает за рабочий день — у следующих слотов тем более
+        if slot + duration > work_end:
+            break
+        # Пропускаем прошлое
+        if slot > now:
+            start_min = int(occupancy.offset(slot))
+            if occupancy.is_free(start_min, start_min + requested_duration, held):
+                free_slots.append(slot.isoformat())
+        slot += step
+
+    return free_slots
+
+
+def parse_date(value: str, param: str = "date") -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(400, f"Invalid {param} format YYYY-MM-DD")
+
+
+class AvailabilityService:
+    MAX_RANGE_DAYS = 31
+
+    @staticmethod
+    async def _load(master_id: int, service_id: int, date_from: datetime, date_to: datetime):
+        """
+        Входные данные для расчета. Если профиль, услуги и часы мастера уже в кэше,
+        из базы читаются только записи за дни, для которых нет карты занятости;
+        иначе все приходит одним RPC и заодно прогревает кэш.
+        """
+        days = [(date_from + timedelta(days=i)).date() for i in range((date_to - date_from).days + 1)]
+
+        cached = ScheduleService.peek(master_id)
+        if cached:
+            master, services, hours = cached
+            master_tz = get_timezone(master.get('timezone'))
+            occupancy, missing = OccupancyService.lookup(master_id, days)
+            if missing:
+                range_start = master_tz.localize(datetime.combine(missing[0], datetime.min.time()))
+                range_end = master_tz.localize(datetime.combine(missing[-1] + timedelta(days=1), datetime.min.time()))
+                busy = await AppointmentRepository.list_busy(
+                    master_id, range_start.astimezone(pytz.utc).isoformat(), range_end.astimezone(pytz.utc).isoformat()
+                )
+                occupancy.update(OccupancyService.build(master_id, master_tz, missing, busy))
+        else:
+            inputs = await AvailabilityRepository.load_inputs(
+                master_id, date_from.date().isoformat(), date_to.date().isoformat()
+            )
+            master = inputs.get('master')
+            if not master:
+                raise HTTPException(404, "Master not found")
+            services = inputs.get('services') or []
+            hours = inputs.get('working_hours') or []
+            ScheduleService.store(master_id, profile=master, services=services, hours=hours)
+            master_tz = get_timezone(master.get('timezone'))
+            occupancy = OccupancyService.build(master_id, master_tz, days, inputs.get('busy') or [])
+
+        service = next((srv for srv in services if srv['id'] == service_id), None)
+        if not service:
+            raise HTTPException(404, "Service not found")
+
+        return master, service, hours, master_tz, occupancy
+
+    @staticmethod
+    async def _days(master_id: int, service_id: int, date_from: datetime, date_to: datetime,
+                    client_id: int = None):
+        """
+        Считает свободные слоты по каждому дню диапазона. Возвращает [(YYYY-MM-DD, [slots])].
+        Слоты, забронированные другими клиентами, не показываются; свои брони client_id — да.
+        """
+        master, service, hours, master_tz, occupancy = await AvailabilityService._load(
+            master_id, service_id, date_from, date_to
+        )
+        requested_duration = service.get('duration_min') or DEFAULT_DURATION
+        hours_by_day = {h['day_of_week']: h for h in hours}
+
+        now = datetime.now(master_tz)
+        result = []
+        day = date_from
+        while day <= date_to:
+            target_date = master_tz.localize(day)
+            schedule = hours_by_day.get(target_date.isoweekday())
+            slots = []
+            if schedule:
+                # На Basic сетка всегда 30 минут
+                slot_min = (schedule.get('slot_minutes') or 30) if master.get('is_premium') else 30
+                day_occupancy = occupancy[day.date()]
+                slots = compute_free_slots(
+                    target_date, schedule, slot_min, requested_duration, day_occupancy, now,
+                    slot_holds.mask(master_id, day_occupancy, client_id),
+                )
+            result.append((day.date().isoformat(), slots))
+            day += timedelta(days=1)
+        return result
+
+    @staticmethod
+    async def get_day(master_id: int, service_id: int, date: str, client_id: int = None) -> list:
+        """Свободные слоты мастера на дату (YYYY-MM-DD) для услуги service_id."""
+        day = parse_date(date)
+        days = await AvailabilityService._days(master_id, service_id, day, day, client_id)
+        return days[0][1]
+
+    @staticmethod
+    async def hold(master_id: int, service_id: int, starts_at: datetime, client_id: int) -> dict:
+        """
+        Бронирует свободный слот за клиентом на SLOT_HOLD_TTL секунд, пока он заполняет форму.
+        Другие клиенты этот слот не видят, а AppointmentService.create отвечает им 409
+        сразу, без запроса в базу. Повторная бронь того же клиента заменяет предыдущую.
+        """
+        if starts_at.tzinfo is None:
+            starts_at = starts_at.replace(tzinfo=pytz.utc)
+
+        profile = await ScheduleService.get_profile(master_id)
+        if not profile:
+            raise HTTPException(404, "Master not found")
+        service = await ScheduleService.get_service(master_id, service_id)
+        if not service:
+            raise HTTPException(404, "Service not found")
+
+        master_tz = get_timezone(profile.get('timezone'))
+        local_start = starts_at.astimezone(master_tz)
+        day = local_start.date().isoformat()
+
+        # Слот должен быть в сетке и свободен (свою прежнюю бронь клиент не видит как занятую)
+        slots = await AvailabilityService.get_day(master_id, service_id, day, client_id)
+        if not any(datetime.fromisoformat(slot) == local_start for slot in slots):
+            raise HTTPException(409, "Извините, это время уже занято")
+
+        local_end = local_start + timedelta(minutes=service.get('duration_min') or DEFAULT_DURATION)
+        hold = slot_holds.place(master_id, client_id, local_start, local_end, day)
+        if hold is None:
+            raise HTTPException(409, "Это время сейчас бронирует другой клиент")
+
+        return {
+            "starts_at": local_start.isoformat(),
+            "ends_at": local_end.isoformat(),
+            "expires_in": slot_holds.ttl,
+        }
+
+    @staticmethod
+    async def get_range(master_id: int, service_id: int, date_from: str, date_to: str,
+                        counts_only: bool = False) -> dict:
+        """
+        Свободные слоты на каждый день диапазона (не больше MAX_RANGE_DAYS) — для календаря.
+        Рабочие часы и записи за весь диапазон грузятся одним запросом.
+        """
+        start = parse_date(date_from, "from")
+        end = parse_date(date_to, "to")
+        if end < start:
+            raise HTTPException(400, "'to' must not be earlier than 'from'")
+        if (end - start).days + 1 > AvailabilityService.MAX_RANGE_DAYS:
+            raise HTTPException(400, f"Range is limited to {AvailabilityService.MAX_RANGE_DAYS} days")
+
+        days = await AvailabilityService._days(master_id, service_id, start, end)
+        if counts_only:
+            return {d: len(slots) for d, slots in days}
+        return {d: slots for d, slots in days}
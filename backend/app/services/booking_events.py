@@ -0,0 +1,24 @@
+from app.reminders import reminder_scheduler
+from app.services.occupancy import OccupancyService
+from app.services.analytics_service import AnalyticsService
+from app.services.availability_events import availability_broker
+
+
+async def booking_changed(appt: dict):
+    """
+    Единая точка реакции на изменение записи: создание или смену статуса.
+    appt — строка appointments после изменения.
+    """
+    try:
+        await OccupancyService.apply(appt)
+        # Открытые SSE-потоки слотов получают дельту занятости
+        await availability_broker.publish_change(appt)
+    except Exception as e:
+        print(f"Booking hook error: {e}")
+
+    # Дневная сводка обновляется триггером в базе; кэш ответов аналитики мастера сбрасываем
+    if appt.get('master_telegram_id'):
+        AnalyticsService.invalidate(appt['master_telegram_id'])
+
+    # Подтверждение ставит таймеры напоминаний, отмена/завершение — снимает
+    reminder_scheduler.schedule(appt)
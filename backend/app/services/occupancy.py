@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+import math
+
+from app.cache import TTLCache
+from app.config import OCCUPANCY_TTL, OCCUPANCY_CACHE_SIZE
+from app.services.schedule_service import ScheduleService
+from app.utils import get_timezone
+
+DEFAULT_DURATION = 60
+
+# (master_telegram_id, 'YYYY-MM-DD') -> DayOccupancy
+occupancy_cache = TTLCache(maxsize=OCCUPANCY_CACHE_SIZE, ttl=OCCUPANCY_TTL)
+
+
+class DayOccupancy:
+    """
+    Занятость одного локального дня мастера.
+    mask — битовая маска по минутам от полуночи: бит i = минута i занята.
+    Минутная точность нужна, чтобы услуги любой длительности проверялись так же точно,
+    как при пересечении интервалов; при этом весь день — одно целое число.
+    """
+
+    __slots__ = ('day_start', 'intervals', 'mask')
+
+    def __init__(self, day_start: datetime):
+        self.day_start = day_start
+        self.intervals = {}  # appointment_id -> (start_min, end_min)
+        self.mask = 0
+
+    def offset(self, moment: datetime) -> float:
+        return (moment - self.day_start).total_seconds() / 60
+
+    def add(self, appt_id, start: datetime, duration_min: int):
+        start_min = max(0, math.floor(self.offset(start)))
+        end_min = math.ceil(self.offset(start + timedelta(minutes=duration_min)))
+        if end_min <= start_min:
+            return
+        self.intervals[appt_id] = (start_min, end_min)
+        self.mask |= ((1 << (end_min - start_min)) - 1) << start_min
+
+    def remove(self, appt_id):
+        if self.intervals.pop(appt_id, None) is None:
+            return
+        # Записи могут пересекаться, поэтому маску пересобираем из оставшихся интервалов
+        mask = 0
+        for start_min, end_min in self.intervals.values():
+            mask |= ((1 << (end_min - start_min)) - 1) << start_min
+        self.mask = mask
+
+    def is_free(self, start_min: int, end_min: int, held: int = 0) -> bool:
+        """held — дополнительная маска занятых минут (брони слотов, см. slot_holds)."""
+        return not ((self.mask | held) >> start_min) & ((1 << (end_min - start_min)) - 1)
+
+
+def parse_start(starts_at: str, master_tz):
+    try:
+        return datetime.fromisoformat(starts_at.replace('Z', '+00:00')).astimezone(master_tz)
+    except (ValueError, AttributeError):
+        return None
+
+
+class OccupancyService:
+    """
+    Лениво строит битовые карты занятости из записей и поддерживает их
+    инкрементально при создании записи и смене ее статуса.
+    Другие воркеры/реплики эти карты не обновляют, поэтому у них короткий TTL,
+    а окончательную защиту от двойной записи по-прежнему дает idx_unique_slot.
+    """
+
+    @staticmethod
+    def lookup(master_id: int, days: list):
+        """Возвращает ({date: DayOccupancy} из кэша, [даты, которых в кэше нет])."""
+        found, missing = {}, []
+        for day in days:
+            occupancy = occupancy_cache.get((master_id, day.isoformat()))
+            if occupancy is None:
+                missing.append(day)
+            else:
+                found[day] = occupancy
+        return found, missing
+
+    @staticmethod
+    def build(master_id: int, master_tz, days: list, busy_rows: list) -> dict:
+        """Строит и кэширует карты для дней days из неотмененных записей busy_rows."""
+        result = {day: DayOccupancy(master_tz.localize(datetime.combine(day, datetime.min.time()))) for day in days}
+        for row in busy_rows:
+            start = parse_start(row['starts_at'], master_tz)
+            if start is None or start.date() not in result:
+                continue
+            result[start.date()].add(row.get('id'), start, row.get('duration_min') or DEFAULT_DURATION)
+        for day, occupancy in result.items():
+            occupancy_cache.set((master_id, day.isoformat()), occupancy)
+        return result
+
+    @staticmethod
+    async def apply(appt: dict):
+        """Отражает изменение записи в уже построенной карте (если она есть в кэше)."""
+        master_id = appt.get('master_telegram_id')
+        profile = await ScheduleService.get_profile(master_id) or {}
+        master_tz = get_timezone(profile.get('timezone'))
+        start = parse_start(appt.get('starts_at'), master_tz)
+        if start is None:
+            return
+
+        occupancy = occupancy_cache.get((master_id, start.date().isoformat()))
+        if occupancy is None:
+            return
+
+        if appt.get('status') == 'cancelled':
+            occupancy.remove(appt['id'])
+        elif appt['id'] not in occupancy.intervals:
+            service = await ScheduleService.get_service(master_id, appt.get('service_id')) or {}
+            occupancy.add(appt['id'], start, service.get('duration_min') or DEFAULT_DURATION)
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.config import PHOTO_SWEEP_GRACE_HOURS
+from app.images import image_processor
+from app.repositories.masters import MasterRepository
+from app.repositories.storage import StorageRepository
+
+# Файлы вариантов по своему пути никогда не меняются — браузер и CDN могут кэшировать их навсегда
+IMMUTABLE_CACHE_SECONDS = 31536000
+
+FORMATS = (("jpeg", "jpg", "image/jpeg"), ("webp", "webp", "image/webp"))
+MANIFEST = "manifest.json"
+AVATARS = "avatars"
+
+
+def content_id(image_bytes: bytes) -> str:
+    """Идентификатор фото — хеш исходных байтов: повторная загрузка того же файла дает тот же путь."""
+    return hashlib.sha256(image_bytes).hexdigest()[:32]
+
+
+class PhotoService:
+    @staticmethod
+    async def upload(master_id: int, image_bytes: bytes) -> dict:
+        """
+        Сжимает фото в набор вариантов (пул процессов), загружает их в Storage
+        по путям {master_id}/{photo_id}/{size}.{jpg|webp} (size — 128/384/1024) и возвращает манифест для masters.photos:
+        {"id", "url", "width", "height", "variants": [{"w", "h", "jpeg", "webp"}]} (варианты по возрастанию).
+        Если такое же фото уже загружено, возвращает сохраненный манифест без сжатия и загрузки.
+        """
+        photo_id = content_id(image_bytes)
+        manifest_path = f"{master_id}/{photo_id}/{MANIFEST}"
+        existing = await StorageRepository.download(manifest_path)
+        if existing:
+            # Перезаписываем манифест: его updated_at — отметка использования для sweep,
+            # иначе папка загруженного давно фото может быть удалена до сохранения профиля
+            await StorageRepository.upload(manifest_path, existing, "application/json", upsert=True)
+            return json.loads(existing)
+
+        rendered = await image_processor.variants(image_bytes)
+
+        uploads = []
+        for variant in rendered["variants"]:
+            for key, ext, content_type in FORMATS:
+                path = f"{master_id}/{photo_id}/{variant['size']}.{ext}"
+                uploads.append((variant["size"], key, path, variant[key], content_type))
+
+        # upsert: параллельная загрузка того же файла или прерванная прошлая попытка не дают 409
+        await asyncio.gather(*(
+            StorageRepository.upload(path, content, content_type, upsert=True, cache_seconds=IMMUTABLE_CACHE_SECONDS)
+            for _, _, path, content, content_type in uploads
+        ))
+        urls = await asyncio.gather(*(StorageRepository.public_url(path) for _, _, path, _, _ in uploads))
+
+        by_size = {}
+        for (size, key, _, _, _), url in zip(uploads, urls):
+            by_size.setdefault(size, {})[key] = url
+
+        variants = [
+            {"w": v["width"], "h": v["height"], **by_size[v["size"]]}
+            for v in reversed(rendered["variants"])
+        ]
+        manifest = {
+            "id": photo_id,
+            "url": variants[-1]["jpeg"],
+            "width": rendered["width"],
+            "height": rendered["height"],
+            "variants": variants,
+        }
+
+        # Манифест пишется последним: его наличие означает, что все варианты уже в Storage
+        await StorageRepository.upload(
+            manifest_path, json.dumps(manifest).encode(), "application/json", upsert=True
+        )
+        return manifest
+
+    @staticmethod
+    async def upload_avatar(master_id: int, image_bytes: bytes) -> str:
+        """Аватар для старого /uploads/avatar: один JPEG по пути {master_id}/avatars/{hash}.jpg."""
+        path = f"{master_id}/{AVATARS}/{content_id(image_bytes)}.jpg"
+        # Уже загруженный аватар перезаписываем теми же байтами (без повторного сжатия),
+        # чтобы обновить его updated_at для sweep
+        compressed = await StorageRepository.download(path)
+        if compressed is None:
+            compressed = await image_processor.compress(image_bytes, max_size=1024, quality=80)
+        await StorageRepository.upload(
+            path, compressed, "image/jpeg", upsert=True, cache_seconds=IMMUTABLE_CACHE_SECONDS
+        )
+        return await StorageRepository.public_url(path)
+
+    @staticmethod
+    async def sweep(master_id: int, grace: timedelta = timedelta(hours=PHOTO_SWEEP_GRACE_HOURS)) -> int:
+        """
+        Удаляет объекты под {master_id}/, на которые не ссылаются masters.photos и avatar_url.
+        Свежие объекты (загруженные или перезаписанные позже grace назад) не трогаем:
+        фото загружают до сохранения профиля.
+        Возвращает число удаленных объектов.
+        """
+        master = await MasterRepository.get(master_id, "photos, avatar_url")
+        if not master:
+            return 0
+
+        photo_ids, paths = set(), set()
+        for photo in (master.get('photos') or []) + [master.get('avatar_url')]:
+            if isinstance(photo, dict):
+                photo_ids.add(photo.get('id'))
+            elif photo:
+                path = StorageRepository.object_path(photo)
+                if path:
+                    paths.add(path)
+                    # Ссылка на отдельный вариант (например, avatar_url) сохраняет всю папку фото
+                    parts = path.split('/')
+                    if len(parts) == 3 and parts[1] != AVATARS:
+                        photo_ids.add(parts[1])
+
+        cutoff = datetime.now(timezone.utc) - grace
+
+        def stale(entry: dict) -> bool:
+            # updated_at — последняя загрузка объекта (повторная загрузка того же фото его обновляет)
+            touched = [datetime.fromisoformat(t.replace('Z', '+00:00'))
+                       for t in (entry.get('created_at'), entry.get('updated_at')) if t]
+            if not touched:
+                return False
+            return max(touched) < cutoff
+
+        garbage = []
+        for entry in await StorageRepository.list(str(master_id)):
+            name = entry['name']
+            if entry.get('id') is not None:
+                # Файлы в корне мастера: старые {uuid}.jpg и avatar.png
+                path = f"{master_id}/{name}"
+                if path not in paths and stale(entry):
+                    garbage.append(path)
+            elif name == AVATARS:
+                for avatar in await StorageRepository.list(f"{master_id}/{AVATARS}"):
+                    path = f"{master_id}/{AVATARS}/{avatar['name']}"
+                    if path not in paths and stale(avatar):
+                        garbage.append(path)
+            elif name not in photo_ids:
+                # Папка фото удаляется целиком и только если все ее файлы старше грейс-периода
+                files = await StorageRepository.list(f"{master_id}/{name}")
+                if files and all(stale(f) for f in files):
+                    garbage.extend(f"{master_id}/{name}/{f['name']}" for f in files)
+
+        await StorageRepository.remove(garbage)
+        return len(garbage)
+
+    @staticmethod
+    async def sweep_all():
+        """Фоновая уборка по всем мастерам, у которых есть папка в Storage."""
+        removed = 0
+        try:
+            folders = await StorageRepository.list("")
+        except Exception as e:
+            print(f"Photo sweep failed: {e}")
+            return
+        for folder in folders:
+            if folder.get('id') is not None or not folder['name'].isdigit():
+                continue
+            try:
+                removed += await PhotoService.sweep(int(folder['name']))
+            except Exception as e:
+                print(f"Photo sweep failed for {folder['name']}: {e}")
+        print(f"Photo sweep: removed {removed} objects")
@@ -0,0 +1,95 @@
+from app.cache import TTLCache
+from app.config import MASTER_CACHE_TTL, MASTER_CACHE_SIZE
+from app.repositories.masters import MasterRepository
+from app.repositories.services import ServiceRepository
+from app.repositories.working_hours import WorkingHoursRepository
+from app.http_cache import etag_of
+
+# Профиль, активные услуги и рабочие часы мастера меняются редко,
+# а читаются на каждом открытии Mini App клиентом. Ключ — (набор данных, master_telegram_id).
+# Админские ручки записи обязаны вызывать ScheduleService.invalidate().
+master_cache = TTLCache(maxsize=MASTER_CACHE_SIZE * 6, ttl=MASTER_CACHE_TTL)
+
+PROFILE = 'profile'
+SERVICES = 'services'
+HOURS = 'working_hours'
+ETAG = 'etag'
+PUBLIC_VIEWS = ('profile', 'services', 'schedule')
+
+
+class ScheduleService:
+    @staticmethod
+    async def get_profile(master_id: int):
+        """Публичный профиль мастера или None."""
+        profile = master_cache.get((PROFILE, master_id))
+        if profile is None:
+            profile = await MasterRepository.get_public(master_id)
+            if profile:
+                master_cache.set((PROFILE, master_id), profile)
+        return profile
+
+    @staticmethod
+    async def get_services(master_id: int) -> list:
+        services = master_cache.get((SERVICES, master_id))
+        if services is None:
+            services = await ServiceRepository.list_active(master_id)
+            master_cache.set((SERVICES, master_id), services)
+        return services
+
+    @staticmethod
+    async def get_hours(master_id: int) -> list:
+        hours = master_cache.get((HOURS, master_id))
+        if hours is None:
+            hours = await WorkingHoursRepository.list(master_id)
+            master_cache.set((HOURS, master_id), hours)
+        return hours
+
+    @staticmethod
+    async def get_service(master_id: int, service_id: int):
+        """Активная услуга мастера из кэша или None."""
+        for srv in await ScheduleService.get_services(master_id):
+            if srv['id'] == service_id:
+                return srv
+        return None
+
+    @staticmethod
+    def peek(master_id: int):
+        """(profile, services, hours), если все три набора уже в кэше, иначе None."""
+        profile = master_cache.get((PROFILE, master_id))
+        services = master_cache.get((SERVICES, master_id))
+        hours = master_cache.get((HOURS, master_id))
+        if profile is None or services is None or hours is None:
+            return None
+        return profile, services, hours
+
+    @staticmethod
+    def store(master_id: int, profile=None, services=None, hours=None):
+        if profile:
+            master_cache.set((PROFILE, master_id), profile)
+        if services is not None:
+            master_cache.set((SERVICES, master_id), services)
+        if hours is not None:
+            master_cache.set((HOURS, master_id), hours)
+
+    @staticmethod
+    def etag(view: str, master_id: int, source, payload=None) -> str:
+        """
+        ETag публичного ответа view ('profile', 'services', 'schedule'), построенного из
+        закэшированного объекта source (payload — сам ответ, если он отличается от source).
+        Хеш считается один раз на версию данных: тег хранится в кэше вместе со ссылкой на source,
+        поэтому после invalidate() и перезагрузки данных тег пересчитывается.
+        """
+        key = (ETAG, view, master_id)
+        cached = master_cache.get(key)
+        if cached is not None and cached[0] is source:
+            return cached[1]
+        tag = etag_of(source if payload is None else payload)
+        master_cache.set(key, (source, tag))
+        return tag
+
+    @staticmethod
+    def invalidate(master_id: int):
+        for kind in (PROFILE, SERVICES, HOURS):
+            master_cache.pop((kind, master_id))
+        for view in PUBLIC_VIEWS:
+            master_cache.pop((ETAG, view, master_id))
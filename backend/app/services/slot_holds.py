@@ -0,0 +1,151 @@
+import asyncio
+import math
+import time
+from datetime import datetime
+
+from app.config import SLOT_HOLD_TTL, SLOT_HOLD_MAX
+from app.services.availability_events import availability_broker
+
+
+class SlotHold:
+    __slots__ = ('client_id', 'starts_at', 'ends_at', 'day', 'expires_at', 'timer')
+
+    def __init__(self, client_id: int, starts_at: datetime, ends_at: datetime, day: str, expires_at: float):
+        self.client_id = client_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.day = day  # локальная дата мастера (тема SSE-потока)
+        self.expires_at = expires_at
+        self.timer: asyncio.TimerHandle | None = None
+
+    def overlaps(self, starts_at: datetime, ends_at: datetime) -> bool:
+        return self.starts_at < ends_at and starts_at < self.ends_at
+
+
+class SlotHoldStore:
+    """
+    Короткие брони слотов в памяти: master_id -> {client_id: SlotHold}.
+    У клиента не больше одной брони на мастера — новая заменяет старую.
+    Просроченную бронь снимает таймер event loop (подписчики получают released);
+    при обращении к мастеру просроченные брони дополнительно проверяются лениво.
+    Брони видны только на этой реплике; от двойной записи по-прежнему защищает idx_unique_slot.
+    """
+
+    def __init__(self, ttl: float = SLOT_HOLD_TTL, max_holds: int = SLOT_HOLD_MAX):
+        self.ttl = ttl
+        self.max_holds = max_holds
+        self._masters: dict[int, dict[int, SlotHold]] = {}
+        self._count = 0
+
+        # Метрики
+        self.placed = 0
+        self.conflicts = 0
+        self.consumed = 0
+        self.expired = 0
+
+    def _active(self, master_id: int) -> dict:
+        holds = self._masters.get(master_id)
+        if not holds:
+            return {}
+        now = time.monotonic()
+        for client_id in [c for c, h in holds.items() if h.expires_at <= now]:
+            self._expire(master_id, client_id)
+        return self._masters.get(master_id, {})
+
+    def _expire(self, master_id: int, client_id: int):
+        if self._drop(master_id, client_id) is not None:
+            self.expired += 1
+
+    def _drop(self, master_id: int, client_id: int):
+        holds = self._masters.get(master_id)
+        hold = holds.pop(client_id, None) if holds else None
+        if hold is None:
+            return None
+        self._count -= 1
+        if not holds:
+            del self._masters[master_id]
+        if hold.timer is not None:
+            hold.timer.cancel()
+        availability_broker.publish(master_id, hold.day, {
+            "type": "released",
+            "hold": True,
+            "starts_at": hold.starts_at.isoformat(),
+            "ends_at": hold.ends_at.isoformat(),
+        })
+        return hold
+
+    def has_holds(self, master_id: int) -> bool:
+        return bool(self._active(master_id))
+
+    def conflict(self, master_id: int, starts_at: datetime, ends_at: datetime, client_id: int = None):
+        """Чужая бронь, пересекающая [starts_at, ends_at), или None."""
+        for hold in self._active(master_id).values():
+            if hold.client_id != client_id and hold.overlaps(starts_at, ends_at):
+                return hold
+        return None
+
+    def place(self, master_id: int, client_id: int, starts_at: datetime, ends_at: datetime, day: str):
+        """
+        Бронирует интервал за клиентом. None — интервал уже держит другой клиент
+        или достигнут лимит броней. Между проверкой и записью нет await, поэтому
+        из двух одновременных запросов бронь получает только один.
+        """
+        if self.conflict(master_id, starts_at, ends_at, client_id):
+            self.conflicts += 1
+            return None
+        self.release(master_id, client_id)
+        if self._count >= self.max_holds:
+            return None
+
+        hold = SlotHold(client_id, starts_at, ends_at, day, time.monotonic() + self.ttl)
+        self._masters.setdefault(master_id, {})[client_id] = hold
+        self._count += 1
+        try:
+            hold.timer = asyncio.get_running_loop().call_later(self.ttl, self._expire, master_id, client_id)
+        except RuntimeError:
+            pass  # вне event loop бронь истечет лениво
+        self.placed += 1
+        availability_broker.publish(master_id, day, {
+            "type": "taken",
+            "hold": True,
+            "starts_at": starts_at.isoformat(),
+            "ends_at": ends_at.isoformat(),
+        })
+        return hold
+
+    def release(self, master_id: int, client_id: int):
+        return self._drop(master_id, client_id)
+
+    def consume(self, master_id: int, client_id: int):
+        """
+        Бронь превратилась в запись: снимаем ее с событием released за интервал брони.
+        Вызывается до booking_changed, который следом публикует taken за саму запись —
+        подписчики не держат занятым интервал брони, если клиент записался на другое время.
+        """
+        if self._drop(master_id, client_id) is not None:
+            self.consumed += 1
+
+    def mask(self, master_id: int, occupancy, client_id: int = None) -> int:
+        """Битовая маска чужих броней в минутах дня occupancy (как DayOccupancy.mask)."""
+        mask = 0
+        for hold in self._active(master_id).values():
+            if hold.client_id == client_id:
+                continue
+            start_min = max(0, math.floor(occupancy.offset(hold.starts_at)))
+            end_min = math.ceil(occupancy.offset(hold.ends_at))
+            # Бронь на другой день (сутки с переводом часов — до 25 часов)
+            if end_min > start_min and start_min < 25 * 60:
+                mask |= ((1 << (end_min - start_min)) - 1) << start_min
+        return mask
+
+    def metrics(self) -> dict:
+        return {
+            "active": self._count,
+            "placed": self.placed,
+            "conflicts": self.conflicts,
+            "consumed": self.consumed,
+            "expired": self.expired,
+        }
+
+
+slot_holds = SlotHoldStore()
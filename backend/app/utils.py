@@ -1,7 +1,9 @@
-import requests
 import io
+import pytz
 from PIL import Image
-from .config import BOT_TOKEN
+from .notifications import dispatcher
+
+DEFAULT_TZ = 'Asia/Almaty'
 
 def compress_image(image_bytes: bytes, max_size: int = 1024, quality: int = 80) -> bytes:
     """
@@ -9,11 +11,17 @@ def compress_image(image_bytes: bytes, max_size: int = 1024, quality: int = 80)
     1. Уменьшает размер (resize), сохраняя пропорции.
     2. Конвертирует в JPEG.
     3. Оптимизирует вес файла.
+    CPU-тяжелая: из обработчиков вызывать через app.images.compress (пул процессов).
     """
     try:
         # Открываем изображение из байтов
         img = Image.open(io.BytesIO(image_bytes))
 
+        # JPEG декодируем сразу в уменьшенном масштабе (1/2, 1/4, 1/8), но не меньше max_size:
+        # в разы быстрее и меньше памяти, чем декодировать 12 Мп и потом уменьшать
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_size, max_size))
+
         # Если изображение имеет прозрачность (PNG), делаем белый фон
         if img.mode in ('RGBA', 'P'):
             img = img.convert('RGB')
@@ -32,22 +40,58 @@ def compress_image(image_bytes: bytes, max_size: int = 1024, quality: int = 80)
         # Если ошибка, возвращаем оригинал
         return image_bytes
 
-def send_telegram_message(chat_id: int, text: str):
-    """Отправляет сообщение в Telegram через Bot API"""
-    if not BOT_TOKEN:
-        print("WARNING: BOT_TOKEN not set, notification skipped")
-        return
+# Ширины вариантов фото мастера (px по длинной стороне): аватар/превью, карточка, полноэкранный слайд
+PHOTO_VARIANT_SIZES = (128, 384, 1024)
+
+
+def make_photo_variants(image_bytes: bytes, sizes=PHOTO_VARIANT_SIZES, quality: int = 80) -> dict:
+    """
+    Готовит варианты фото за одно декодирование: для каждого размера JPEG и WebP.
+    Размеры больше исходника не делаются (самый крупный вариант — не больше оригинала).
+    Возвращает {"width", "height", "variants": [{"size", "width", "height", "jpeg", "webp"}]}
+    от большего к меньшему; каждый следующий вариант уменьшается из предыдущего.
+    CPU-тяжелая: вызывать через app.images (пул процессов).
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == 'JPEG':
+        img.draft('RGB', (max(sizes), max(sizes)))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    longest = max(img.size)
+    targets = sorted({min(size, longest) for size in sizes}, reverse=True)
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML"
-    }
+    variants = []
+    current = img
+    for size in targets:
+        if max(current.size) > size:
+            current = current.copy()
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
 
+        jpeg, webp = io.BytesIO(), io.BytesIO()
+        current.save(jpeg, format='JPEG', quality=quality, optimize=True, progressive=True)
+        current.save(webp, format='WEBP', quality=quality, method=4)
+        variants.append({
+            "size": size,
+            "width": current.width,
+            "height": current.height,
+            "jpeg": jpeg.getvalue(),
+            "webp": webp.getvalue(),
+        })
+
+    return {"width": variants[0]["width"], "height": variants[0]["height"], "variants": variants}
+
+
+def send_telegram_message(chat_id: int, text: str) -> bool:
+    """
+    Ставит сообщение в очередь отправки Telegram и сразу возвращает управление.
+    Доставкой (лимиты, повторы) занимается app.notifications.dispatcher.
+    """
+    return dispatcher.enqueue(chat_id, text)
+
+def get_timezone(tz_name: str = None):
+    """Таймзона мастера; при пустом или неизвестном имени — Asia/Almaty."""
     try:
-        response = requests.post(url, json=payload, timeout=5)
-        if response.status_code != 200:
-            print(f"Telegram API Error: {response.text}")
-    except Exception as e:
-        print(f"Failed to send notification: {e}")
+        return pytz.timezone(tz_name or DEFAULT_TZ)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TZ)
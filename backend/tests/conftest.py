@@ -0,0 +1,211 @@
+# Общие фикстуры тестов бэкенда: подменный клиент Supabase вместо get_db() и сброс
+# in-process кэшей между тестами. Запуск: cd backend && python -m pytest -q
+# (бенчмарки — с флагом --benchmark)
+import asyncio
+import inspect
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import app.db
+
+
+class FakeQuery:
+    """
+    Цепочка вызовов query builder'а (select/eq/order/...): все методы запоминаются в ops,
+    а execute() отдает ответ обработчика, зарегистрированного в FakeDB.on(name, ...).
+    """
+
+    def __init__(self, db, kind: str, name: str, params: dict = None):
+        self.db = db
+        self.kind = kind
+        self.name = name
+        self.params = params or {}
+        self.ops = []
+
+    def __getattr__(self, op):
+        if op.startswith('__'):
+            raise AttributeError(op)
+
+        def method(*args, **kwargs):
+            self.ops.append((op, args, kwargs))
+            return self
+        return method
+
+    def arg(self, op: str, column: str = None):
+        """Значение фильтра op (например eq) по колонке column; без column — первый аргумент."""
+        for name, args, _ in self.ops:
+            if name == op and (column is None or args[0] == column):
+                return args[-1] if column else args[0]
+        return None
+
+    async def execute(self):
+        self.db.calls.append(self)
+        return SimpleNamespace(data=await self.db.respond(self))
+
+
+class FakeDB:
+    def __init__(self):
+        self.calls = []
+        self.handlers = {}
+        self.delay = 0.0
+
+    def table(self, name: str):
+        return FakeQuery(self, 'table', name)
+
+    def rpc(self, name: str, params: dict = None):
+        return FakeQuery(self, 'rpc', name, params)
+
+    def on(self, name: str, handler):
+        """handler(query) -> data (можно корутиной) или исключение, которое нужно поднять."""
+        self.handlers[name] = handler
+
+    def called(self, name: str) -> list:
+        return [q for q in self.calls if q.name == name]
+
+    async def respond(self, query: FakeQuery):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        handler = self.handlers.get(query.name)
+        if handler is None:
+            return []
+        result = handler(query) if callable(handler) else handler
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true',
+                     help='запустить бенчмарки (сравнения по времени, на нагруженной машине нестабильны)')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark'):
+        return
+    skip = pytest.mark.skip(reason='бенчмарк: запуск с --benchmark')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(app.db, '_client', fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    """In-process кэши модулей живут между тестами — очищаем их перед каждым."""
+    from app.auth import verified_init_data
+    from app.services.schedule_service import master_cache
+    from app.services.occupancy import occupancy_cache
+    from app.services.analytics_service import analytics_cache
+    from app.services.appointment_service import recent_bookings, _in_flight
+    from app.services.slot_holds import slot_holds
+    from app.services.availability_events import availability_broker
+
+    for cache in (verified_init_data, master_cache, occupancy_cache, analytics_cache, recent_bookings):
+        cache.clear()
+    _in_flight.clear()
+    slot_holds.__init__()
+    availability_broker.__init__()
+    yield
+
+
+@pytest.fixture(scope='session')
+def pg():
+    """
+    Соединение с локальной Postgres для тестов SQL-функций (TEST_DATABASE_URL).
+    Схема database/shema.sql применяется один раз; без базы тесты пропускаются.
+    """
+    psycopg2 = pytest.importorskip('psycopg2')
+    dsn = os.getenv('TEST_DATABASE_URL')
+    if not dsn:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    schema = os.path.join(os.path.dirname(__file__), '..', '..', 'database', 'shema.sql')
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(open(schema, encoding='utf-8').read())
+    yield SimpleNamespace(dsn=dsn, conn=conn, connect=lambda: psycopg2.connect(dsn))
+    conn.close()
+
+
+class PgClient:
+    """
+    get_db() поверх настоящей Postgres: rpc(...) вызывает SQL-функцию в отдельном потоке
+    и отдельном соединении (как параллельные запросы PostgREST) и приводит ответ к его формату.
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def rpc(self, name: str, params: dict = None):
+        return SimpleNamespace(execute=lambda: self._call(name, params or {}))
+
+    async def _call(self, name: str, params: dict):
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        from postgrest.exceptions import APIError
+
+        def run():
+            conn = self.connect()
+            conn.autocommit = True
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    args = ', '.join(f'{k} => %({k})s' for k in params)
+                    cur.execute(f'SELECT * FROM {name}({args})', params)
+                    return cur.fetchall()
+            except psycopg2.Error as e:
+                # Ошибка функции приходит от PostgREST как APIError с SQLSTATE в code
+                raise APIError({'code': e.pgcode, 'message': e.pgerror})
+            finally:
+                conn.close()
+
+        rows = [{k: _jsonable(v) for k, v in row.items()} for row in await asyncio.to_thread(run)]
+        # Функция RETURNS JSON: PostgREST отдает само значение
+        if len(rows) == 1 and list(rows[0]) == [name]:
+            return SimpleNamespace(data=rows[0][name])
+        return SimpleNamespace(data=rows)
+
+
+def _jsonable(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value.__class__.__name__ == 'Decimal':
+        return float(value)
+    return value
+
+
+@pytest.fixture
+def pg_db(pg, monkeypatch):
+    client = PgClient(pg.connect)
+    monkeypatch.setattr(app.db, '_client', client)
+    return client
+
+
+MASTER_ID = 7
+
+
+@pytest.fixture
+def api(db):
+    """TestClient приложения (без lifespan) от имени мастера MASTER_ID."""
+    from fastapi.testclient import TestClient
+    from app.main import app as fastapi_app
+    from app.auth import validate_telegram_data
+
+    fastapi_app.dependency_overrides[validate_telegram_data] = lambda: {'id': MASTER_ID, 'username': 'master'}
+    yield TestClient(fastapi_app)
+    fastapi_app.dependency_overrides.clear()
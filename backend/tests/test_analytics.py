@@ -0,0 +1,162 @@
+# [user-011] KPI дашборда одним SQL-вызовом: совпадение со старой агрегацией в Python
+import random
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+import pytz
+
+from app.services.analytics_service import AnalyticsService, analytics_cache, local_today
+
+pytestmark = pytest.mark.anyio
+
+MASTER = 910000011
+TZ = 'Asia/Almaty'
+STATUSES = ['pending', 'confirmed', 'completed', 'cancelled']
+
+
+def legacy_dashboard(apps: list, today: date, days: int) -> dict:
+    """
+    Агрегация старого эндпоинта (выборка записей + подсчет в Python), но по локальным дням
+    мастера — как считает master_daily_stats. apps: {'day', 'status', 'service', 'price'}.
+    """
+    apps = [a for a in apps if a['day'] >= today - timedelta(days=days)]
+    completed_apps = [a for a in apps if a['status'] == 'completed']
+    revenue = sum(a['price'] for a in completed_apps if a['service'])
+    avg_check = round(revenue / len(completed_apps)) if completed_apps else 0
+
+    counts = Counter(a['service'] for a in completed_apps if a['service'])
+    top_services = [{"name": k, "count": v} for k, v in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:3]]
+
+    daily_stats = []
+    for i in range(6, -1, -1):
+        d = today - timedelta(days=i)
+        daily_stats.append({
+            "day": d.strftime("%d %b"),
+            "value": len([a for a in apps if a['day'] == d]),
+            "is_today": i == 0
+        })
+
+    return {
+        "is_premium": True,
+        "kpi": {"revenue": revenue, "avg_check": avg_check, "total_completed": len(completed_apps)},
+        "top_services": top_services,
+        "status_distribution": {
+            "completed": len(completed_apps),
+            "cancelled": len([a for a in apps if a['status'] == 'cancelled']),
+            "pending": len([a for a in apps if a['status'] == 'pending']),
+        },
+        "daily_dynamics": daily_stats,
+    }
+
+
+@pytest.fixture
+def history(pg):
+    """Мастер с четырьмя услугами и ~600 записями за 60 дней, в том числе у локальной полуночи."""
+    rng = random.Random(11)
+    tz = pytz.timezone(TZ)
+    today = local_today(TZ)
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (MASTER,))
+        cur.execute("INSERT INTO masters (telegram_id, salon_name, timezone, is_premium) VALUES (%s, 'Salon', %s, true)",
+                    (MASTER, TZ))
+        services = []
+        for name, price in [('Стрижка', 5000), ('Мытье', 3000), ('Когти', 1500), ('Экспресс-линька', 7000)]:
+            cur.execute("INSERT INTO services (master_telegram_id, name, price) VALUES (%s, %s, %s) RETURNING id",
+                        (MASTER, name, price))
+            services.append((cur.fetchone()[0], name, price))
+
+        apps, used = [], set()
+        while len(apps) < 600:
+            day = today - timedelta(days=rng.randint(0, 60))
+            # Каждая пятая запись — в последние/первые минуты локальных суток
+            minute = rng.choice([0, 5, 23 * 60 + 55]) if rng.random() < 0.2 else rng.randrange(8 * 60, 20 * 60, 15)
+            local = tz.localize(datetime.combine(day, time()) + timedelta(minutes=minute))
+            if local in used:
+                continue
+            used.add(local)
+            service = rng.choice(services + [None])
+            status = rng.choice(STATUSES)
+            cur.execute(
+                "INSERT INTO appointments (master_telegram_id, client_telegram_id, service_id, starts_at, status,"
+                " client_phone, pet_name) VALUES (%s, 800000000, %s, %s, %s, '+7', 'Рекс')",
+                (MASTER, service[0] if service else None, local.astimezone(timezone.utc), status),
+            )
+            apps.append({'day': day, 'status': status,
+                         'service': service[1] if service else None, 'price': service[2] if service else 0})
+    yield SimpleNamespace(apps=apps, services=services, today=today)
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (MASTER,))
+
+
+@pytest.mark.parametrize('days', [1, 7, 30, 60])
+async def test_dashboard_matches_python_aggregation(pg_db, history, days):
+    result = await AnalyticsService.dashboard(MASTER, TZ, days)
+    assert result == legacy_dashboard(history.apps, history.today, days)
+
+
+async def test_dashboard_follows_status_changes(pg, pg_db, history):
+    with pg.conn.cursor() as cur:
+        cur.execute("UPDATE appointments SET status = 'completed' WHERE master_telegram_id = %s AND status = 'pending'",
+                    (MASTER,))
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s AND status = 'cancelled'", (MASTER,))
+    apps = [dict(a, status='completed') if a['status'] == 'pending' else a
+            for a in history.apps if a['status'] != 'cancelled']
+
+    result = await AnalyticsService.dashboard(MASTER, TZ, 30)
+    assert result == legacy_dashboard(apps, history.today, 30)
+
+
+async def test_series_matches_python_aggregation(pg_db, history):
+    date_from, date_to = history.today - timedelta(days=45), history.today - timedelta(days=3)
+    result = await AnalyticsService.series(MASTER, date_from, date_to, 'week')
+
+    apps = [a for a in history.apps if date_from <= a['day'] <= date_to]
+    assert sum(row['total'] for row in result['series']) == len(apps)
+    assert result['totals']['completed'] == len([a for a in apps if a['status'] == 'completed'])
+    assert result['totals']['revenue'] == sum(a['price'] for a in apps if a['status'] == 'completed')
+    for row in result['series']:
+        start = date.fromisoformat(row['period'])
+        week = [a for a in apps if start <= a['day'] < start + timedelta(days=7)]
+        assert row['pending'] == len([a for a in week if a['status'] == 'pending'])
+        assert row['cancelled'] == len([a for a in week if a['status'] == 'cancelled'])
+
+
+async def test_dashboard_is_one_rpc_and_cached(db):
+    db.on('get_dashboard_stats', {
+        'completed': 2, 'cancelled': 1, 'pending': 0, 'revenue': 7000,
+        'top_services': [{'name': 'Стрижка', 'count': 2}],
+        'daily': {local_today(TZ).isoformat(): 3},
+    })
+
+    first = await AnalyticsService.dashboard(MASTER, TZ, 30)
+    assert await AnalyticsService.dashboard(MASTER, TZ, 30) == first
+    assert len(db.calls) == 1
+    assert first['kpi'] == {'revenue': 7000, 'avg_check': 3500, 'total_completed': 2}
+    assert first['daily_dynamics'][-1] == {'day': local_today(TZ).strftime('%d %b'), 'value': 3, 'is_today': True}
+    assert [d['value'] for d in first['daily_dynamics'][:-1]] == [0] * 6
+
+    # Изменение записи мастера (booking_changed) сбрасывает кэш
+    AnalyticsService.invalidate(MASTER)
+    await AnalyticsService.dashboard(MASTER, TZ, 30)
+    assert len(db.calls) == 2
+
+
+async def test_cache_counts_one_lookup_and_is_bounded(db, monkeypatch):
+    db.on('get_analytics_series', {'totals': {}, 'buckets': [], 'top_services': []})
+    day = date(2026, 5, 1)
+    hits, misses = analytics_cache.hits, analytics_cache.misses
+
+    await AnalyticsService.series(MASTER, day, day, 'day')
+    await AnalyticsService.series(MASTER, day, day, 'day')
+    assert (analytics_cache.hits - hits, analytics_cache.misses - misses) == (1, 1)
+    assert len(db.calls) == 1
+
+    # Каждый диапазон — отдельная запись кэша под общим лимитом размера
+    monkeypatch.setattr(analytics_cache, 'maxsize', 5)
+    for offset in range(20):
+        await AnalyticsService.series(MASTER, day, day + timedelta(days=offset), 'day')
+    assert len(analytics_cache) == 5
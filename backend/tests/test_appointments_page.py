@@ -0,0 +1,76 @@
+# [user-014] Постраничный список записей мастера: курсор (starts_at, id)
+import base64
+import json
+import re
+
+import pytest
+
+from conftest import MASTER_ID
+
+# 23 записи, по несколько на одно время — порядок внутри времени задает id
+ROWS = [{'id': i, 'starts_at': f'2026-05-{1 + i // 3:02d}T10:00:00+00:00', 'status': 'confirmed'}
+        for i in range(1, 24)]
+
+
+def keyset(query):
+    """Фильтр, который PostgREST применил бы к запросу list_for_master."""
+    desc = ('order', ('starts_at',), {'desc': True}) in query.ops
+    key = (lambda r: (r['starts_at'], r['id']))
+    rows = sorted(ROWS, key=key, reverse=desc)
+    condition = query.arg('or_')
+    if condition:
+        op, starts_at, aid = re.match(r'starts_at\.(\w+)\."([^"]+)",and\(starts_at\.eq\."[^"]+",id\.\w+\.(\d+)\)',
+                                      condition).groups()
+        after = (starts_at, int(aid))
+        rows = [r for r in rows if (key(r) < after if op == 'lt' else key(r) > after)]
+    return rows[:query.arg('limit')]
+
+
+def cursor_of(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_pages_cover_every_row_once(api, db, order):
+    db.on('appointments', keyset)
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 5, 'order': order}
+        if cursor:
+            params['cursor'] = cursor
+        page = api.get('/me/appointments', params=params).json()
+        seen += [r['id'] for r in page['items']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+
+    expected = sorted(ROWS, key=lambda r: (r['starts_at'], r['id']), reverse=order == 'desc')
+    assert seen == [r['id'] for r in expected]
+    assert len(db.called('appointments')) == 5
+
+
+def test_cursor_filters_by_master(api, db):
+    db.on('appointments', keyset)
+    api.get('/me/appointments', params={'limit': 5})
+    assert db.called('appointments')[0].arg('eq', 'master_telegram_id') == MASTER_ID
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    cursor_of(None),
+    cursor_of({'starts_at': '2026-05-01T10:00:00+00:00', 'id': 1}),
+    cursor_of('2026-05-01T10:00:00+00:00'),
+    cursor_of(['2026-05-01T10:00:00+00:00']),
+    cursor_of(['2026-05-01T10:00:00+00:00', 1, 2]),
+    cursor_of([1, 2]),
+    cursor_of(['2026-05-01T10:00:00+00:00', '1']),
+    cursor_of(['2026-05-01T10:00:00+00:00', True]),
+    cursor_of(['2026-05-01T10:00:00+00:00', 1.5]),
+    cursor_of(['yesterday', 1]),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_malformed_cursor_is_400(api, db, cursor):
+    response = api.get('/me/appointments', params={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.json()['detail'] == 'Invalid cursor'
+    assert not db.called('appointments')
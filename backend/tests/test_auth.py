@@ -0,0 +1,88 @@
+# [user-003] Проверка initData: кэш проверенных заголовков и срок годности auth_date
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+from app.auth import validate_telegram_data, verified_init_data
+
+
+def make_init_data(user: dict, auth_date: int = None, secret: bytes = None) -> str:
+    fields = {
+        "auth_date": str(auth_date if auth_date is not None else int(time.time())),
+        "query_id": "AAH",
+        "user": json.dumps(user),
+    }
+    check = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields["hash"] = hmac.new(secret or auth.SECRET_KEY, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_valid_init_data_returns_user_and_is_cached():
+    header = make_init_data({"id": 42, "username": "groomer"})
+    assert validate_telegram_data(header) == {"id": 42, "username": "groomer"}
+    assert len(verified_init_data) == 1
+
+    misses = verified_init_data.misses
+    assert validate_telegram_data(header)["id"] == 42
+    assert verified_init_data.misses == misses  # второй раз — из кэша
+
+
+def test_cache_hit_skips_verification(monkeypatch):
+    header = make_init_data({"id": 1})
+    validate_telegram_data(header)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("HMAC must not be recomputed for a cached header")
+    monkeypatch.setattr(auth.hmac, "new", fail)
+    assert validate_telegram_data(header) == {"id": 1}
+
+
+def test_bad_hash_is_rejected_and_not_cached():
+    header = make_init_data({"id": 1}, secret=b"other-bot")
+    with pytest.raises(HTTPException) as err:
+        validate_telegram_data(header)
+    assert err.value.status_code == 403
+    assert len(verified_init_data) == 0
+
+
+def test_expired_auth_date_is_rejected():
+    header = make_init_data({"id": 1}, auth_date=int(time.time()) - auth.INIT_DATA_MAX_AGE - 10)
+    with pytest.raises(HTTPException) as err:
+        validate_telegram_data(header)
+    assert err.value.status_code == 403
+
+
+def test_cache_entry_expires_with_auth_date():
+    # До истечения auth_date осталось ~2 секунды: запись в кэше живет не дольше
+    header = make_init_data({"id": 1}, auth_date=int(time.time()) - auth.INIT_DATA_MAX_AGE + 2)
+    validate_telegram_data(header)
+    expires_at, _ = verified_init_data._data[header]
+    assert expires_at - time.monotonic() <= 2
+
+
+@pytest.mark.benchmark
+def test_auth_overhead_with_and_without_cache(monkeypatch):
+    """Микробенчмарк: стоимость проверки заголовка на запрос с кэшем и без."""
+    header = make_init_data({"id": 1, "first_name": "A" * 50})
+    n = 2000
+
+    started = time.perf_counter()
+    for _ in range(n):
+        verified_init_data.clear()
+        validate_telegram_data(header)
+    uncached = (time.perf_counter() - started) / n
+
+    validate_telegram_data(header)
+    started = time.perf_counter()
+    for _ in range(n):
+        validate_telegram_data(header)
+    cached = (time.perf_counter() - started) / n
+
+    print(f"\nauth per request: uncached {uncached * 1e6:.1f} µs, cached {cached * 1e6:.1f} µs")
+    assert cached * 3 < uncached
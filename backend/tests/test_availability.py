@@ -0,0 +1,145 @@
+# [user-004] Расчет свободных слотов: совпадение со старым алгоритмом (перебор слот × запись)
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from app.services.availability_service import AvailabilityService, compute_free_slots
+from app.services.occupancy import DayOccupancy
+
+TZ = pytz.timezone('Asia/Almaty')
+
+
+def legacy_free_slots(target_date, schedule, slot_min, requested_duration, busy_intervals, now):
+    """Алгоритм из routers/client.py до переписывания: каждый слот против каждой записи."""
+    start_parts = list(map(int, schedule['start_time'].split(':')))
+    end_parts = list(map(int, schedule['end_time'].split(':')))
+    work_start = target_date.replace(hour=start_parts[0], minute=start_parts[1], second=0)
+    work_end = target_date.replace(hour=end_parts[0], minute=end_parts[1], second=0)
+
+    potential_slots = []
+    current = work_start
+    while current < work_end:
+        potential_slots.append(current)
+        current += timedelta(minutes=slot_min)
+
+    free_slots = []
+    for slot in potential_slots:
+        if slot <= now:
+            continue
+        requested_end = slot + timedelta(minutes=requested_duration)
+        if requested_end > work_end:
+            continue
+        if any(slot < busy_end and busy_start < requested_end for busy_start, busy_end in busy_intervals):
+            continue
+        free_slots.append(slot.isoformat())
+    return free_slots
+
+
+def random_day(rng: random.Random, bookings: int):
+    target_date = TZ.localize(datetime(2030, 3, rng.randint(1, 28)))
+    start_h = rng.randint(6, 11)
+    end_h = rng.randint(start_h + 4, 23)
+    schedule = {'start_time': f"{start_h:02d}:{rng.choice([0, 15, 30]):02d}", 'end_time': f"{end_h:02d}:00"}
+
+    occupancy = DayOccupancy(target_date)
+    intervals = []
+    for i in range(bookings):
+        start = target_date + timedelta(minutes=rng.randrange(0, 24 * 60, 5))
+        duration = rng.choice([30, 45, 50, 60, 75, 90, 120])
+        occupancy.add(i, start, duration)
+        intervals.append((start, start + timedelta(minutes=duration)))
+    return target_date, schedule, occupancy, intervals
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_matches_legacy_algorithm(seed):
+    rng = random.Random(seed)
+    target_date, schedule, occupancy, intervals = random_day(rng, bookings=rng.randint(0, 12))
+    slot_min = rng.choice([15, 30, 45, 60, 90])
+    duration = rng.choice([30, 45, 60, 75, 90, 150])
+    # «Сейчас» — до дня, в его середине или после него
+    now = target_date + timedelta(minutes=rng.choice([-600, rng.randrange(0, 24 * 60), 24 * 60 + 1]))
+
+    assert compute_free_slots(target_date, schedule, slot_min, duration, occupancy, now) == \
+        legacy_free_slots(target_date, schedule, slot_min, duration, intervals, now)
+
+
+def test_cancelled_booking_frees_its_interval():
+    target_date = TZ.localize(datetime(2030, 3, 4))
+    schedule = {'start_time': '09:00', 'end_time': '13:00'}
+    occupancy = DayOccupancy(target_date)
+    occupancy.add(1, target_date.replace(hour=10), 60)
+    occupancy.add(2, target_date.replace(hour=10, minute=30), 60)  # пересекается с первой
+    now = target_date - timedelta(days=1)
+
+    occupancy.remove(1)
+    slots = compute_free_slots(target_date, schedule, 30, 60, occupancy, now)
+    assert [s[11:16] for s in slots] == ['09:00', '09:30', '11:30', '12:00']
+
+
+@pytest.mark.anyio
+async def test_service_uses_one_rpc_and_matches_legacy(db):
+    day = (datetime.now(TZ) + timedelta(days=3)).date()
+    busy = [
+        {'id': 1, 'starts_at': TZ.localize(datetime.combine(day, datetime.min.time())).replace(hour=10).isoformat(),
+         'duration_min': 90},
+        {'id': 2, 'starts_at': TZ.localize(datetime.combine(day, datetime.min.time())).replace(hour=14, minute=15)
+            .astimezone(pytz.utc).isoformat().replace('+00:00', 'Z'), 'duration_min': None},
+    ]
+    db.on('get_availability_inputs', {
+        'master': {'timezone': 'Asia/Almaty', 'is_premium': True},
+        'services': [{'id': 5, 'duration_min': 45}],
+        'working_hours': [{'day_of_week': day.isoweekday(), 'start_time': '09:00', 'end_time': '18:00',
+                           'slot_minutes': 15}],
+        'busy': busy,
+    })
+
+    slots = await AvailabilityService.get_day(1, 5, day.isoformat())
+
+    target_date = TZ.localize(datetime.combine(day, datetime.min.time()))
+    intervals = []
+    for b in busy:
+        start = datetime.fromisoformat(b['starts_at'].replace('Z', '+00:00')).astimezone(TZ)
+        intervals.append((start, start + timedelta(minutes=b['duration_min'] or 60)))
+    expected = legacy_free_slots(target_date, {'start_time': '09:00', 'end_time': '18:00'}, 15, 45,
+                                 intervals, datetime.now(TZ))
+    assert slots == expected
+    assert [q.name for q in db.calls] == ['get_availability_inputs']
+
+    # Повторный расчет — из кэша мастера и карты занятости, без запросов
+    assert await AvailabilityService.get_day(1, 5, day.isoformat()) == expected
+    assert len(db.calls) == 1
+
+
+def test_dense_schedule_matches_legacy():
+    """Плотный день: 5-минутная сетка на 24 часа и 250 записей."""
+    rng = random.Random(1)
+    target_date, _, occupancy, intervals = random_day(rng, bookings=250)
+    schedule = {'start_time': '00:00', 'end_time': '23:55'}
+    now = target_date - timedelta(days=1)
+
+    assert compute_free_slots(target_date, schedule, 5, 60, occupancy, now) == \
+        legacy_free_slots(target_date, schedule, 5, 60, intervals, now)
+
+
+@pytest.mark.benchmark
+def test_dense_schedule_benchmark():
+    """Бенчмарк: битовая карта против старого цикла на том же плотном дне."""
+    rng = random.Random(1)
+    target_date, _, occupancy, intervals = random_day(rng, bookings=250)
+    schedule = {'start_time': '00:00', 'end_time': '23:55'}
+    now = target_date - timedelta(days=1)
+
+    started = time.perf_counter()
+    compute_free_slots(target_date, schedule, 5, 60, occupancy, now)
+    new_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    legacy_free_slots(target_date, schedule, 5, 60, intervals, now)
+    old_time = time.perf_counter() - started
+
+    print(f"\ndense day: bitmap {new_time * 1000:.2f} ms, legacy loop {old_time * 1000:.2f} ms")
+    assert new_time < old_time
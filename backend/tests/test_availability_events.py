@@ -0,0 +1,108 @@
+# [user-021] SSE-поток изменений слотов: рассылка, переполнение очереди и лимиты подписчиков
+import asyncio
+import tracemalloc
+
+import pytest
+
+from app.services.availability_events import AvailabilityBroker, RESYNC, availability_broker, sse_event
+from app.services.schedule_service import ScheduleService
+from conftest import MASTER_ID
+
+pytestmark = pytest.mark.anyio
+
+DAY = '2026-06-01'
+
+
+async def test_event_reaches_every_subscriber_of_the_topic_only():
+    broker = AvailabilityBroker(max_per_topic=2000)
+    queues = [broker.subscribe(MASTER_ID, DAY) for _ in range(1000)]
+    other_day = broker.subscribe(MASTER_ID, '2026-06-02')
+
+    broker.publish(MASTER_ID, DAY, {'type': 'taken', 'starts_at': 'x'})
+    assert all(q.get_nowait() == {'type': 'taken', 'starts_at': 'x'} for q in queues)
+    assert other_day.empty()
+
+
+async def test_slow_reader_gets_resync_instead_of_growing_queue():
+    broker = AvailabilityBroker(queue_size=4)
+    queue = broker.subscribe(MASTER_ID, DAY)
+    for i in range(10):
+        broker.publish(MASTER_ID, DAY, {'type': 'taken', 'n': i})
+
+    assert queue.qsize() <= 4
+    events = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert RESYNC in events
+    assert broker.metrics()['resyncs'] >= 1
+
+
+async def test_topic_cap():
+    broker = AvailabilityBroker(max_per_topic=3)
+    queues = [broker.subscribe(MASTER_ID, DAY) for _ in range(3)]
+    assert broker.subscribe(MASTER_ID, DAY) is None
+    # Другой день того же мастера — отдельная тема
+    assert broker.subscribe(MASTER_ID, '2026-06-02') is not None
+
+    broker.unsubscribe(MASTER_ID, DAY, queues[0])
+    assert broker.subscribe(MASTER_ID, DAY) is not None
+    assert broker.metrics()['rejected'] == 1
+
+
+async def test_global_cap_and_bookkeeping():
+    broker = AvailabilityBroker(max_subscribers=5)
+    queues = [(m, broker.subscribe(m, DAY)) for m in range(5)]
+    assert broker.subscribe(99, DAY) is None
+
+    for master, queue in queues:
+        broker.unsubscribe(master, DAY, queue)
+        broker.unsubscribe(master, DAY, queue)  # повторная отписка (finally после ошибки) безопасна
+    assert broker.metrics() | {'published': 0} == {
+        'subscribers': 0, 'topics': 0, 'published': 0, 'resyncs': 0, 'rejected': 1,
+    }
+
+
+async def test_memory_per_subscriber():
+    broker = AvailabilityBroker(max_subscribers=20000, max_per_topic=20000)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queues = [broker.subscribe(n % 50, DAY) for n in range(10000)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    per_subscriber = sum(s.size_diff for s in after.compare_to(before, 'filename')) / len(queues)
+    print(f"\n~{per_subscriber:.0f} bytes per idle subscriber")
+    # Около 3 КБ на подписчика (asyncio.Queue + учет): 5000 подписчиков — порядка 20 МБ
+    assert per_subscriber < 4096
+
+
+async def test_new_booking_is_published_as_taken_interval():
+    ScheduleService.store(MASTER_ID, profile={'timezone': 'Asia/Almaty'},
+                          services=[{'id': 1, 'duration_min': 90}])
+    queue = availability_broker.subscribe(MASTER_ID, DAY)
+
+    await availability_broker.publish_change({'id': 5, 'master_telegram_id': MASTER_ID, 'service_id': 1,
+                                              'status': 'pending', 'starts_at': '2026-06-01T05:00:00+00:00'})
+    event = queue.get_nowait()
+    assert event == {'type': 'taken', 'appointment_id': 5,
+                     'starts_at': '2026-06-01T10:00:00+05:00', 'ends_at': '2026-06-01T11:30:00+05:00'}
+    assert sse_event(event).startswith('event: taken\ndata: {')
+
+    # Подтверждение занятость не меняет
+    await availability_broker.publish_change({'id': 5, 'master_telegram_id': MASTER_ID, 'service_id': 1,
+                                              'status': 'confirmed', 'starts_at': '2026-06-01T05:00:00+00:00'})
+    assert queue.empty()
+
+
+def test_stream_over_the_topic_cap_is_refused(api, monkeypatch):
+    monkeypatch.setattr(availability_broker, 'max_per_topic', 0)
+    response = api.get(f'/masters/{MASTER_ID}/availability/stream', params={'date': DAY})
+    assert response.status_code == 503
+    assert availability_broker.metrics()['subscribers'] == 0
+
+
+async def test_subscriber_wakes_on_publish():
+    broker = AvailabilityBroker()
+    queue = broker.subscribe(MASTER_ID, DAY)
+    waiter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    broker.publish(MASTER_ID, DAY, {'type': 'released'})
+    assert await asyncio.wait_for(waiter, 1) == {'type': 'released'}
@@ -0,0 +1,40 @@
+# [user-020] Первый экран клиента одним запросом: /masters/{id}/bootstrap
+import pytest
+
+from app.services.schedule_service import ScheduleService
+from conftest import MASTER_ID
+
+PROFILE = {'salon_name': 'Salon', 'timezone': 'Asia/Almaty', 'is_premium': False}
+SERVICES = [{'id': 1, 'name': 'Стрижка', 'price': 5000, 'duration_min': 60, 'is_active': True}]
+HOURS = [{'day_of_week': d, 'start_time': '09:00:00', 'end_time': '18:00:00', 'slot_minutes': 60}
+         for d in range(1, 8)]
+
+
+@pytest.fixture
+def master(db):
+    ScheduleService.store(MASTER_ID, profile=PROFILE, services=SERVICES, hours=HOURS)
+    return db
+
+
+def test_bootstrap_returns_everything_for_the_first_service(api, master):
+    body = api.get(f'/masters/{MASTER_ID}/bootstrap', params={'days': 3}).json()
+
+    assert body['profile'] == PROFILE
+    assert body['services'] == SERVICES
+    assert body['service_id'] == 1
+    assert len(body['availability']) == 3
+    assert any(body['availability'].values())
+
+
+def test_archived_service_keeps_the_rest_of_the_payload(api, master):
+    response = api.get(f'/masters/{MASTER_ID}/bootstrap', params={'service_id': 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body['profile'], body['services']) == (PROFILE, SERVICES)
+    assert body['service_id'] is None
+    assert body['availability'] == {}
+
+
+def test_unknown_master_is_404(api, db):
+    assert api.get('/masters/404/bootstrap').status_code == 404
@@ -0,0 +1,128 @@
+# [user-025] Подтверждение/завершение/отмена пачки записей мастера одним запросом
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from postgrest.exceptions import APIError
+
+from app.routers import admin
+from app.schemas.appointment import AppointmentBulkAction
+from conftest import MASTER_ID
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    messages = []
+    monkeypatch.setattr(admin, 'send_telegram_message', lambda chat_id, text: messages.append((chat_id, text)) or True)
+    return messages
+
+
+def rows(ids, status):
+    return [{'id': i, 'master_telegram_id': MASTER_ID, 'client_telegram_id': 500 + i, 'service_id': 1,
+             'service_name': 'Стрижка', 'pet_name': 'Рекс', 'status': status,
+             'starts_at': f'2026-06-0{i}T05:00:00+00:00'} for i in ids]
+
+
+def test_bulk_confirm_is_one_rpc_and_notifies_each_client(api, db, sent):
+    db.on('set_appointments_status', lambda q: rows(q.params['p_ids'], q.params['p_status']))
+    response = api.post('/me/appointments/bulk/confirm', json={'ids': [1, 2, 2, 3]})
+
+    assert response.status_code == 200
+    assert [a['id'] for a in response.json()['updated']] == [1, 2, 3]
+    assert response.json()['skipped'] == []
+    [rpc] = db.called('set_appointments_status')
+    assert rpc.params == {'p_master_id': MASTER_ID, 'p_ids': [1, 2, 3], 'p_status': 'confirmed'}
+    assert [chat for chat, _ in sent] == [501, 502, 503]
+    assert 'Стрижка' in sent[0][1]
+
+
+def test_complete_does_not_message_clients(api, db, sent):
+    db.on('set_appointments_status', lambda q: rows(q.params['p_ids'], q.params['p_status']))
+    assert api.post('/me/appointments/4/complete').status_code == 200
+    assert sent == []
+
+
+def test_unchanged_rows_are_reported_as_skipped(api, db, sent):
+    db.on('set_appointments_status', lambda q: rows([2], q.params['p_status']))
+    response = api.post('/me/appointments/bulk/cancel', json={'ids': [1, 2, 3]})
+    assert [a['id'] for a in response.json()['updated']] == [2]
+    assert response.json()['skipped'] == [1, 3]
+    assert [chat for chat, _ in sent] == [502]
+
+
+@pytest.mark.parametrize('code', ['23505', 'BK003'])
+def test_slot_conflict_is_409(api, db, code):
+    db.on('set_appointments_status', lambda q: APIError({'code': code, 'message': 'duplicate key value'}))
+    response = api.post('/me/appointments/bulk/confirm', json={'ids': [1, 2]})
+    assert response.status_code == 409
+
+
+def test_other_database_error_is_500(api, db):
+    db.on('set_appointments_status', lambda q: APIError({'code': '57014', 'message': 'statement timeout'}))
+    assert api.post('/me/appointments/7/cancel').status_code == 500
+
+
+def test_batch_size_is_limited(api, db):
+    assert api.post('/me/appointments/bulk/confirm', json={'ids': list(range(201))}).status_code == 422
+    assert api.post('/me/appointments/bulk/confirm', json={'ids': []}).status_code == 422
+    assert not db.calls
+
+
+PG_MASTER = 910000025
+START = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=5)
+
+
+@pytest.fixture
+def pg_rows(pg, pg_db, sent):
+    with pg.conn.cursor() as cur:
+        for master in (PG_MASTER, PG_MASTER + 1):
+            cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (master,))
+            cur.execute("DELETE FROM masters WHERE telegram_id = %s", (master,))
+            cur.execute("INSERT INTO masters (telegram_id, timezone) VALUES (%s, 'Asia/Almaty')", (master,))
+
+        def add(status, offset_hours=0, master=PG_MASTER):
+            cur.execute("INSERT INTO appointments (master_telegram_id, client_telegram_id, starts_at, status,"
+                        " client_phone, pet_name) VALUES (%s, 1, %s, %s, '+7', 'Рекс') RETURNING id",
+                        (master, START + timedelta(hours=offset_hours), status))
+            return cur.fetchone()[0]
+
+        yield add
+        for master in (PG_MASTER, PG_MASTER + 1):
+            cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (master,))
+            cur.execute("DELETE FROM masters WHERE telegram_id = %s", (master,))
+
+
+async def test_set_status_changes_only_own_rows_that_differ(pg_rows):
+    pending = [pg_rows('pending', h) for h in range(3)]
+    confirmed = pg_rows('confirmed', 5)
+    foreign = pg_rows('pending', 0, master=PG_MASTER + 1)
+
+    updated = await admin._apply_status(PG_MASTER, pending + [confirmed, foreign], 'confirmed')
+    assert [a['id'] for a in updated] == pending
+    assert all(a['status'] == 'confirmed' for a in updated)
+
+
+@pytest.mark.parametrize('status, allowed', [
+    ('confirmed', {'pending'}),
+    ('completed', {'confirmed'}),
+    ('cancelled', {'pending', 'confirmed'}),
+])
+async def test_status_changes_only_from_allowed_source(pg_rows, status, allowed):
+    ids = {source: pg_rows(source, h) for h, source in enumerate(('pending', 'confirmed', 'completed', 'cancelled'))}
+
+    updated = await admin._apply_status(PG_MASTER, list(ids.values()), status)
+    assert {a['id'] for a in updated} == {ids[source] for source in allowed}
+
+
+async def test_cancelled_appointment_is_not_confirmed_again(pg, pg_rows):
+    cancelled = pg_rows('cancelled', 2)
+    pending = pg_rows('pending', 3)
+    result = await admin.bulk_update_appointments('confirm', AppointmentBulkAction(ids=[cancelled, pending]),
+                                                  user={'id': PG_MASTER})
+
+    assert [a['id'] for a in result['updated']] == [pending]
+    assert result['skipped'] == [cancelled]
+    with pg.conn.cursor() as cur:
+        cur.execute("SELECT status FROM appointments WHERE id = %s", (cancelled,))
+        assert cur.fetchone()[0] == 'cancelled'
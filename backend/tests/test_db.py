@@ -0,0 +1,124 @@
+# [user-001] Асинхронный слой репозиториев: запросы не блокируют event loop
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import uvicorn
+
+import app.db
+from app.repositories.masters import MasterRepository
+
+pytestmark = pytest.mark.anyio
+
+LATENCY = 0.02
+
+
+class PostgRESTStub:
+    """
+    Локальный HTTP-сервер вместо PostgREST (uvicorn на свободном порту): отвечает на
+    GET /rest/v1/masters с задержкой LATENCY и запоминает, сколько запросов было в работе одновременно.
+    gather > 0 — ответы задерживаются (до секунды), пока одновременно не придут gather запросов.
+    """
+
+    def __init__(self):
+        self.gather = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        self.requests.append((scope['path'], scope['query_string'].decode()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(LATENCY)
+            for _ in range(200):
+                if self.max_in_flight >= self.gather:
+                    break
+                await asyncio.sleep(0.005)
+        finally:
+            self.in_flight -= 1
+        telegram_id = int(dict(p.split('=', 1) for p in scope['query_string'].decode().split('&'))['telegram_id'][3:])
+        body = json.dumps([{'telegram_id': telegram_id}]).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+@pytest.fixture
+async def postgrest_stub(monkeypatch):
+    """Настоящий AsyncClient (init_db) поверх PostgRESTStub в отдельном потоке со своим event loop."""
+    stub = PostgRESTStub()
+    server = uvicorn.Server(uvicorn.Config(stub, host='127.0.0.1', port=0, log_level='warning', lifespan='off'))
+    thread = threading.Thread(target=server.run)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    monkeypatch.setattr(app.db, '_client', None)
+    monkeypatch.setattr(app.db, 'SUPABASE_URL', f'http://127.0.0.1:{port}')
+    monkeypatch.setattr(app.db, 'SUPABASE_KEY', 'test-key')
+    await app.db.init_db()
+    yield stub
+    await app.db.close_db()
+    server.should_exit = True
+    thread.join()
+
+
+async def _throughput(concurrency: int, requests: int = 100) -> float:
+    """Запросов в секунду при concurrency одновременных клиентах."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            assert await MasterRepository.get(i) == {'telegram_id': i}
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def test_concurrent_requests_share_one_client_without_blocking(postgrest_stub):
+    postgrest_stub.gather = 20
+    results = await asyncio.gather(*(MasterRepository.get(i) for i in range(20)))
+
+    assert results == [{'telegram_id': i} for i in range(20)]
+    # Все 20 запросов были у PostgREST одновременно: ожидание ответа не держит event loop
+    assert postgrest_stub.max_in_flight == 20
+    assert postgrest_stub.requests[0] == ('/rest/v1/masters', 'select=%2A&telegram_id=eq.0&limit=1')
+
+
+@pytest.mark.benchmark
+async def test_throughput_scales_with_concurrent_clients(postgrest_stub):
+    """Бенчмарк: запросов в секунду через AsyncClient при 1, 10 и 50 одновременных клиентах."""
+    await _throughput(10, requests=20)  # прогрев соединений
+    rps = {c: await _throughput(c) for c in (1, 10, 50)}
+    print('\nrequests/sec by concurrency:', {c: round(v) for c, v in rps.items()})
+
+    # Один запрос — одна задержка PostgREST; параллельные запросы ее перекрывают.
+    # Выше ~10 клиентов упираемся в CPU: клиент и заглушка делят один процесс (GIL)
+    assert rps[1] < 1.5 / LATENCY
+    assert rps[10] > 4 * rps[1]
+
+
+async def test_close_db_closes_storage_session():
+    class Session:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    postgrest, storage = Session(), Session()
+    app.db._client = type('Client', (), {
+        'postgrest': postgrest,
+        '_storage': type('Storage', (), {'session': storage})(),
+    })()
+
+    await app.db.close_db()
+    assert postgrest.closed and storage.closed
+    assert app.db._client is None
@@ -0,0 +1,93 @@
+# [user-019] ETag и Cache-Control публичных ответов мастера
+import pytest
+
+from app import http_cache
+from app.services import schedule_service
+from conftest import MASTER_ID
+
+PROFILE = {'salon_name': 'Salon', 'description': None, 'avatar_url': None, 'address': 'ул. Абая, 1',
+           'phone': '+7', 'timezone': 'Asia/Almaty', 'photos': [], 'is_premium': False}
+SERVICES = [{'id': 1, 'name': 'Стрижка', 'price': 5000, 'duration_min': 60, 'is_active': True}]
+HOURS = [{'day_of_week': 1, 'start_time': '09:00', 'end_time': '18:00', 'slot_minutes': 30}]
+
+PATHS = [f'/masters/{MASTER_ID}', f'/masters/{MASTER_ID}/services', f'/masters/{MASTER_ID}/schedule']
+
+
+@pytest.fixture
+def tables(db):
+    """Строки мастера в FakeDB; update() по masters/services меняет их, как сделала бы база."""
+    state = {'masters': dict(PROFILE), 'services': [dict(s) for s in SERVICES]}
+
+    def masters(q):
+        if q.arg('update'):
+            state['masters'].update(q.arg('update'))
+        return [dict(state['masters'])]
+
+    def services(q):
+        if q.arg('update'):
+            for srv in state['services']:
+                if srv['id'] == q.arg('eq', 'id'):
+                    srv.update(q.arg('update'))
+        return [dict(s) for s in state['services']]
+
+    db.on('masters', masters)
+    db.on('services', services)
+    db.on('working_hours', HOURS)
+    return state
+
+
+@pytest.mark.parametrize('path', PATHS)
+def test_revalidation_returns_empty_304(api, tables, path):
+    first = api.get(path)
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    assert first.headers['cache-control'].startswith('public, max-age=')
+
+    for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+        response = api.get(path, headers={'If-None-Match': header})
+        assert response.status_code == 304
+        assert response.content == b''
+        assert response.headers['etag'] == etag
+
+    assert api.get(path, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_schedule_tag_covers_only_public_fields(api, tables):
+    body = api.get(f'/masters/{MASTER_ID}/schedule').json()
+    assert body == [{'day_of_week': 1, 'start_time': '09:00', 'end_time': '18:00'}]
+
+
+def test_same_data_same_tag_on_every_replica(api, tables):
+    tags = [api.get(path).headers['etag'] for path in PATHS]
+    # Другая реплика — пустой кэш процесса
+    schedule_service.master_cache.clear()
+    assert [api.get(path).headers['etag'] for path in PATHS] == tags
+
+
+def test_tag_is_hashed_once_per_data_version(api, tables, monkeypatch):
+    calls = []
+    original = http_cache.etag_of
+    monkeypatch.setattr(schedule_service, 'etag_of', lambda payload: calls.append(1) or original(payload))
+    for _ in range(5):
+        api.get(f'/masters/{MASTER_ID}/services')
+    assert len(calls) == 1
+
+
+def test_profile_edit_changes_tag(api, tables):
+    etag = api.get(f'/masters/{MASTER_ID}').headers['etag']
+
+    assert api.patch('/me/profile', json={'salon_name': 'Новый салон'}).status_code == 200
+    response = api.get(f'/masters/{MASTER_ID}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()['salon_name'] == 'Новый салон'
+    assert response.headers['etag'] != etag
+
+
+def test_service_edit_changes_tag(api, tables):
+    etag = api.get(f'/masters/{MASTER_ID}/services').headers['etag']
+
+    assert api.patch('/me/services/1', json={'price': 7000}).status_code == 200
+    response = api.get(f'/masters/{MASTER_ID}/services', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()[0]['price'] == 7000
+    assert response.headers['etag'] != etag
@@ -0,0 +1,147 @@
+# [user-024] Идемпотентный POST /appointments: повтор с тем же ключом не создает вторую запись
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+
+from app.repositories.appointments import AppointmentRepository
+from app.schemas.appointment import AppointmentCreate
+from app.services.appointment_service import AppointmentService, recent_bookings, _in_flight
+from conftest import MASTER_ID
+
+pytestmark = pytest.mark.anyio
+
+TZ = pytz.timezone('Asia/Almaty')
+CLIENT = 5005
+
+
+def tomorrow(hour: int) -> datetime:
+    day = (datetime.now(TZ) + timedelta(days=2)).date()
+    return TZ.localize(datetime.combine(day, datetime.min.time()) + timedelta(hours=hour))
+
+
+def booking(key: str = 'key-1', hour: int = 10, master: int = MASTER_ID) -> AppointmentCreate:
+    return AppointmentCreate(master_telegram_id=master, service_id=1, starts_at=tomorrow(hour),
+                             client_name='Анна', client_phone='+77001234567', pet_name='Рекс',
+                             idempotency_key=key)
+
+
+@pytest.fixture
+def rpc(db):
+    """create_booking в FakeDB: новая запись на каждый вызов, с задержкой как у настоящего запроса."""
+    db.delay = 0.05
+    ids = iter(range(100, 1000))
+
+    def create_booking(q):
+        return {'id': next(ids), 'master_telegram_id': q.params['p_master_id'], 'service_id': 1,
+                'status': 'pending', 'starts_at': q.params['p_starts_at'], 'replayed': False}
+
+    db.on('create_booking', create_booking)
+    return db
+
+
+async def test_concurrent_duplicates_share_one_rpc(rpc):
+    results = await asyncio.gather(*(AppointmentService.create(booking(), CLIENT) for _ in range(10)))
+
+    assert len(rpc.called('create_booking')) == 1
+    assert {r['id'] for r in results} == {100}
+    assert sorted(r['replayed'] for r in results) == [False] + [True] * 9
+    assert not _in_flight
+
+    # Повтор после ответа — из кэша процесса, без запроса в базу
+    again = await AppointmentService.create(booking(), CLIENT)
+    assert again['id'] == 100 and again['replayed'] is True
+    assert len(rpc.called('create_booking')) == 1
+
+
+async def test_keys_are_scoped_per_client(rpc):
+    first = await AppointmentService.create(booking(), CLIENT)
+    second = await AppointmentService.create(booking(hour=12), CLIENT + 1)
+    assert first['id'] != second['id']
+    assert len(rpc.called('create_booking')) == 2
+
+
+async def test_empty_rpc_result_is_500_and_not_cached(rpc):
+    rpc.on('create_booking', None)
+    results = await asyncio.gather(*(AppointmentService.create(booking(), CLIENT) for _ in range(3)),
+                                   return_exceptions=True)
+    assert all(isinstance(r, HTTPException) and r.status_code == 500 for r in results)
+    assert recent_bookings.get((CLIENT, 'key-1')) is None
+    assert not _in_flight
+
+
+async def test_failed_attempt_can_be_retried_with_the_same_key(rpc):
+    rpc.on('create_booking', lambda q: APIError({'code': 'BK003', 'message': 'overlap'}))
+    with pytest.raises(HTTPException) as e:
+        await AppointmentService.create(booking(), CLIENT)
+    assert e.value.status_code == 409
+
+    rpc.on('create_booking', {'id': 300, 'master_telegram_id': MASTER_ID, 'status': 'pending',
+                              'starts_at': tomorrow(10).isoformat(), 'replayed': False})
+    created = await AppointmentService.create(booking(), CLIENT)
+    assert created['id'] == 300 and created['replayed'] is False
+
+
+def test_endpoint_replay_does_not_notify_master_twice(api, rpc, monkeypatch):
+    from app.routers import client
+    sent = []
+    monkeypatch.setattr(client, 'send_telegram_message', lambda chat_id, text: sent.append(chat_id) or True)
+    body = booking().model_dump(mode='json')
+
+    first = api.post('/appointments', json=body).json()
+    second = api.post('/appointments', json=body).json()
+    assert first['id'] == second['id']
+    assert (first['replayed'], second['replayed']) == (False, True)
+    assert sent == [MASTER_ID]
+
+
+PG_MASTER = 910000024
+
+
+@pytest.fixture
+def pg_master(pg, pg_db):
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (PG_MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (PG_MASTER,))
+        cur.execute("INSERT INTO masters (telegram_id, timezone) VALUES (%s, 'Asia/Almaty')", (PG_MASTER,))
+        cur.execute("INSERT INTO services (master_telegram_id, name, price, duration_min) VALUES (%s, 'Стрижка', 5000, 60)"
+                    " RETURNING id", (PG_MASTER,))
+        service_id = cur.fetchone()[0]
+        for day in range(1, 8):
+            cur.execute("INSERT INTO working_hours (master_telegram_id, day_of_week, start_time, end_time)"
+                        " VALUES (%s, %s, '09:00', '18:00')", (PG_MASTER, day))
+    yield service_id
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (PG_MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (PG_MASTER,))
+
+
+def insert_data(service_id: int, key: str, client: int = CLIENT, hour: int = 10) -> dict:
+    return {'master_telegram_id': PG_MASTER, 'client_telegram_id': client, 'service_id': service_id,
+            'starts_at': tomorrow(hour).isoformat(), 'client_name': 'Анна', 'client_phone': '+77001234567',
+            'pet_name': 'Рекс', 'idempotency_key': key}
+
+
+async def test_database_replays_parallel_duplicates(pg, pg_master):
+    # Разные реплики: кэш процесса не помогает, повтор распознает create_booking
+    results = await asyncio.gather(*(AppointmentRepository.create(insert_data(pg_master, 'pg-key')) for _ in range(8)))
+
+    assert len({r['id'] for r in results}) == 1
+    assert sorted(r['replayed'] for r in results) == [False] + [True] * 7
+    assert results[0]['service_name'] == 'Стрижка'
+    with pg.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM appointments WHERE master_telegram_id = %s", (PG_MASTER,))
+        assert cur.fetchone()[0] == 1
+
+
+async def test_database_refuses_second_key_for_the_same_slot(pg, pg_master):
+    data = insert_data(pg_master, 'first')
+    await AppointmentRepository.create(data)
+
+    with pytest.raises(HTTPException) as e:
+        await AppointmentService._create(booking('second', master=PG_MASTER).model_copy(
+            update={'service_id': pg_master}), CLIENT + 1)
+    assert e.value.status_code == 409
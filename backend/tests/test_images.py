@@ -0,0 +1,197 @@
+# [user-016] Загрузка фото: ранний 413 по размеру тела и сжатие в пуле процессов
+import asyncio
+import io
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from PIL import Image
+
+from app import images
+from app.images import ImageProcessor, UploadSizeLimit, read_upload, MAX_UPLOAD_BYTES
+from app.utils import compress_image
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = 'testboundary'
+
+
+def multipart(payload: bytes) -> bytes:
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode() + payload + f'\r\n--{BOUNDARY}--\r\n'.encode()
+    )
+
+
+def jpeg(width: int, height: int) -> bytes:
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def upload_app():
+    """Маленькое приложение с одним upload-эндпоинтом за UploadSizeLimit (лимит тела 100 КБ)."""
+    app = FastAPI()
+    app.state.handled = 0
+
+    @app.post('/upload')
+    async def upload(file: UploadFile = File(...)):
+        app.state.handled += 1
+        return {'size': len(await read_upload(file))}
+
+    return app, UploadSizeLimit(app, max_bytes=100 * 1024)
+
+
+async def test_read_upload_stops_at_the_limit():
+    small = UploadFile(io.BytesIO(b'x' * 1000))
+    assert len(await read_upload(small, max_bytes=1000)) == 1000
+
+    with pytest.raises(HTTPException) as e:
+        await read_upload(UploadFile(io.BytesIO(b'x' * 1001)), max_bytes=1000)
+    assert e.value.status_code == 413
+
+
+async def test_declared_length_is_rejected_before_the_body_is_read(upload_app):
+    app, limited = upload_app
+    sent = []
+
+    async def receive():
+        raise AssertionError('тело не должно читаться')
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': 'POST', 'path': '/upload', 'raw_path': b'/upload', 'query_string': b'',
+        'headers': [(b'content-type', f'multipart/form-data; boundary={BOUNDARY}'.encode()),
+                    (b'content-length', str(50 * 1024 * 1024).encode())],
+    }
+    await limited(scope, receive, send)
+    assert sent[0]['status'] == 413
+    assert app.state.handled == 0
+
+
+async def test_streamed_body_is_cut_off_once_over_the_limit(upload_app):
+    app, limited = upload_app
+    body = multipart(b'x' * 300 * 1024)
+    chunks_sent = 0
+
+    async def stream():
+        nonlocal chunks_sent
+        for i in range(0, len(body), 16 * 1024):
+            chunks_sent += 1
+            yield body[i:i + 16 * 1024]
+
+    transport = httpx.ASGITransport(app=limited)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        response = await client.post('/upload', content=stream(),
+                                     headers={'content-type': f'multipart/form-data; boundary={BOUNDARY}'})
+    assert response.status_code == 413
+    assert app.state.handled == 0
+    # Остаток тела не читается
+    assert chunks_sent < len(body) // (16 * 1024)
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        response = await client.post('/upload', files={'file': ('a.jpg', b'x' * 50 * 1024, 'image/jpeg')})
+    assert response.json() == {'size': 50 * 1024}
+
+
+def test_app_rejects_oversized_photo_before_auth(db):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    for path in ('/me/upload-photo', '/uploads/avatar'):
+        response = client.post(path, files={'file': ('a.jpg', b'x' * (MAX_UPLOAD_BYTES + 128 * 1024), 'image/jpeg')})
+        assert response.status_code == 413
+    # Ни проверки initData, ни запросов к базе
+    assert not db.calls
+
+
+async def test_compression_runs_in_another_process():
+    processor = ImageProcessor(workers=1, max_pending=2)
+    try:
+        assert await processor._run(os.getpid) != os.getpid()
+        result = await processor.compress(jpeg(1600, 1200), max_size=800)
+        assert max(Image.open(io.BytesIO(result)).size) == 800
+        assert processor.metrics()['processed'] == 2
+    finally:
+        processor.stop()
+
+
+async def test_busy_pool_answers_503(monkeypatch):
+    monkeypatch.setattr(images, 'IMAGE_QUEUE_TIMEOUT', 0.1)
+    processor = ImageProcessor(workers=1, max_pending=1)
+    try:
+        slow = asyncio.create_task(processor._run(time.sleep, 0.5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as e:
+            await processor._run(os.getpid)
+        assert e.value.status_code == 503
+        await slow
+        assert processor.metrics()['rejected'] == 1
+    finally:
+        processor.stop()
+
+
+async def test_loop_keeps_running_while_a_photo_compresses():
+    processor = ImageProcessor(workers=1, max_pending=2)
+    try:
+        task = asyncio.create_task(processor.compress(jpeg(4000, 3000)))
+        ticks = 0
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.001)
+        # Сжатие прямо в event loop отработало бы за один шаг задачи (ticks == 1)
+        assert ticks > 10
+        assert max(Image.open(io.BytesIO(task.result())).size) == 1024
+    finally:
+        processor.stop()
+
+
+@pytest.mark.benchmark
+async def test_event_loop_stays_responsive_while_compressing():
+    """Бенчмарк: 8 фото 12 Мп на 2 процессах против сжатия прямо в event loop."""
+    photo = jpeg(4000, 3000)
+    processor = ImageProcessor(workers=2, max_pending=8)
+    processor.start()
+    await processor._run(os.getpid)  # прогрев пула
+
+    async def max_lag(work):
+        lag = 0.0
+        done = False
+
+        async def ticker():
+            nonlocal lag
+            while not done:
+                before = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lag = max(lag, time.perf_counter() - before - 0.005)
+
+        tick = asyncio.create_task(ticker())
+        await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        await work()
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.01)  # даем тикеру заметить задержку
+        done = True
+        await tick
+        return elapsed, lag
+
+    try:
+        pooled, pooled_lag = await max_lag(lambda: asyncio.gather(*(processor.compress(photo) for _ in range(8))))
+
+        async def inline():
+            for _ in range(2):
+                compress_image(photo)
+        inline_time, inline_lag = await max_lag(inline)
+    finally:
+        processor.stop()
+
+    print(f"\n8 photos in pool: {pooled:.2f}s (max loop lag {pooled_lag * 1000:.1f} ms); "
+          f"2 photos inline: {inline_time:.2f}s (max loop lag {inline_lag * 1000:.1f} ms)")
+    assert pooled_lag < inline_lag / 2
@@ -0,0 +1,144 @@
+# [user-002] Outbox уведомлений против локального фейкового Bot API
+import asyncio
+import socket
+import time
+
+import pytest
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app import notifications
+from app.notifications import NotificationDispatcher
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = "123:test"
+
+
+class FakeBotAPI:
+    """
+    Локальный HTTP-сервер с /bot<token>/sendMessage. Ответы задаются очередью
+    script (status, body); когда она пуста — 200 OK. Все запросы пишутся в received.
+    """
+
+    def __init__(self):
+        self.script = []
+        self.received = []
+        api = FastAPI()
+
+        @api.post("/bot{token}/sendMessage")
+        async def send_message(token: str, request: Request):
+            body = await request.json()
+            self.received.append((time.monotonic(), token, body))
+            status, payload = self.script.pop(0) if self.script else (200, {"ok": True, "result": {}})
+            return JSONResponse(payload, status_code=status)
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        self._sock = sock
+        self._server = uvicorn.Server(uvicorn.Config(api, log_level="warning"))
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._server.serve(sockets=[self._sock]))
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.should_exit = True
+        await self._task
+
+
+@pytest.fixture
+async def bot_api():
+    async with FakeBotAPI() as server:
+        yield server
+
+
+@pytest.fixture
+async def dispatcher(bot_api, monkeypatch):
+    monkeypatch.setattr(notifications, "BACKOFF_BASE_SEC", 0.01)
+    monkeypatch.setattr(notifications, "PER_CHAT_INTERVAL_SEC", 0.2)
+    d = NotificationDispatcher(TOKEN, api_url=bot_api.url, workers=4, queue_size=10)
+    await d.start()
+    yield d
+    await d.stop(drain_timeout=5)
+
+
+async def test_enqueue_returns_immediately_and_delivers(dispatcher, bot_api):
+    started = time.perf_counter()
+    assert dispatcher.enqueue(1, "<b>hi</b>")
+    assert time.perf_counter() - started < 0.01
+
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+    (_, token, body), = bot_api.received
+    assert token == TOKEN
+    assert body == {"chat_id": 1, "text": "<b>hi</b>", "parse_mode": "HTML"}
+
+    metrics = dispatcher.metrics()
+    assert metrics["sent"] == 1 and metrics["queue_depth"] == 0
+    assert metrics["send_latency_ms"]["avg"] > 0
+
+
+async def test_honours_retry_after_on_429(dispatcher, bot_api):
+    bot_api.script = [(429, {"ok": False, "parameters": {"retry_after": 1}})]
+    dispatcher.enqueue(1, "x")
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+
+    first, second = bot_api.received
+    assert second[0] - first[0] >= 0.9
+    assert dispatcher.rate_limited == 1 and dispatcher.sent == 1
+
+
+async def test_persistent_429_is_dropped_after_the_cap(dispatcher, bot_api):
+    bot_api.script = [(429, {"ok": False, "parameters": {"retry_after": 0.01}})] * 10
+    dispatcher.enqueue(1, "x")
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+
+    assert len(bot_api.received) == notifications.MAX_RATE_LIMITED
+    assert dispatcher.failed == 1 and dispatcher.sent == 0
+
+
+async def test_retries_server_errors_with_backoff(dispatcher, bot_api):
+    bot_api.script = [(502, {}), (500, {})]
+    dispatcher.enqueue(1, "x")
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+
+    assert len(bot_api.received) == 3
+    assert dispatcher.retried == 2 and dispatcher.sent == 1
+
+
+async def test_client_errors_are_not_retried(dispatcher, bot_api):
+    bot_api.script = [(403, {"ok": False, "description": "bot was blocked by the user"})]
+    dispatcher.enqueue(1, "x")
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+
+    assert len(bot_api.received) == 1
+    assert dispatcher.failed == 1 and dispatcher.retried == 0
+
+
+async def test_per_chat_rate_limit(dispatcher, bot_api):
+    for i in range(3):
+        dispatcher.enqueue(7, str(i))
+    dispatcher.enqueue(8, "other chat")
+    await asyncio.wait_for(dispatcher.queue.join(), 5)
+
+    same_chat = [t for t, _, body in bot_api.received if body["chat_id"] == 7]
+    assert len(same_chat) == 3
+    assert same_chat[-1] - same_chat[0] >= 2 * 0.2 - 0.02
+    # Другой чат не ждет очереди первого
+    other = next(t for t, _, body in bot_api.received if body["chat_id"] == 8)
+    assert other - same_chat[0] < 0.2
+
+
+async def test_full_queue_drops_instead_of_blocking(bot_api):
+    d = NotificationDispatcher(TOKEN, api_url=bot_api.url, workers=1, queue_size=2)
+    assert d.enqueue(1, "a") and d.enqueue(1, "b")
+    assert not d.enqueue(1, "c")
+    assert d.metrics()["dropped"] == 1
@@ -0,0 +1,142 @@
+# [user-018] Фото по хешу содержимого: повторная загрузка и уборка неиспользуемых объектов
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from PIL import Image
+from storage3.exceptions import StorageApiError
+
+from app.images import image_processor
+from app.services.photo_service import PhotoService, content_id
+
+pytestmark = pytest.mark.anyio
+
+MASTER = 42
+PUBLIC = 'https://project.supabase.co/storage/v1/object/public/avatars/'
+
+
+class FakeBucket:
+    """Бакет Storage в памяти: path -> {'content', 'created_at', 'updated_at'}; now — управляемые часы."""
+
+    def __init__(self):
+        self.objects = {}
+        self.now = datetime.now(timezone.utc)
+        self.uploads = []
+
+    async def upload(self, path, file, file_options):
+        self.uploads.append(path)
+        stamp = self.now.isoformat()
+        if path in self.objects and file_options.get('upsert') != 'true':
+            raise StorageApiError('The resource already exists', 'Duplicate', 409)
+        created = self.objects.get(path, {}).get('created_at', stamp)
+        self.objects[path] = {'content': file, 'created_at': created, 'updated_at': stamp}
+
+    async def download(self, path):
+        if path not in self.objects:
+            raise StorageApiError('Object not found', 'not_found', 400)
+        return self.objects[path]['content']
+
+    async def get_public_url(self, path):
+        return PUBLIC + path
+
+    async def list(self, prefix, options=None):
+        prefix = f"{prefix}/" if prefix else ''
+        entries = {}
+        for path, obj in self.objects.items():
+            if not path.startswith(prefix):
+                continue
+            name, _, rest = path[len(prefix):].partition('/')
+            if rest:
+                entries[name] = {'name': name, 'id': None}
+            else:
+                entries[name] = {'name': name, 'id': path, 'created_at': obj['created_at'],
+                                 'updated_at': obj['updated_at']}
+        offset = (options or {}).get('offset', 0)
+        return list(entries.values())[offset:offset + (options or {}).get('limit', 1000)]
+
+    async def remove(self, paths):
+        for path in paths:
+            self.objects.pop(path, None)
+
+
+class FakeStorage:
+    def __init__(self):
+        self.bucket = FakeBucket()
+
+    def from_(self, name):
+        return self.bucket
+
+
+@pytest.fixture
+def bucket(db):
+    db.storage = FakeStorage()
+    yield db.storage.bucket
+    image_processor.stop()
+
+
+def photo_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (1200, 900), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def master_row(db, photos=None, avatar_url=None):
+    db.on('masters', [{'photos': photos or [], 'avatar_url': avatar_url}])
+
+
+async def test_repeat_upload_reuses_manifest(bucket):
+    image = photo_bytes('red')
+    first = await PhotoService.upload(MASTER, image)
+    uploads = len(bucket.uploads)
+
+    again = await PhotoService.upload(MASTER, image)
+    assert again == first
+    assert first['id'] == content_id(image)
+    # Повтор: без сжатия и загрузки вариантов, только перезапись манифеста
+    assert bucket.uploads[uploads:] == [f"{MASTER}/{first['id']}/manifest.json"]
+    assert [v['w'] for v in first['variants']] == [128, 384, 1024]
+
+
+async def test_repeat_upload_protects_old_photo_from_sweep(db, bucket):
+    image = photo_bytes('green')
+    bucket.now -= timedelta(days=3)
+    photo = await PhotoService.upload(MASTER, image)
+    forgotten = await PhotoService.upload(MASTER, photo_bytes('blue'))
+
+    # Через три дня мастер снова выбирает то же фото, но профиль еще не сохранил
+    bucket.now += timedelta(days=3)
+    assert await PhotoService.upload(MASTER, image) == photo
+
+    master_row(db)
+    removed = await PhotoService.sweep(MASTER, grace=timedelta(hours=24))
+    left = {path.split('/')[1] for path in bucket.objects}
+    assert left == {photo['id']}
+    assert removed == len([p for p in bucket.uploads if forgotten['id'] in p])
+
+
+async def test_repeat_avatar_upload_refreshes_timestamp(db, bucket):
+    image = photo_bytes('white')
+    bucket.now -= timedelta(days=3)
+    url = await PhotoService.upload_avatar(MASTER, image)
+    bucket.now += timedelta(days=3)
+    assert await PhotoService.upload_avatar(MASTER, image) == url
+
+    master_row(db)
+    assert await PhotoService.sweep(MASTER, grace=timedelta(hours=24)) == 0
+    assert url.removeprefix(PUBLIC) in bucket.objects
+
+
+async def test_sweep_keeps_referenced_and_fresh_objects(db, bucket):
+    bucket.now -= timedelta(days=3)
+    kept = await PhotoService.upload(MASTER, photo_bytes('black'))
+    stale = await PhotoService.upload(MASTER, photo_bytes('yellow'))
+    stale_avatar = await PhotoService.upload_avatar(MASTER, photo_bytes('gray'))
+    bucket.now += timedelta(days=3)
+    fresh = await PhotoService.upload(MASTER, photo_bytes('purple'))
+
+    master_row(db, photos=[kept])
+    await PhotoService.sweep(MASTER, grace=timedelta(hours=24))
+    folders = {path.split('/')[1] for path in bucket.objects}
+    assert folders == {kept['id'], fresh['id']}
+    assert stale['id'] not in folders
+    assert stale_avatar.removeprefix(PUBLIC) not in bucket.objects
@@ -0,0 +1,63 @@
+# [user-010] Таймеры напоминаний: сверка не опережает таймер, который еще не сработал
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import reminders
+from app.reminders import REMINDERS_BY_KIND, ReminderScheduler, process_reminder_batch
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def appointments(db, monkeypatch):
+    """Подтвержденные записи в FakeDB; claim_due_reminders ставит флаг, как SQL-функция."""
+    now = datetime.now(timezone.utc)
+    rows = {
+        # Таймер 5h уже должен был сработать (до начала меньше 5 часов)
+        'overdue': {'id': 1, 'starts_at': (now + timedelta(hours=4, minutes=50)).isoformat()},
+        # Таймер 5h сработает через 20 минут
+        'upcoming': {'id': 2, 'starts_at': (now + timedelta(hours=5, minutes=20)).isoformat()},
+    }
+    for appt in rows.values():
+        appt.update(status='confirmed', client_telegram_id=500 + appt['id'],
+                    reminder_5h_sent=False, reminder_1h_sent=False)
+
+    def claim(q):
+        flag = f"reminder_{q.params['p_kind']}_sent"
+        lo, hi = (datetime.fromisoformat(q.params[p]) for p in ('p_from', 'p_to'))
+        claimed = [a for a in rows.values()
+                   if lo <= datetime.fromisoformat(a['starts_at']) <= hi and not a[flag]
+                   and (q.params['p_ids'] is None or a['id'] in q.params['p_ids'])]
+        for appt in claimed:
+            appt[flag] = True
+        return [dict(a) for a in claimed]
+
+    db.on('claim_due_reminders', claim)
+    db.on('appointments', lambda q: [dict(a) for a in rows.values()])
+    monkeypatch.setattr(reminders, 'send_telegram_message', lambda chat_id, text: True)
+    return rows
+
+
+def claimed_ids(db) -> list:
+    return [(q.params['p_kind'], q.params['p_ids']) for q in db.called('claim_due_reminders')]
+
+
+async def test_sweep_does_not_claim_before_the_timer(db, appointments):
+    scheduler = ReminderScheduler()
+    await scheduler.reconcile()
+
+    assert appointments['overdue']['reminder_5h_sent']
+    assert not appointments['upcoming']['reminder_5h_sent']
+    assert not appointments['upcoming']['reminder_1h_sent']
+    # Напоминание второй записи уйдет по таймеру
+    assert (2, '5h') in scheduler._planned
+
+
+async def test_timer_claims_its_record_when_it_fires(db, appointments):
+    fire_at = datetime.fromisoformat(appointments['upcoming']['starts_at']) - timedelta(hours=5)
+    await process_reminder_batch(REMINDERS_BY_KIND['5h'], fire_at, [2])
+
+    assert appointments['upcoming']['reminder_5h_sent']
+    assert not appointments['overdue']['reminder_5h_sent']
+    assert claimed_ids(db) == [('5h', [2])]
@@ -0,0 +1,122 @@
+# [user-009] Захват напоминаний: несколько планировщиков против одной Postgres — каждое уходит один раз
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import reminders
+from app.reminders import check_reminders
+
+pytestmark = pytest.mark.anyio
+
+MASTER = 910000001
+
+
+@pytest.fixture
+def appointments(pg):
+    """Мастер, услуга и записи вокруг окон напоминаний; после теста все удаляется."""
+    now = datetime.now(timezone.utc)
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (MASTER,))
+        cur.execute("INSERT INTO masters (telegram_id, salon_name, timezone) VALUES (%s, 'Salon', 'Asia/Almaty')",
+                    (MASTER,))
+        cur.execute("INSERT INTO services (master_telegram_id, name, price) VALUES (%s, 'Стрижка', 5000) RETURNING id",
+                    (MASTER,))
+        service_id = cur.fetchone()[0]
+
+        def add(offset: timedelta, status='confirmed', flag_5h=False, flag_1h=False):
+            cur.execute(
+                "INSERT INTO appointments (master_telegram_id, client_telegram_id, service_id, starts_at, status,"
+                " client_phone, pet_name, reminder_5h_sent, reminder_1h_sent)"
+                " VALUES (%s, %s, %s, %s, %s, '+7', 'Рекс', %s, %s) RETURNING id",
+                (MASTER, 800000000, service_id, now + offset, status, flag_5h, flag_1h),
+            )
+            return cur.fetchone()[0]
+
+        rows = {
+            # Окно 5h: 4.5–5.5 часа до начала; сверка берет только просроченные (не дальше 5 часов)
+            'due_5h': [add(timedelta(hours=5, minutes=m)) for m in range(-25, 1)],
+            'timer_5h': [add(timedelta(hours=5, minutes=m)) for m in range(1, 30)],
+            'due_1h': [add(timedelta(minutes=60 + m)) for m in range(-5, 1)],
+            'timer_1h': [add(timedelta(minutes=60 + m)) for m in range(1, 25)],
+            'too_early': add(timedelta(hours=6)),
+            'between': add(timedelta(hours=3)),
+            'cancelled': add(timedelta(hours=5, seconds=10), status='cancelled'),
+            'pending': add(timedelta(hours=5, seconds=20), status='pending'),
+            'already_sent': add(timedelta(hours=5, seconds=30), flag_5h=True),
+        }
+    yield rows
+    with pg.conn.cursor() as cur:
+        cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (MASTER,))
+        cur.execute("DELETE FROM masters WHERE telegram_id = %s", (MASTER,))
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    messages = []
+    monkeypatch.setattr(reminders, 'send_telegram_message', lambda chat_id, text: messages.append(text) or True)
+    return messages
+
+
+async def test_concurrent_schedulers_send_each_reminder_once(pg_db, appointments, sent):
+    claimed = []
+    original = reminders.AppointmentRepository.claim_due_reminders
+
+    async def spy(*args, **kwargs):
+        rows = await original(*args, **kwargs)
+        claimed.extend((args[0], row['id']) for row in rows)
+        return rows
+
+    reminders.AppointmentRepository.claim_due_reminders = spy
+    try:
+        # 8 воркеров/реплик проверяют окна одновременно, и еще раз — повторный тик
+        await asyncio.gather(*(check_reminders() for _ in range(8)))
+        await asyncio.gather(*(check_reminders() for _ in range(8)))
+    finally:
+        reminders.AppointmentRepository.claim_due_reminders = original
+
+    assert len(claimed) == len(set(claimed))
+    assert sorted(i for kind, i in claimed if kind == '5h') == sorted(appointments['due_5h'])
+    assert sorted(i for kind, i in claimed if kind == '1h') == sorted(appointments['due_1h'])
+    assert len(sent) == len(appointments['due_5h']) + len(appointments['due_1h'])
+
+
+async def test_claim_respects_window_status_and_flags(pg, pg_db, appointments):
+    now = datetime.now(timezone.utc)
+    rows = await reminders.AppointmentRepository.claim_due_reminders(
+        '5h', (now + timedelta(hours=4.5)).isoformat(), (now + timedelta(hours=5.5)).isoformat()
+    )
+    ids = {row['id'] for row in rows}
+    assert ids == set(appointments['due_5h'] + appointments['timer_5h'])
+    for skipped in ('too_early', 'between', 'cancelled', 'pending', 'already_sent'):
+        assert appointments[skipped] not in ids
+
+    row = next(r for r in rows if r['id'] == appointments['due_5h'][0])
+    assert (row['service_name'], row['salon_name'], row['timezone']) == ('Стрижка', 'Salon', 'Asia/Almaty')
+
+    with pg.conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM appointments WHERE id = ANY(%s) AND reminder_5h_sent",
+                    (appointments['due_5h'] + appointments['timer_5h'],))
+        assert cur.fetchone()[0] == len(appointments['due_5h'] + appointments['timer_5h'])
+
+
+async def test_claim_by_ids_only_takes_those_rows(pg_db, appointments):
+    now = datetime.now(timezone.utc)
+    wanted = appointments['due_1h'][:3]
+    rows = await reminders.AppointmentRepository.claim_due_reminders(
+        '1h', (now + timedelta(minutes=54)).isoformat(), (now + timedelta(minutes=90)).isoformat(), wanted
+    )
+    assert sorted(r['id'] for r in rows) == sorted(wanted)
+
+
+async def test_failed_enqueue_releases_the_claim(pg, pg_db, appointments, monkeypatch, db=None):
+    monkeypatch.setattr(reminders, 'send_telegram_message', lambda chat_id, text: False)
+    released = []
+
+    async def mark_many(ids, data):
+        released.extend(ids)
+    monkeypatch.setattr(reminders.AppointmentRepository, 'mark_many', mark_many)
+
+    await reminders.process_reminder_batch(reminders.REMINDERS_BY_KIND['5h'], datetime.now(timezone.utc))
+    assert sorted(released) == sorted(appointments['due_5h'])
@@ -0,0 +1,190 @@
+# [user-012] Дневная сводка аналитики: триггер, пересчет и смена таймзоны
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import MASTER_ID
+
+MASTER = 910000012
+OTHER = 910000013
+BASE = datetime(2026, 3, 1, 6, 0, tzinfo=timezone.utc)
+
+
+def stats(cur, master=MASTER) -> dict:
+    cur.execute("SELECT day, pending, confirmed, completed, cancelled, revenue FROM master_daily_stats"
+                " WHERE master_telegram_id = %s AND (pending, confirmed, completed, cancelled, revenue) <> (0, 0, 0, 0, 0)"
+                " ORDER BY day", (master,))
+    days = {row[0]: tuple(row[1:5]) + (float(row[5]),) for row in cur.fetchall()}
+    cur.execute("SELECT day, service_id, completed FROM master_daily_service_stats"
+                " WHERE master_telegram_id = %s AND completed <> 0 ORDER BY 1, 2", (master,))
+    return {'days': days, 'services': cur.fetchall()}
+
+
+@pytest.fixture
+def cur(pg):
+    with pg.conn.cursor() as cur:
+        for master in (MASTER, OTHER):
+            cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (master,))
+            cur.execute("DELETE FROM masters WHERE telegram_id = %s", (master,))
+            cur.execute("INSERT INTO masters (telegram_id, timezone) VALUES (%s, 'Asia/Almaty')", (master,))
+        yield cur
+        for master in (MASTER, OTHER):
+            cur.execute("DELETE FROM appointments WHERE master_telegram_id = %s", (master,))
+            cur.execute("DELETE FROM masters WHERE telegram_id = %s", (master,))
+
+
+def add_service(cur, price, master=MASTER) -> int:
+    cur.execute("INSERT INTO services (master_telegram_id, name, price) VALUES (%s, 'Стрижка', %s) RETURNING id",
+                (master, price))
+    return cur.fetchone()[0]
+
+
+def add_appointment(cur, service_id, starts_at, status='pending', master=MASTER) -> int:
+    cur.execute("INSERT INTO appointments (master_telegram_id, client_telegram_id, service_id, starts_at, status,"
+                " client_phone, pet_name) VALUES (%s, 1, %s, %s, %s, '+7', 'Рекс') RETURNING id",
+                (master, service_id, starts_at, status))
+    return cur.fetchone()[0]
+
+
+def test_price_change_after_completion_does_not_drift(cur):
+    service = add_service(cur, 5000)
+    appt = add_appointment(cur, service, BASE)
+    cur.execute("UPDATE appointments SET status = 'completed' WHERE id = %s", (appt,))
+    assert stats(cur)['days'][BASE.date()] == (0, 0, 1, 0, 5000.0)
+
+    # Цена выросла уже после визита: выручка дня не меняется, а отмена вычитает старую цену
+    cur.execute("UPDATE services SET price = 8000 WHERE id = %s", (service,))
+    cur.execute("UPDATE appointments SET status = 'confirmed' WHERE id = %s", (appt,))
+    assert stats(cur)['days'][BASE.date()] == (0, 1, 0, 0, 0.0)
+
+    # Повторное завершение — по цене на этот момент
+    cur.execute("UPDATE appointments SET status = 'completed' WHERE id = %s", (appt,))
+    assert stats(cur)['days'][BASE.date()] == (0, 0, 1, 0, 8000.0)
+    cur.execute("UPDATE services SET price = 100 WHERE id = %s", (service,))
+    before = stats(cur)
+    cur.execute("SELECT rebuild_master_daily_stats(%s)", (MASTER,))
+    assert stats(cur) == before
+
+
+def test_rebuild_matches_incremental_rollup(cur):
+    rng = random.Random(12)
+    services = [add_service(cur, price) for price in (1500, 3000, 5000)]
+    ids = [add_appointment(cur, rng.choice(services + [None]), BASE + timedelta(hours=7 * i)) for i in range(150)]
+    for _ in range(300):
+        appt = rng.choice(ids)
+        op = rng.random()
+        if op < 0.6:
+            cur.execute("UPDATE appointments SET status = %s WHERE id = %s",
+                        (rng.choice(['pending', 'confirmed', 'completed', 'cancelled']), appt))
+        elif op < 0.8:
+            cur.execute("UPDATE services SET price = %s WHERE id = %s", (rng.randrange(1000, 9000, 500), rng.choice(services)))
+        else:
+            # Перенос на свободное время (вне сетки 7 часов)
+            cur.execute("UPDATE appointments SET starts_at = starts_at + interval '1 minute' WHERE id = %s", (appt,))
+
+    incremental = stats(cur)
+    cur.execute("SELECT rebuild_master_daily_stats(%s)", (MASTER,))
+    assert stats(cur) == incremental
+    assert incremental['days']
+
+
+def test_deleting_master_cascades_through_the_trigger(cur):
+    service = add_service(cur, 5000)
+    for i in range(5):
+        add_appointment(cur, service, BASE + timedelta(hours=i), status='completed')
+
+    cur.execute("DELETE FROM masters WHERE telegram_id = %s", (MASTER,))
+    cur.execute("SELECT count(*) FROM master_daily_stats WHERE master_telegram_id = %s", (MASTER,))
+    assert cur.fetchone()[0] == 0
+
+
+def test_rebuild_locks_only_its_master(pg, cur):
+    add_appointment(cur, add_service(cur, 5000), BASE)
+    add_appointment(cur, add_service(cur, 5000, OTHER), BASE, master=OTHER)
+
+    # Параллельная create_booking мастера MASTER держит его advisory-ключ
+    booking = pg.connect()
+    booking_cur = booking.cursor()
+    booking_cur.execute("SELECT pg_advisory_xact_lock(%s)", (MASTER,))
+
+    def rebuild(master, done):
+        conn = pg.connect()
+        conn.autocommit = True
+        with conn.cursor() as c:
+            c.execute("SET lock_timeout = '5s'")
+            c.execute("SELECT rebuild_master_daily_stats(%s)", (master,))
+        conn.close()
+        done.set()
+
+    other_done, master_done = threading.Event(), threading.Event()
+    threading.Thread(target=rebuild, args=(OTHER, other_done)).start()
+    assert other_done.wait(5)
+
+    threading.Thread(target=rebuild, args=(MASTER, master_done)).start()
+    assert not master_done.wait(0.3)
+    booking.rollback()
+    assert master_done.wait(5)
+    booking.close()
+    assert stats(cur)['days'][BASE.date()] == (1, 0, 0, 0, 0.0)
+
+
+def test_status_change_during_rebuild_is_counted_once(pg, cur):
+    service = add_service(cur, 5000)
+    appts = [add_appointment(cur, service, BASE + timedelta(hours=i)) for i in range(3)]
+
+    # Пересчет держит ключ мастера до коммита; смена статуса ждет его
+    rebuild = pg.connect()
+    rebuild_cur = rebuild.cursor()
+    rebuild_cur.execute("SELECT rebuild_master_daily_stats(%s)", (MASTER,))
+
+    def complete(done):
+        conn = pg.connect()
+        conn.autocommit = True
+        with conn.cursor() as c:
+            c.execute("SET lock_timeout = '5s'")
+            c.execute("UPDATE appointments SET status = 'completed' WHERE id = ANY(%s)", (appts,))
+        conn.close()
+        done.set()
+
+    done = threading.Event()
+    threading.Thread(target=complete, args=(done,)).start()
+    assert not done.wait(0.3)
+    rebuild.commit()
+    assert done.wait(5)
+    rebuild.close()
+
+    assert stats(cur)['days'][BASE.date()] == (0, 0, 3, 0, 15000.0)
+    before = stats(cur)
+    cur.execute("SELECT rebuild_master_daily_stats(%s)", (MASTER,))
+    assert stats(cur) == before
+
+
+def test_set_master_timezone_moves_days(cur):
+    # 20:00 UTC — уже следующий день в Алматы, но тот же день в Лиссабоне
+    add_appointment(cur, add_service(cur, 5000), BASE.replace(hour=20))
+    assert list(stats(cur)['days']) == [BASE.date() + timedelta(days=1)]
+
+    cur.execute("SELECT set_master_timezone(%s, 'Europe/Lisbon')", (MASTER,))
+    assert list(stats(cur)['days']) == [BASE.date()]
+    cur.execute("SELECT timezone FROM masters WHERE telegram_id = %s", (MASTER,))
+    assert cur.fetchone()[0] == 'Europe/Lisbon'
+
+
+def test_timezone_change_goes_through_one_rpc(api, db):
+    db.on('masters', lambda q: [{'telegram_id': MASTER_ID, 'timezone': 'Asia/Almaty'}])
+    response = api.patch('/me/profile', json={'timezone': 'Europe/Lisbon'})
+
+    assert response.status_code == 200
+    [rpc] = db.called('set_master_timezone')
+    assert rpc.params == {'p_master_id': MASTER_ID, 'p_timezone': 'Europe/Lisbon'}
+
+
+def test_failed_timezone_change_is_reported_and_profile_untouched(api, db):
+    db.on('masters', lambda q: [{'telegram_id': MASTER_ID, 'timezone': 'Asia/Almaty'}])
+    db.on('set_master_timezone', lambda q: RuntimeError('statement timeout'))
+    response = api.patch('/me/profile', json={'timezone': 'Europe/Lisbon', 'salon_name': 'Новый'})
+
+    assert response.status_code == 500
+    assert not [q for q in db.called('masters') if q.arg('update')]
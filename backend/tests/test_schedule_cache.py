@@ -0,0 +1,38 @@
+# [user-006] Кэш профиля/услуг/графика: публичные чтения из кэша, кабинет мастера — из базы
+from conftest import MASTER_ID
+
+SERVICES = [{'id': 1, 'name': 'Стрижка', 'price': 5000, 'duration_min': 60, 'is_active': True}]
+HOURS = [{'day_of_week': 1, 'start_time': '09:00', 'end_time': '18:00', 'slot_minutes': 30}]
+
+
+def test_public_services_are_read_once(api, db):
+    db.on('services', SERVICES)
+    for _ in range(3):
+        assert api.get(f'/masters/{MASTER_ID}/services').json() == SERVICES
+    assert len(db.called('services')) == 1
+
+
+def test_admin_reads_bypass_the_cache(api, db):
+    db.on('services', SERVICES)
+    db.on('working_hours', HOURS)
+    api.get(f'/masters/{MASTER_ID}/services')
+    api.get(f'/masters/{MASTER_ID}/schedule')
+
+    # Правка пришла на другую реплику: в базе уже новые данные, локальный кэш о них не знает
+    edited = [{**SERVICES[0], 'price': 7000}]
+    db.on('services', edited)
+    db.on('working_hours', [{**HOURS[0], 'end_time': '20:00'}])
+
+    assert api.get('/me/services').json() == edited
+    assert api.get('/me/working-hours').json()[0]['end_time'] == '20:00'
+    # Свежие данные заодно обновили кэш этой реплики
+    assert api.get(f'/masters/{MASTER_ID}/services').json() == edited
+
+
+def test_admin_write_invalidates_public_cache(api, db):
+    db.on('services', SERVICES)
+    api.get(f'/masters/{MASTER_ID}/services')
+
+    db.on('services', lambda q: [{**SERVICES[0], 'name': 'Мытье'}])
+    assert api.patch('/me/services/1', json={'name': 'Мытье'}).status_code == 200
+    assert api.get(f'/masters/{MASTER_ID}/services').json()[0]['name'] == 'Мытье'
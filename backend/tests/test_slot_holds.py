@@ -0,0 +1,194 @@
+# [user-022] Бронь слота на время заполнения формы: конкуренция клиентов и события SSE
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from fastapi import HTTPException
+
+from app.schemas.appointment import AppointmentCreate
+from app.services.appointment_service import AppointmentService
+from app.services.availability_events import availability_broker
+from app.services.availability_service import AvailabilityService
+from app.services.schedule_service import ScheduleService
+from app.services.slot_holds import SlotHoldStore, slot_holds
+from conftest import MASTER_ID
+
+pytestmark = pytest.mark.anyio
+
+TZ = pytz.timezone('Asia/Almaty')
+DAY = (datetime.now(TZ) + timedelta(days=3)).date()
+ALICE, BOB = 1001, 1002
+
+
+def at(hour: int, minute: int = 0) -> datetime:
+    return TZ.localize(datetime.combine(DAY, datetime.min.time()) + timedelta(hours=hour, minutes=minute))
+
+
+@pytest.fixture
+def master(db):
+    """Профиль, услуга на час и график 09:00–18:00 в кэше мастера; записей в базе нет."""
+    ScheduleService.store(
+        MASTER_ID,
+        profile={'timezone': 'Asia/Almaty', 'is_premium': False},
+        services=[{'id': 1, 'duration_min': 60}],
+        hours=[{'day_of_week': d, 'start_time': '09:00:00', 'end_time': '18:00:00', 'slot_minutes': 30}
+               for d in range(1, 8)],
+    )
+
+    def create_booking(q):
+        return {'id': 77, 'master_telegram_id': MASTER_ID, 'service_id': 1, 'status': 'pending',
+                'client_telegram_id': q.params['p_client_id'], 'starts_at': q.params['p_starts_at']}
+
+    db.on('create_booking', create_booking)
+    return db
+
+
+def booking(starts_at: datetime) -> AppointmentCreate:
+    return AppointmentCreate(master_telegram_id=MASTER_ID, service_id=1, starts_at=starts_at,
+                             client_name='Анна', client_phone='+77001234567', pet_name='Рекс')
+
+
+async def slots(client_id: int) -> list:
+    return await AvailabilityService.get_day(MASTER_ID, 1, DAY.isoformat(), client_id)
+
+
+async def test_second_client_gets_409_and_does_not_see_the_slot(master):
+    await AvailabilityService.hold(MASTER_ID, 1, at(10), ALICE)
+
+    for start in (at(10), at(10, 30), at(9, 30)):
+        with pytest.raises(HTTPException) as e:
+            await AvailabilityService.hold(MASTER_ID, 1, start, BOB)
+        assert e.value.status_code == 409
+
+    assert at(10).isoformat() in await slots(ALICE)
+    bob_sees = await slots(BOB)
+    assert not {at(9, 30).isoformat(), at(10).isoformat(), at(10, 30).isoformat()} & set(bob_sees)
+    assert at(11).isoformat() in bob_sees
+
+
+async def test_simultaneous_holds_only_one_wins(master):
+    results = await asyncio.gather(
+        *(AvailabilityService.hold(MASTER_ID, 1, at(12), client) for client in range(2000, 2020)),
+        return_exceptions=True,
+    )
+    assert len([r for r in results if isinstance(r, dict)]) == 1
+    assert all(r.status_code == 409 for r in results if isinstance(r, HTTPException))
+
+
+async def test_held_time_is_refused_without_a_database_call(master):
+    await AvailabilityService.hold(MASTER_ID, 1, at(14), ALICE)
+    with pytest.raises(HTTPException) as e:
+        await AppointmentService.create(booking(at(14, 30)), BOB)
+    assert e.value.status_code == 409
+    assert not master.called('create_booking')
+
+
+async def test_booking_consumes_the_hold_with_released_then_taken(master):
+    queue = availability_broker.subscribe(MASTER_ID, DAY.isoformat())
+    await AvailabilityService.hold(MASTER_ID, 1, at(15), ALICE)
+    # Клиент передумал и записался на другое время
+    await AppointmentService.create(booking(at(16)), ALICE)
+
+    events = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert [(e['type'], e.get('hold', False), e['starts_at']) for e in events] == [
+        ('taken', True, at(15).isoformat()),
+        ('released', True, at(15).isoformat()),
+        ('taken', False, at(16).isoformat()),
+    ]
+    assert slot_holds.metrics()['active'] == 0
+    assert slot_holds.metrics()['consumed'] == 1
+    assert at(15).isoformat() in await slots(BOB)
+
+
+async def test_expired_hold_is_released(master, monkeypatch):
+    monkeypatch.setattr(slot_holds, 'ttl', 0.05)
+    queue = availability_broker.subscribe(MASTER_ID, DAY.isoformat())
+    await AvailabilityService.hold(MASTER_ID, 1, at(11), ALICE)
+    await asyncio.sleep(0.1)
+
+    # released приходит по таймеру, без обращений к слотам мастера
+    assert [e['type'] for e in (queue.get_nowait(), queue.get_nowait())] == ['taken', 'released']
+    assert slot_holds.metrics() | {'placed': 0} == {'active': 0, 'placed': 0, 'conflicts': 0,
+                                                     'consumed': 0, 'expired': 1}
+    assert at(11).isoformat() in await slots(BOB)
+
+
+async def test_new_hold_replaces_the_previous_one(master):
+    await AvailabilityService.hold(MASTER_ID, 1, at(9), ALICE)
+    await AvailabilityService.hold(MASTER_ID, 1, at(13), ALICE)
+    assert slot_holds.metrics()['active'] == 1
+    await AvailabilityService.hold(MASTER_ID, 1, at(9), BOB)
+
+
+def test_store_limit():
+    store = SlotHoldStore(max_holds=2)
+    start = at(9)
+    for client in range(3):
+        hold = store.place(MASTER_ID, client, start + timedelta(hours=client), start + timedelta(hours=client + 1), 'd')
+        assert (hold is None) == (client == 2)
+
+
+async def test_booking_race_with_and_without_holds(master):
+    """
+    Нагрузка: 50 клиентов одновременно записываются на одно время через AppointmentService.create.
+    Без броней все доходят до базы, и 49 узнают о конфликте только после заполнения формы;
+    с бронями проигравшие получают 409 при выборе слота, а в базу уходит один запрос.
+    """
+    from postgrest.exceptions import APIError
+
+    master.delay = 0.01  # задержка запроса к базе
+    taken = set()
+
+    def create_booking(q):
+        # Как idx_unique_slot: второе бронирование того же времени — 23505
+        if q.params['p_starts_at'] in taken:
+            return APIError({'code': '23505', 'message': 'duplicate key value violates unique constraint'})
+        taken.add(q.params['p_starts_at'])
+        return {'id': 77, 'master_telegram_id': MASTER_ID, 'service_id': 1, 'status': 'pending',
+                'client_telegram_id': q.params['p_client_id'], 'starts_at': q.params['p_starts_at']}
+
+    master.on('create_booking', create_booking)
+
+    async def race(clients: int, with_holds: bool) -> dict:
+        taken.clear()
+        master.calls.clear()
+        start = at(12) + timedelta(days=int(with_holds))
+        outcome = {'booked': 0, 'hold_conflicts': 0, 'booking_conflicts': 0}
+        latencies = []
+
+        async def booker(client_id: int):
+            began = time.perf_counter()
+            try:
+                if with_holds:
+                    await AvailabilityService.hold(MASTER_ID, 1, start, client_id)
+                    await asyncio.sleep(0)  # клиент заполняет форму
+                try:
+                    await AppointmentService.create(booking(start), client_id)
+                    outcome['booked'] += 1
+                except HTTPException as e:
+                    assert e.status_code == 409
+                    outcome['booking_conflicts'] += 1
+            except HTTPException as e:
+                assert e.status_code == 409
+                outcome['hold_conflicts'] += 1
+            latencies.append(time.perf_counter() - began)
+
+        await asyncio.gather(*(booker(4000 + i) for i in range(clients)))
+        latencies.sort()
+        outcome['rpc_calls'] = len(master.called('create_booking'))
+        outcome['conflict_rate'] = (outcome['hold_conflicts'] + outcome['booking_conflicts']) / clients
+        outcome['p99_ms'] = latencies[math.ceil(len(latencies) * 0.99) - 1] * 1000
+        return outcome
+
+    without = await race(50, with_holds=False)
+    held = await race(50, with_holds=True)
+    for name, result in (('without holds', without), ('with holds', held)):
+        print(f"\n{name}: conflict rate {result['conflict_rate']:.0%} "
+              f"({result['booking_conflicts']} after the form, {result['hold_conflicts']} at slot choice), "
+              f"{result['rpc_calls']} create_booking calls, p99 {result['p99_ms']:.1f} ms")
+
+    assert without == without | {'booked': 1, 'booking_conflicts': 49, 'hold_conflicts': 0, 'rpc_calls': 50}
+    assert held == held | {'booked': 1, 'booking_conflicts': 0, 'hold_conflicts': 49, 'rpc_calls': 1}
@@ -0,0 +1,193 @@
+-- Проверка планов горячих запросов (регрессия индексов).
+-- Запускать ТОЛЬКО на локальной базе с примененной схемой:
+--
+--   psql -v ON_ERROR_STOP=1 -f database/shema.sql -f database/explain_check.sql
+--
+-- Скрипт в одной транзакции засевает ~1M записей (2000 мастеров, ~2 года истории),
+-- прогоняет EXPLAIN (ANALYZE) для каждого запроса, который шлют роутеры и RPC,
+-- и падает, если в плане есть Seq Scan. В конце все откатывается.
+-- Запросы повторяют app/repositories/* и функции из shema.sql — меняете запрос, меняйте и здесь.
+
+BEGIN;
+
+-- ---------------------------------------------------------------
+-- Данные
+-- ---------------------------------------------------------------
+INSERT INTO masters (telegram_id, salon_name, timezone, is_premium)
+SELECT 900000000 + g, 'Salon ' || g, 'Asia/Almaty', g % 3 = 0
+FROM generate_series(1, 2000) g;
+
+INSERT INTO services (master_telegram_id, name, price, duration_min, is_active)
+SELECT 900000000 + m, 'Service ' || s, 3000 + s * 1000, 30 * s, s <> 5
+FROM generate_series(1, 2000) m, generate_series(1, 5) s;
+
+INSERT INTO working_hours (master_telegram_id, day_of_week, start_time, end_time, slot_minutes)
+SELECT 900000000 + m, d, '09:00', '19:00', 60
+FROM generate_series(1, 2000) m, generate_series(1, 6) d;
+
+-- Дневную сводку пересчитаем одним проходом после вставки
+ALTER TABLE appointments DISABLE TRIGGER trg_appointments_rollup;
+
+-- У каждого мастера 500 записей с шагом 33 часа: от ~22 месяцев назад до ~1 месяца вперед
+INSERT INTO appointments (master_telegram_id, client_telegram_id, service_id, starts_at, status,
+                          client_phone, pet_name, reminder_5h_sent, reminder_1h_sent)
+SELECT 900000000 + m,
+       700000000 + (g * 7919) % 50000,
+       first_service.id,
+       date_trunc('hour', now()) - interval '640 days' + g * interval '33 hours',
+       CASE
+           WHEN g > 470 THEN (ARRAY['pending', 'confirmed', 'confirmed', 'cancelled'])[1 + g % 4]
+           ELSE (ARRAY['completed', 'completed', 'completed', 'completed', 'cancelled', 'confirmed'])[1 + g % 6]
+       END,
+       '+77000000000', 'Pet ' || g,
+       g <= 470, g <= 470
+FROM generate_series(1, 2000) m
+JOIN LATERAL (
+    SELECT min(id) AS id FROM services WHERE master_telegram_id = 900000000 + m
+) first_service ON TRUE
+CROSS JOIN generate_series(1, 500) g;
+
+ALTER TABLE appointments ENABLE TRIGGER trg_appointments_rollup;
+SELECT rebuild_master_daily_stats();
+
+ANALYZE masters;
+ANALYZE services;
+ANALYZE working_hours;
+ANALYZE appointments;
+ANALYZE master_daily_stats;
+ANALYZE master_daily_service_stats;
+
+-- ---------------------------------------------------------------
+-- Проверка: EXPLAIN (ANALYZE) и поиск Seq Scan по всему дереву плана
+-- ---------------------------------------------------------------
+CREATE FUNCTION pg_temp.assert_no_seqscan(p_label TEXT, p_query TEXT)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_plan JSON;
+    v_scans TEXT;
+BEGIN
+    EXECUTE 'EXPLAIN (ANALYZE, FORMAT JSON) ' || p_query INTO v_plan;
+
+    WITH RECURSIVE nodes(node) AS (
+        SELECT v_plan -> 0 -> 'Plan'
+        UNION ALL
+        SELECT child
+        FROM nodes, json_array_elements(COALESCE(node -> 'Plans', '[]'::json)) child
+    )
+    SELECT string_agg(DISTINCT node ->> 'Relation Name', ', ') INTO v_scans
+    FROM nodes
+    WHERE node ->> 'Node Type' = 'Seq Scan';
+
+    IF v_scans IS NOT NULL THEN
+        RAISE EXCEPTION 'FAIL %: sequential scan on %', p_label, v_scans;
+    END IF;
+    RAISE NOTICE 'ok   % (% ms)', p_label, round((v_plan -> 0 ->> 'Execution Time')::numeric, 2);
+END;
+$$;
+
+DO $$
+DECLARE
+    m BIGINT := 900001234;
+    appt BIGINT;
+    svc BIGINT;
+    cursor_at TIMESTAMPTZ;
+BEGIN
+    SELECT id, service_id INTO appt, svc FROM appointments WHERE master_telegram_id = m ORDER BY starts_at DESC LIMIT 1;
+    SELECT starts_at INTO cursor_at FROM appointments WHERE master_telegram_id = m ORDER BY starts_at LIMIT 1 OFFSET 100;
+
+    -- MasterRepository / ScheduleService
+    PERFORM pg_temp.assert_no_seqscan('masters.get',
+        format('SELECT * FROM masters WHERE telegram_id = %s LIMIT 1', m));
+    PERFORM pg_temp.assert_no_seqscan('services.list_active',
+        format('SELECT * FROM services WHERE master_telegram_id = %s AND is_active ORDER BY id', m));
+    PERFORM pg_temp.assert_no_seqscan('services.get',
+        format('SELECT * FROM services WHERE id = %s AND master_telegram_id = %s LIMIT 1', svc, m));
+    PERFORM pg_temp.assert_no_seqscan('working_hours.list',
+        format('SELECT * FROM working_hours WHERE master_telegram_id = %s', m));
+
+    -- Занятость (get_availability_inputs / AppointmentRepository.list_busy): неделя
+    PERFORM pg_temp.assert_no_seqscan('availability.busy', format($q$
+        SELECT a.id, a.starts_at, s.duration_min
+        FROM appointments a LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.master_telegram_id = %s AND a.status != 'cancelled'
+          AND a.starts_at >= now() AND a.starts_at < now() + interval '7 days'
+        ORDER BY a.starts_at
+    $q$, m));
+
+    -- Пересечения при записи (create_booking)
+    PERFORM pg_temp.assert_no_seqscan('booking.overlap', format($q$
+        SELECT 1 FROM appointments a LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.master_telegram_id = %s AND a.status != 'cancelled'
+          AND a.starts_at > now() - interval '1 day' AND a.starts_at < now() + interval '90 minutes'
+          AND a.starts_at + make_interval(mins => COALESCE(s.duration_min, 60)) > now()
+        LIMIT 1
+    $q$, m));
+
+    -- Кабинет мастера: страницы /me/appointments
+    PERFORM pg_temp.assert_no_seqscan('appointments.first_page', format($q$
+        SELECT a.*, s.name, s.category FROM appointments a LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.master_telegram_id = %s
+        ORDER BY a.starts_at, a.id LIMIT 51
+    $q$, m));
+    PERFORM pg_temp.assert_no_seqscan('appointments.next_page', format($q$
+        SELECT a.*, s.name, s.category FROM appointments a LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.master_telegram_id = %s
+          AND (a.starts_at > %L OR (a.starts_at = %L AND a.id > %s))
+        ORDER BY a.starts_at, a.id LIMIT 51
+    $q$, m, cursor_at, cursor_at, appt));
+    PERFORM pg_temp.assert_no_seqscan('appointments.month_by_status', format($q$
+        SELECT a.* FROM appointments a
+        WHERE a.master_telegram_id = %s AND a.status = 'completed'
+          AND a.starts_at >= now() - interval '30 days' AND a.starts_at < now()
+        ORDER BY a.starts_at DESC, a.id DESC LIMIT 201
+    $q$, m));
+    PERFORM pg_temp.assert_no_seqscan('appointments.set_status', format($q$
+        WITH updated AS (
+            UPDATE appointments a SET status = 'confirmed'
+            WHERE a.id = ANY(ARRAY[%s, %s]::BIGINT[]) AND a.master_telegram_id = %s AND a.status IS DISTINCT FROM 'confirmed'
+            RETURNING a.*
+        )
+        SELECT u.*, s.name FROM updated u LEFT JOIN services s ON s.id = u.service_id
+    $q$, appt, appt - 1, m));
+
+    -- Напоминания: загрузка таймеров и захват (claim_due_reminders)
+    PERFORM pg_temp.assert_no_seqscan('reminders.upcoming', $q$
+        SELECT id, starts_at, status, reminder_5h_sent, reminder_1h_sent FROM appointments
+        WHERE status = 'confirmed' AND starts_at >= now() AND starts_at <= now() + interval '24 hours'
+    $q$);
+    PERFORM pg_temp.assert_no_seqscan('reminders.claim_5h', $q$
+        UPDATE appointments a SET reminder_5h_sent = TRUE
+        WHERE a.id IN (
+            SELECT c.id FROM appointments c
+            WHERE c.status = 'confirmed' AND NOT c.reminder_5h_sent
+              AND c.starts_at BETWEEN now() + interval '4.5 hours' AND now() + interval '5.5 hours'
+            FOR UPDATE SKIP LOCKED
+        ) AND NOT a.reminder_5h_sent
+        RETURNING a.id
+    $q$);
+    PERFORM pg_temp.assert_no_seqscan('reminders.claim_1h', $q$
+        UPDATE appointments a SET reminder_1h_sent = TRUE
+        WHERE a.id IN (
+            SELECT c.id FROM appointments c
+            WHERE c.status = 'confirmed' AND NOT c.reminder_1h_sent
+              AND c.starts_at BETWEEN now() + interval '54 minutes' AND now() + interval '90 minutes'
+            FOR UPDATE SKIP LOCKED
+        ) AND NOT a.reminder_1h_sent
+        RETURNING a.id
+    $q$);
+
+    -- Аналитика (get_dashboard_stats / get_analytics_series): год по дневной сводке
+    PERFORM pg_temp.assert_no_seqscan('analytics.days', format($q$
+        SELECT * FROM master_daily_stats WHERE master_telegram_id = %s AND day >= current_date - 365
+    $q$, m));
+    PERFORM pg_temp.assert_no_seqscan('analytics.top_services', format($q$
+        SELECT s.name, SUM(x.completed) FROM master_daily_service_stats x JOIN services s ON s.id = x.service_id
+        WHERE x.master_telegram_id = %s AND x.day >= current_date - 365
+        GROUP BY s.name ORDER BY 2 DESC LIMIT 3
+    $q$, m));
+END;
+$$;
+
+ROLLBACK;
@@ -7,6 +7,7 @@ CREATE TABLE IF NOT EXISTS masters (
     address TEXT,
     description TEXT,
     avatar_url TEXT,
+    photos JSONB DEFAULT '[]'::jsonb, -- Галерея (первое фото дублируется в avatar_url)
     timezone TEXT DEFAULT 'Asia/Almaty',
 
     -- [NEW] Для разделения версий (Basic / Pro)
@@ -31,6 +32,11 @@ CREATE TABLE IF NOT EXISTS services (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Активные услуги мастера (кабинет, публичный профиль, расчет слотов)
+CREATE INDEX IF NOT EXISTS idx_services_master_active
+ON services (master_telegram_id, id)
+WHERE is_active;
+
 -- 3. WORKING_HOURS (График работы)
 CREATE TABLE IF NOT EXISTS working_hours (
     id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
@@ -64,6 +70,7 @@ CREATE TABLE IF NOT EXISTS appointments (
     pet_weight_kg NUMERIC,
     comment TEXT,
     idempotency_key TEXT,
+    completed_price NUMERIC, -- цена услуги на момент завершения (для выручки в аналитике)
 
     -- [NEW] Флаги для авто-напоминаний (чтобы не слать дважды)
     reminder_5h_sent BOOLEAN DEFAULT FALSE,
@@ -75,4 +82,623 @@ CREATE TABLE IF NOT EXISTS appointments (
 -- Индекс от дублей (защита от двойного клика на одно время)
 CREATE UNIQUE INDEX IF NOT EXISTS idx_unique_slot
 ON appointments (master_telegram_id, starts_at)
-WHERE status != 'cancelled';
\ No newline at end of file
+WHERE status != 'cancelled';
+
+-- Идемпотентность POST /appointments: повтор запроса с тем же ключом возвращает исходную запись
+CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_idempotency
+ON appointments (client_telegram_id, idempotency_key)
+WHERE idempotency_key IS NOT NULL;
+
+-- Список записей мастера с курсорной пагинацией по (starts_at, id), включая отмененные
+CREATE INDEX IF NOT EXISTS idx_appointments_master_starts
+ON appointments (master_telegram_id, starts_at, id);
+
+-- Напоминания: подтвержденные записи в узком окне starts_at (таймеры, сверка, claim_due_reminders).
+-- Занятость (get_availability_inputs) обслуживает idx_unique_slot, аналитика — master_daily_stats.
+CREATE INDEX IF NOT EXISTS idx_appointments_confirmed_starts
+ON appointments (starts_at)
+WHERE status = 'confirmed';
+
+-- 5. AVAILABILITY (Все входные данные для расчета свободных слотов за один запрос)
+-- Возвращает публичный профиль мастера, активные услуги, рабочие часы на всю неделю
+-- и занятые интервалы с начала p_from до конца p_to (локальные сутки мастера).
+-- Профиль, услуги и часы бэкенд кладет в кэш мастера (app/services/schedule_service.py).
+DROP FUNCTION IF EXISTS get_availability_inputs(BIGINT, BIGINT, DATE);
+DROP FUNCTION IF EXISTS get_availability_inputs(BIGINT, BIGINT, DATE, DATE);
+
+CREATE OR REPLACE FUNCTION get_availability_inputs(p_master_id BIGINT, p_from DATE, p_to DATE)
+RETURNS JSON
+LANGUAGE plpgsql STABLE
+AS $$
+DECLARE
+    v_master masters%ROWTYPE;
+    v_tz TEXT;
+    v_range_start TIMESTAMPTZ;
+    v_range_end TIMESTAMPTZ;
+BEGIN
+    SELECT * INTO v_master FROM masters WHERE telegram_id = p_master_id;
+    IF NOT FOUND THEN
+        RETURN json_build_object('master', NULL);
+    END IF;
+
+    v_tz := COALESCE(v_master.timezone, 'Asia/Almaty');
+    BEGIN
+        v_range_start := p_from::timestamp AT TIME ZONE v_tz;
+    EXCEPTION WHEN invalid_parameter_value THEN
+        -- Некорректная таймзона в профиле: как и бэкенд, считаем по Алматы
+        v_tz := 'Asia/Almaty';
+        v_range_start := p_from::timestamp AT TIME ZONE v_tz;
+    END;
+    v_range_end := (p_to + 1)::timestamp AT TIME ZONE v_tz;
+
+    RETURN json_build_object(
+        'master', json_build_object(
+            'salon_name', v_master.salon_name,
+            'description', v_master.description,
+            'avatar_url', v_master.avatar_url,
+            'address', v_master.address,
+            'phone', v_master.phone,
+            'timezone', v_master.timezone,
+            'photos', v_master.photos,
+            'is_premium', v_master.is_premium
+        ),
+        'services', COALESCE((
+            SELECT json_agg(s ORDER BY s.id)
+            FROM services s
+            WHERE s.master_telegram_id = p_master_id AND s.is_active
+        ), '[]'::json),
+        'working_hours', COALESCE((
+            SELECT json_agg(wh)
+            FROM working_hours wh
+            WHERE wh.master_telegram_id = p_master_id
+        ), '[]'::json),
+        'busy', COALESCE((
+            SELECT json_agg(json_build_object('id', a.id, 'starts_at', a.starts_at, 'duration_min', s.duration_min)
+                            ORDER BY a.starts_at)
+            FROM appointments a
+            LEFT JOIN services s ON s.id = a.service_id
+            WHERE a.master_telegram_id = p_master_id
+              AND a.status != 'cancelled'
+              AND a.starts_at >= v_range_start
+              AND a.starts_at < v_range_end
+        ), '[]'::json)
+    );
+END;
+$$;
+
+
+-- 6. REMINDERS (Захват напоминаний: каждое достается ровно одному воркеру/реплике)
+-- Флаг ставится атомарно ДО отправки. Строки, которые сейчас захватывает другой
+-- воркер, пропускаются (SKIP LOCKED), а повторная проверка флага под блокировкой
+-- гарантирует, что одну и ту же запись не вернут двум вызовам.
+-- p_ids (необязательно) сужает захват до конкретных записей — так срабатывают таймеры бэкенда.
+DROP FUNCTION IF EXISTS claim_due_reminders(TEXT, TIMESTAMPTZ, TIMESTAMPTZ);
+
+CREATE OR REPLACE FUNCTION claim_due_reminders(
+    p_kind TEXT, p_from TIMESTAMPTZ, p_to TIMESTAMPTZ, p_ids BIGINT[] DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    starts_at TIMESTAMPTZ,
+    client_telegram_id BIGINT,
+    pet_name TEXT,
+    service_name TEXT,
+    salon_name TEXT,
+    timezone TEXT
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_kind = '5h' THEN
+        RETURN QUERY
+        WITH claimed AS (
+            UPDATE appointments a SET reminder_5h_sent = TRUE
+            WHERE a.id IN (
+                SELECT c.id FROM appointments c
+                WHERE c.status = 'confirmed'
+                  AND NOT c.reminder_5h_sent
+                  AND c.starts_at BETWEEN p_from AND p_to
+                  AND (p_ids IS NULL OR c.id = ANY(p_ids))
+                FOR UPDATE SKIP LOCKED
+            )
+              AND NOT a.reminder_5h_sent
+            RETURNING a.id, a.starts_at, a.client_telegram_id, a.pet_name, a.service_id, a.master_telegram_id
+        )
+        SELECT c.id, c.starts_at, c.client_telegram_id, c.pet_name, s.name, m.salon_name, m.timezone
+        FROM claimed c
+        LEFT JOIN services s ON s.id = c.service_id
+        LEFT JOIN masters m ON m.telegram_id = c.master_telegram_id;
+    ELSIF p_kind = '1h' THEN
+        RETURN QUERY
+        WITH claimed AS (
+            UPDATE appointments a SET reminder_1h_sent = TRUE
+            WHERE a.id IN (
+                SELECT c.id FROM appointments c
+                WHERE c.status = 'confirmed'
+                  AND NOT c.reminder_1h_sent
+                  AND c.starts_at BETWEEN p_from AND p_to
+                  AND (p_ids IS NULL OR c.id = ANY(p_ids))
+                FOR UPDATE SKIP LOCKED
+            )
+              AND NOT a.reminder_1h_sent
+            RETURNING a.id, a.starts_at, a.client_telegram_id, a.pet_name, a.service_id, a.master_telegram_id
+        )
+        SELECT c.id, c.starts_at, c.client_telegram_id, c.pet_name, s.name, m.salon_name, m.timezone
+        FROM claimed c
+        LEFT JOIN services s ON s.id = c.service_id
+        LEFT JOIN masters m ON m.telegram_id = c.master_telegram_id;
+    ELSE
+        RAISE EXCEPTION 'Unknown reminder kind: %', p_kind;
+    END IF;
+END;
+$$;
+
+
+-- 7. ANALYTICS ROLLUP (Дневные агрегаты мастера, поддерживаются триггером)
+-- День — локальный день мастера (masters.timezone). Выручка — по цене услуги
+-- на момент, когда запись стала completed (appointments.completed_price).
+CREATE TABLE IF NOT EXISTS master_daily_stats (
+    master_telegram_id BIGINT NOT NULL REFERENCES masters(telegram_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    pending INTEGER NOT NULL DEFAULT 0,
+    confirmed INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    revenue NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (master_telegram_id, day)
+);
+
+-- Сколько раз каждая услуга была выполнена (completed) за день
+CREATE TABLE IF NOT EXISTS master_daily_service_stats (
+    master_telegram_id BIGINT NOT NULL REFERENCES masters(telegram_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    service_id BIGINT NOT NULL REFERENCES services(id) ON DELETE CASCADE,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (master_telegram_id, day, service_id)
+);
+
+-- Цена фиксируется в записи при переходе в completed: последующая смена цены услуги
+-- не меняет уже заработанную выручку (ни при вычитании в триггере, ни при пересчете)
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS completed_price NUMERIC;
+
+CREATE OR REPLACE FUNCTION fix_completed_price()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.status <> 'completed' THEN
+        NEW.completed_price := NULL;
+    ELSIF TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed' THEN
+        NEW.completed_price := COALESCE((SELECT price FROM services WHERE id = NEW.service_id), 0);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_completed_price
+BEFORE INSERT OR UPDATE OF status ON appointments
+FOR EACH ROW EXECUTE FUNCTION fix_completed_price();
+
+-- Записи, завершенные до появления completed_price: берем текущую цену один раз.
+-- Выполняется до пересоздания trg_appointments_rollup, поэтому сводку не трогает.
+UPDATE appointments a
+SET completed_price = COALESCE((SELECT price FROM services s WHERE s.id = a.service_id), 0)
+WHERE a.status = 'completed' AND a.completed_price IS NULL;
+
+-- Локальная дата момента p_ts для мастера (некорректная таймзона -> Алматы)
+CREATE OR REPLACE FUNCTION master_local_day(p_master_id BIGINT, p_ts TIMESTAMPTZ)
+RETURNS DATE
+LANGUAGE plpgsql STABLE
+AS $$
+DECLARE
+    v_tz TEXT;
+BEGIN
+    SELECT COALESCE(timezone, 'Asia/Almaty') INTO v_tz FROM masters WHERE telegram_id = p_master_id;
+    BEGIN
+        RETURN (p_ts AT TIME ZONE COALESCE(v_tz, 'Asia/Almaty'))::date;
+    EXCEPTION WHEN invalid_parameter_value THEN
+        RETURN (p_ts AT TIME ZONE 'Asia/Almaty')::date;
+    END;
+END;
+$$;
+
+-- Прибавляет (p_sign = 1) или вычитает (p_sign = -1) одну запись из дневных агрегатов.
+-- p_revenue — выручка записи (completed_price), а не текущая цена услуги.
+-- Вычитание только обновляет существующие строки: при каскадном удалении мастера
+-- строки сводки уже могут быть удалены, и вставлять их заново нельзя.
+DROP FUNCTION IF EXISTS apply_daily_stats(BIGINT, TIMESTAMPTZ, TEXT, BIGINT, INTEGER);
+
+CREATE OR REPLACE FUNCTION apply_daily_stats(
+    p_master_id BIGINT, p_starts_at TIMESTAMPTZ, p_status TEXT, p_service_id BIGINT,
+    p_revenue NUMERIC, p_sign INTEGER
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_day DATE := master_local_day(p_master_id, p_starts_at);
+    v_revenue NUMERIC := CASE WHEN p_status = 'completed' THEN COALESCE(p_revenue, 0) ELSE 0 END;
+BEGIN
+    IF p_sign < 0 THEN
+        UPDATE master_daily_stats SET
+            pending = pending - (p_status = 'pending')::int,
+            confirmed = confirmed - (p_status = 'confirmed')::int,
+            completed = completed - (p_status = 'completed')::int,
+            cancelled = cancelled - (p_status = 'cancelled')::int,
+            revenue = revenue - v_revenue
+        WHERE master_telegram_id = p_master_id AND day = v_day;
+
+        IF p_status = 'completed' AND p_service_id IS NOT NULL THEN
+            UPDATE master_daily_service_stats SET completed = completed - 1
+            WHERE master_telegram_id = p_master_id AND day = v_day AND service_id = p_service_id;
+        END IF;
+        RETURN;
+    END IF;
+
+    INSERT INTO master_daily_stats AS m (master_telegram_id, day, pending, confirmed, completed, cancelled, revenue)
+    VALUES (
+        p_master_id, v_day,
+        (p_status = 'pending')::int,
+        (p_status = 'confirmed')::int,
+        (p_status = 'completed')::int,
+        (p_status = 'cancelled')::int,
+        v_revenue
+    )
+    ON CONFLICT (master_telegram_id, day) DO UPDATE SET
+        pending = m.pending + EXCLUDED.pending,
+        confirmed = m.confirmed + EXCLUDED.confirmed,
+        completed = m.completed + EXCLUDED.completed,
+        cancelled = m.cancelled + EXCLUDED.cancelled,
+        revenue = m.revenue + EXCLUDED.revenue;
+
+    IF p_status = 'completed' AND p_service_id IS NOT NULL THEN
+        INSERT INTO master_daily_service_stats AS m (master_telegram_id, day, service_id, completed)
+        VALUES (p_master_id, v_day, p_service_id, 1)
+        ON CONFLICT (master_telegram_id, day, service_id) DO UPDATE SET
+            completed = m.completed + EXCLUDED.completed;
+    END IF;
+END;
+$$;
+
+-- Инкрементальное обновление: срабатывает на создание записи и смену статуса
+-- (AppointmentService.create, confirm/complete/cancel), а также на перенос и удаление.
+-- Берет advisory-ключ мастера, как и rebuild_master_daily_stats: изменение, закоммиченное
+-- во время пересчета, ждет его конца и не попадает в сводку дважды
+CREATE OR REPLACE FUNCTION rollup_appointment_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_advisory_xact_lock(OLD.master_telegram_id);
+        PERFORM apply_daily_stats(OLD.master_telegram_id, OLD.starts_at, OLD.status, OLD.service_id,
+                                  OLD.completed_price, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_advisory_xact_lock(NEW.master_telegram_id);
+        PERFORM apply_daily_stats(NEW.master_telegram_id, NEW.starts_at, NEW.status, NEW.service_id,
+                                  NEW.completed_price, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE TRIGGER trg_appointments_rollup
+AFTER INSERT OR DELETE OR UPDATE OF status, starts_at, service_id, master_telegram_id, completed_price ON appointments
+FOR EACH ROW EXECUTE FUNCTION rollup_appointment_change();
+
+-- Полный пересчет (backfill): для одного мастера или для всех (p_master_id IS NULL).
+-- Нужен после первого развертывания и после смены таймзоны мастера (set_master_timezone).
+-- Блокируется только пересчитываемый мастер: тот же advisory-ключ берут create_booking
+-- и триггер сводки, остальные мастера записываются как обычно. Пересчет всех держит ключи всех мастеров
+-- до конца транзакции — на большой базе лучше python -m app.rollup (мастер за вызов).
+CREATE OR REPLACE FUNCTION rebuild_master_daily_stats(p_master_id BIGINT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_master BIGINT;
+    v_rows INTEGER;
+    v_total INTEGER := 0;
+BEGIN
+    FOR v_master IN
+        SELECT telegram_id FROM masters
+        WHERE p_master_id IS NULL OR telegram_id = p_master_id
+        ORDER BY telegram_id
+    LOOP
+        PERFORM pg_advisory_xact_lock(v_master);
+
+        DELETE FROM master_daily_service_stats WHERE master_telegram_id = v_master;
+        DELETE FROM master_daily_stats WHERE master_telegram_id = v_master;
+
+        -- Под ключом мастера триггер не добавит строк между DELETE и INSERT;
+        -- на конфликте все равно пишем абсолютные значения, а не прибавляем
+        INSERT INTO master_daily_stats (master_telegram_id, day, pending, confirmed, completed, cancelled, revenue)
+        SELECT v_master, master_local_day(v_master, a.starts_at),
+               COUNT(*) FILTER (WHERE a.status = 'pending'),
+               COUNT(*) FILTER (WHERE a.status = 'confirmed'),
+               COUNT(*) FILTER (WHERE a.status = 'completed'),
+               COUNT(*) FILTER (WHERE a.status = 'cancelled'),
+               COALESCE(SUM(a.completed_price) FILTER (WHERE a.status = 'completed'), 0)
+        FROM appointments a
+        WHERE a.master_telegram_id = v_master
+        GROUP BY 2
+        ON CONFLICT (master_telegram_id, day) DO UPDATE SET
+            pending = EXCLUDED.pending,
+            confirmed = EXCLUDED.confirmed,
+            completed = EXCLUDED.completed,
+            cancelled = EXCLUDED.cancelled,
+            revenue = EXCLUDED.revenue;
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        v_total := v_total + v_rows;
+
+        INSERT INTO master_daily_service_stats (master_telegram_id, day, service_id, completed)
+        SELECT v_master, master_local_day(v_master, a.starts_at), a.service_id, COUNT(*)
+        FROM appointments a
+        WHERE a.master_telegram_id = v_master AND a.status = 'completed' AND a.service_id IS NOT NULL
+        GROUP BY 2, 3
+        ON CONFLICT (master_telegram_id, day, service_id) DO UPDATE SET
+            completed = EXCLUDED.completed;
+    END LOOP;
+
+    RETURN v_total;
+END;
+$$;
+
+-- Смена таймзоны мастера вместе с пересчетом сводки в одной транзакции:
+-- либо оба изменения применены, либо ни одного
+CREATE OR REPLACE FUNCTION set_master_timezone(p_master_id BIGINT, p_timezone TEXT)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE masters SET timezone = p_timezone WHERE telegram_id = p_master_id;
+    RETURN rebuild_master_daily_stats(p_master_id);
+END;
+$$;
+
+-- KPI дашборда из дневных агрегатов: стоимость не зависит от числа записей
+DROP FUNCTION IF EXISTS get_dashboard_stats(BIGINT, TIMESTAMPTZ, DATE, DATE);
+
+CREATE OR REPLACE FUNCTION get_dashboard_stats(
+    p_master_id BIGINT, p_from DATE, p_daily_from DATE, p_daily_to DATE
+)
+RETURNS JSON
+LANGUAGE sql STABLE
+AS $$
+    WITH days AS (
+        SELECT *
+        FROM master_daily_stats
+        WHERE master_telegram_id = p_master_id AND day >= p_from
+    )
+    SELECT json_build_object(
+        'completed', COALESCE(SUM(completed), 0),
+        'cancelled', COALESCE(SUM(cancelled), 0),
+        'pending', COALESCE(SUM(pending), 0),
+        'revenue', COALESCE(SUM(revenue), 0),
+        'top_services', COALESCE((
+            SELECT json_agg(t ORDER BY t.count DESC, t.name)
+            FROM (
+                SELECT s.name, SUM(x.completed) AS count
+                FROM master_daily_service_stats x
+                JOIN services s ON s.id = x.service_id
+                WHERE x.master_telegram_id = p_master_id AND x.day >= p_from
+                GROUP BY s.name
+                HAVING SUM(x.completed) > 0
+                ORDER BY SUM(x.completed) DESC, s.name
+                LIMIT 3
+            ) t
+        ), '[]'::json),
+        'daily', COALESCE((
+            SELECT json_object_agg(d.day, d.pending + d.confirmed + d.completed + d.cancelled)
+            FROM days d
+            WHERE d.day BETWEEN p_daily_from AND p_daily_to
+        ), '{}'::json)
+    )
+    FROM days;
+$$;
+
+-- Ряд для графиков аналитики: произвольный период [p_from, p_to] в локальных днях мастера,
+-- группировка по дням, неделям (с понедельника) или месяцам. Пустые периоды не возвращаются.
+CREATE OR REPLACE FUNCTION get_analytics_series(
+    p_master_id BIGINT, p_from DATE, p_to DATE, p_granularity TEXT DEFAULT 'day'
+)
+RETURNS JSON
+LANGUAGE sql STABLE
+AS $$
+    WITH days AS (
+        SELECT *
+        FROM master_daily_stats
+        WHERE master_telegram_id = p_master_id AND day BETWEEN p_from AND p_to
+    )
+    SELECT json_build_object(
+        'totals', (
+            SELECT json_build_object(
+                'pending', COALESCE(SUM(pending), 0),
+                'confirmed', COALESCE(SUM(confirmed), 0),
+                'completed', COALESCE(SUM(completed), 0),
+                'cancelled', COALESCE(SUM(cancelled), 0),
+                'revenue', COALESCE(SUM(revenue), 0)
+            )
+            FROM days
+        ),
+        'top_services', COALESCE((
+            SELECT json_agg(t ORDER BY t.count DESC, t.name)
+            FROM (
+                SELECT s.name, SUM(x.completed) AS count
+                FROM master_daily_service_stats x
+                JOIN services s ON s.id = x.service_id
+                WHERE x.master_telegram_id = p_master_id AND x.day BETWEEN p_from AND p_to
+                GROUP BY s.name
+                HAVING SUM(x.completed) > 0
+                ORDER BY SUM(x.completed) DESC, s.name
+                LIMIT 5
+            ) t
+        ), '[]'::json),
+        'buckets', COALESCE((
+            SELECT json_agg(b ORDER BY b.period)
+            FROM (
+                SELECT date_trunc(p_granularity, day)::date AS period,
+                       SUM(pending) AS pending,
+                       SUM(confirmed) AS confirmed,
+                       SUM(completed) AS completed,
+                       SUM(cancelled) AS cancelled,
+                       SUM(revenue) AS revenue
+                FROM days
+                GROUP BY 1
+            ) b
+        ), '[]'::json)
+    );
+$$;
+
+
+-- 8. BOOKING (Создание записи клиентом за один запрос)
+-- Под advisory-блокировкой мастера проверяет, что услуга активна и принадлежит мастеру,
+-- что интервал [p_starts_at, + длительность) укладывается в рабочие часы дня (локальное
+-- время мастера) и не пересекается с другими неотмененными записями, и вставляет запись.
+-- Возвращает строку записи + service_name и master_timezone (для уведомления мастеру).
+-- Повтор с тем же (p_client_id, p_idempotency_key) возвращает исходную запись с replayed = true
+-- без повторных проверок (в т.ч. если исходная запись с тех пор отменена или время прошло).
+-- Ошибки (SQLSTATE -> HTTP в AppointmentService.create):
+--   BK001 услуга не найдена / чужая -> 400
+--   BK002 вне рабочих часов         -> 400
+--   BK003 пересечение с записью     -> 409 (как и 23505 от idx_unique_slot)
+CREATE OR REPLACE FUNCTION booking_result(p_appt appointments, p_replayed BOOLEAN)
+RETURNS JSON
+LANGUAGE sql STABLE
+AS $$
+    SELECT (to_jsonb(p_appt) || jsonb_build_object(
+        'service_name', (SELECT name FROM services WHERE id = p_appt.service_id),
+        'master_timezone', (SELECT COALESCE(timezone, 'Asia/Almaty') FROM masters WHERE telegram_id = p_appt.master_telegram_id),
+        'replayed', p_replayed
+    ))::json;
+$$;
+
+CREATE OR REPLACE FUNCTION create_booking(
+    p_master_id BIGINT,
+    p_client_id BIGINT,
+    p_service_id BIGINT,
+    p_starts_at TIMESTAMPTZ,
+    p_client_name TEXT,
+    p_client_phone TEXT,
+    p_client_username TEXT DEFAULT NULL,
+    p_pet_name TEXT DEFAULT NULL,
+    p_pet_breed TEXT DEFAULT NULL,
+    p_comment TEXT DEFAULT NULL,
+    p_idempotency_key TEXT DEFAULT NULL
+)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_service services%ROWTYPE;
+    v_tz TEXT;
+    v_local TIMESTAMP;
+    v_duration INTEGER;
+    v_ends_at TIMESTAMPTZ;
+    v_hours working_hours%ROWTYPE;
+    v_appt appointments%ROWTYPE;
+BEGIN
+    -- Записи одного мастера создаются по очереди: проверка пересечений и вставка атомарны
+    PERFORM pg_advisory_xact_lock(p_master_id);
+
+    -- Повтор запроса: параллельный дубль дождался блокировки и видит уже закоммиченную запись
+    IF p_idempotency_key IS NOT NULL THEN
+        SELECT * INTO v_appt
+        FROM appointments
+        WHERE client_telegram_id = p_client_id AND idempotency_key = p_idempotency_key;
+        IF FOUND THEN
+            RETURN booking_result(v_appt, TRUE);
+        END IF;
+    END IF;
+
+    SELECT * INTO v_service
+    FROM services
+    WHERE id = p_service_id AND master_telegram_id = p_master_id AND is_active;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Service % not found for master %', p_service_id, p_master_id USING ERRCODE = 'BK001';
+    END IF;
+    v_duration := COALESCE(v_service.duration_min, 60);
+    v_ends_at := p_starts_at + make_interval(mins => v_duration);
+
+    SELECT COALESCE(timezone, 'Asia/Almaty') INTO v_tz FROM masters WHERE telegram_id = p_master_id;
+    BEGIN
+        v_local := p_starts_at AT TIME ZONE v_tz;
+    EXCEPTION WHEN invalid_parameter_value THEN
+        v_tz := 'Asia/Almaty';
+        v_local := p_starts_at AT TIME ZONE v_tz;
+    END;
+
+    SELECT * INTO v_hours
+    FROM working_hours
+    WHERE master_telegram_id = p_master_id AND day_of_week = EXTRACT(ISODOW FROM v_local);
+    IF NOT FOUND
+       OR v_local < v_local::date + v_hours.start_time
+       OR v_local + make_interval(mins => v_duration) > v_local::date + v_hours.end_time THEN
+        RAISE EXCEPTION 'Outside working hours' USING ERRCODE = 'BK002';
+    END IF;
+
+    -- Услуги короче суток: раньше p_starts_at - 1 день чужая запись закончиться не могла
+    IF EXISTS (
+        SELECT 1
+        FROM appointments a
+        LEFT JOIN services s ON s.id = a.service_id
+        WHERE a.master_telegram_id = p_master_id
+          AND a.status != 'cancelled'
+          AND a.starts_at > p_starts_at - interval '1 day'
+          AND a.starts_at < v_ends_at
+          AND a.starts_at + make_interval(mins => COALESCE(s.duration_min, 60)) > p_starts_at
+    ) THEN
+        RAISE EXCEPTION 'Slot overlaps another appointment' USING ERRCODE = 'BK003';
+    END IF;
+
+    INSERT INTO appointments (
+        master_telegram_id, client_telegram_id, service_id, starts_at, status,
+        client_name, client_phone, client_username, pet_name, pet_breed, comment, idempotency_key
+    )
+    VALUES (
+        p_master_id, p_client_id, p_service_id, p_starts_at, 'pending',
+        p_client_name, p_client_phone, p_client_username, p_pet_name, p_pet_breed, p_comment, p_idempotency_key
+    )
+    ON CONFLICT (client_telegram_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    RETURNING * INTO v_appt;
+
+    -- Тот же ключ одновременно использован для записи к другому мастеру
+    IF NOT FOUND THEN
+        SELECT * INTO v_appt
+        FROM appointments
+        WHERE client_telegram_id = p_client_id AND idempotency_key = p_idempotency_key;
+        RETURN booking_result(v_appt, TRUE);
+    END IF;
+
+    RETURN booking_result(v_appt, FALSE);
+END;
+$$;
+
+
+-- 9. BULK STATUS (Подтверждение/отмена/завершение пачки записей мастера одним запросом)
+-- Меняет статус только своим записям и только по допустимому переходу: подтвердить можно
+-- ожидающую, завершить — подтвержденную, отменить — еще не завершенную. Отмененная запись
+-- не возвращается (ее время могли занять, а проверки create_booking здесь не выполняются),
+-- повторное подтверждение не шлет клиенту второе уведомление. Возвращает измененные строки
+-- с service_name — для уведомлений клиентам и booking_changed; остальные id пропускаются.
+CREATE OR REPLACE FUNCTION set_appointments_status(p_master_id BIGINT, p_ids BIGINT[], p_status TEXT)
+RETURNS JSON
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE appointments a SET status = p_status
+        WHERE a.id = ANY(p_ids)
+          AND a.master_telegram_id = p_master_id
+          AND CASE p_status
+                  WHEN 'confirmed' THEN a.status = 'pending'
+                  WHEN 'completed' THEN a.status = 'confirmed'
+                  WHEN 'cancelled' THEN a.status IN ('pending', 'confirmed')
+                  ELSE FALSE
+              END
+        RETURNING a.*
+    )
+    SELECT COALESCE(json_agg((to_jsonb(u) || jsonb_build_object('service_name', s.name)) ORDER BY u.starts_at), '[]'::json)
+    FROM updated u
+    LEFT JOIN services s ON s.id = u.service_id;
+$$;
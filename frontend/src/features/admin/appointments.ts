@@ -3,7 +3,7 @@ import { apiFetch } from '../../core/api';
 import { showToast } from '../../ui/toast';
 import { showConfirm } from '../../ui/modal';
 import { ICONS } from '../../ui/icons';
-import { Appointment } from '../../types';
+import { Appointment, AppointmentPage } from '../../types';
 import { Telegram } from '../../core/tg';
 
 let appointmentsCache: Appointment[] = [];
@@ -36,7 +36,7 @@ export async function loadAppointments() {
     if(list) list.innerHTML = '<div class="text-center text-text-secondary py-8">Загрузка...</div>';
 
     try {
-        appointmentsCache = await apiFetch<Appointment[]>('/me/appointments');
+        appointmentsCache = await fetchMonth();
         renderCalendar();
         renderList();
     } catch {
@@ -44,6 +44,32 @@ export async function loadAppointments() {
     }
 }
 
+function toIsoDate(date: Date): string {
+    const y = date.getFullYear();
+    const m = String(date.getMonth() + 1).padStart(2, '0');
+    const d = String(date.getDate()).padStart(2, '0');
+    return `${y}-${m}-${d}`;
+}
+
+// Грузим только записи просматриваемого месяца (с днем запаса по краям), постранично
+async function fetchMonth(): Promise<Appointment[]> {
+    const year = viewDate.getFullYear();
+    const month = viewDate.getMonth();
+    const from = toIsoDate(new Date(year, month, 0));
+    const to = toIsoDate(new Date(year, month + 1, 1));
+
+    const items: Appointment[] = [];
+    let cursor: string | null = null;
+    do {
+        const params = new URLSearchParams({ from, to, limit: '200' });
+        if (cursor) params.set('cursor', cursor);
+        const page: AppointmentPage = await apiFetch<AppointmentPage>(`/me/appointments?${params}`);
+        items.push(...page.items);
+        cursor = page.next_cursor;
+    } while (cursor);
+    return items;
+}
+
 function renderTabs() {
     const container = $('appointment-tabs');
     if (!container) return;
@@ -70,9 +96,18 @@ function renderTabs() {
     });
 }
 
-function changeMonth(offset: number) {
+async function changeMonth(offset: number) {
     viewDate.setMonth(viewDate.getMonth() + offset);
     renderCalendar();
+    try {
+        // Записи прошлых месяцев оставляем: выбранный день может быть вне нового месяца
+        const loaded = await fetchMonth();
+        const ids = new Set(loaded.map(a => a.id));
+        appointmentsCache = appointmentsCache.filter(a => !ids.has(a.id)).concat(loaded);
+    } catch {
+        showToast('Ошибка сети', 'error');
+    }
+    renderCalendar();
     renderList();
 }
 
@@ -2,9 +2,9 @@ import { $, getVal, setVal, show, hide, toggle } from '../../core/dom';
 import { apiFetch } from '../../core/api';
 import { showToast } from '../../ui/toast';
 import { renderCarousel, uploadPhoto } from '../../ui/carousel';
-import { MasterProfile } from '../../types';
+import { MasterProfile, Photo } from '../../types';
 
-let currentPhotos: string[] = [];
+let currentPhotos: Photo[] = [];
 let originalData: Partial<MasterProfile> = {};
 // [NEW] Храним статус подписки
 let isPremium = false;
@@ -53,8 +53,8 @@ export function initProfileHandlers() {
             if (!photoInput.files?.[0]) return;
             showToast('Загрузка...');
             try {
-                const url = await uploadPhoto(photoInput.files[0]);
-                currentPhotos.push(url);
+                const photo = await uploadPhoto(photoInput.files[0]);
+                currentPhotos.push(photo);
                 updateCarousel(true);
             } catch { showToast('Ошибка загрузки', 'error'); }
             photoInput.value = '';
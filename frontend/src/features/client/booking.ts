@@ -1,22 +1,89 @@
 import { $, setText, show, hide, getVal } from '../../core/dom';
-import { apiFetch } from '../../core/api';
+import { apiFetch, BASE_URL } from '../../core/api';
 import { Telegram } from '../../core/tg';
 import { Service } from '../../types';
 
 let selectedService: Service | null = null;
 let selectedDate: string | null = null;
 let selectedSlot: string | null = null;
+let heldSlot: string | null = null; // слот, забронированный за этим клиентом (POST /holds)
+// Ключ идемпотентности попытки записи: повтор после сетевой ошибки не создаст дубль
+let bookingKey: string | null = null;
 let masterId: string = '';
 let masterTimezone = 'Asia/Almaty';
 
 // Calendar state
 let viewDate = new Date();
 
+// Слоты, пришедшие в /bootstrap: `${serviceId}:${date}` -> слоты (используются один раз)
+const prefetchedSlots: Record<string, string[]> = {};
+
+export function primeSlots(serviceId: number | null, availability: Record<string, string[]>) {
+    if (serviceId === null) return;
+    Object.entries(availability).forEach(([date, slots]) => {
+        prefetchedSlots[`${serviceId}:${date}`] = slots;
+    });
+}
+
+// SSE-поток изменений занятости на выбранную дату (см. /availability/stream)
+let slotStream: EventSource | null = null;
+let slotStreamDate: string | null = null;
+
+function watchSlots(date: string) {
+    if (slotStream && slotStreamDate === date) return;
+    stopWatchingSlots();
+
+    slotStreamDate = date;
+    slotStream = new EventSource(`${BASE_URL}/masters/${masterId}/availability/stream?date=${date}`);
+    slotStream.addEventListener('taken', (e) => removeTakenSlots(JSON.parse((e as MessageEvent).data)));
+    // Освобожденное время и переполнение потока — просто перезапрашиваем слоты дня
+    const reload = () => { if (selectedDate === date) loadSlots(date); };
+    slotStream.addEventListener('released', reload);
+    slotStream.addEventListener('resync', reload);
+}
+
+function stopWatchingSlots() {
+    slotStream?.close();
+    slotStream = null;
+    slotStreamDate = null;
+}
+
+// Убираем слоты, пересекающиеся с только что занятым интервалом
+function removeTakenSlots(event: { starts_at: string; ends_at: string; hold?: boolean }) {
+    const grid = $('slots-grid');
+    if (!grid || !selectedService) return;
+    // Событие о нашей собственной брони
+    if (event.hold && heldSlot && new Date(heldSlot).getTime() === new Date(event.starts_at).getTime()) return;
+
+    const takenStart = new Date(event.starts_at).getTime();
+    const takenEnd = new Date(event.ends_at).getTime();
+    const duration = (selectedService.duration_min || 60) * 60000;
+
+    grid.querySelectorAll<HTMLButtonElement>('.slot-btn').forEach(btn => {
+        const start = new Date(btn.dataset.start!).getTime();
+        if (start < takenEnd && start + duration > takenStart) {
+            if (btn.dataset.start === selectedSlot) {
+                selectedSlot = null;
+                hide('booking-form');
+                Telegram.WebApp.MainButton.hide();
+                Telegram.WebApp.showAlert('Это время только что заняли, выберите другое');
+            }
+            btn.remove();
+        }
+    });
+
+    if (!grid.querySelector('.slot-btn')) {
+        grid.innerHTML = '<div class="col-span-4 text-center text-secondary/50 text-sm py-2">Нет мест</div>';
+    }
+}
+
 // [FIX] Храним колбэк для возврата назад
 let onBackCallback: (() => void) | null = null;
 
 // [FIX] Функция закрытия (используется и кнопкой в HTML, и кнопкой Telegram)
 function closeBooking() {
+    stopWatchingSlots();
+    releaseHold();
     Telegram.WebApp.BackButton.hide();
     Telegram.WebApp.MainButton.hide();
     hide('view-booking');
@@ -140,10 +207,14 @@ async function loadSlots(date: string) {
     }
 
     grid.innerHTML = '<div class="col-span-4 text-center text-secondary text-sm py-4">Поиск окошек...</div>';
+    watchSlots(date);
 
     try {
         // Добавляем service_id для проверки длительности
-        const slots = await apiFetch<string[]>(`/masters/${masterId}/availability?date=${date}&service_id=${selectedService.id}`);
+        const key = `${selectedService.id}:${date}`;
+        const slots = prefetchedSlots[key]
+            ?? await apiFetch<string[]>(`/masters/${masterId}/availability?date=${date}&service_id=${selectedService.id}`);
+        delete prefetchedSlots[key];
 
         grid.innerHTML = '';
 
@@ -156,13 +227,9 @@ async function loadSlots(date: string) {
             const time = new Date(isoTime).toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit', timeZone: masterTimezone });
             const btn = document.createElement('button');
             btn.className = 'slot-btn';
+            btn.dataset.start = isoTime;
             btn.textContent = time;
-            btn.onclick = () => {
-                document.querySelectorAll('.slot-btn').forEach(b => b.classList.remove('active'));
-                btn.classList.add('active');
-                selectedSlot = isoTime;
-                showBookingForm();
-            };
+            btn.onclick = () => selectSlot(btn, isoTime);
             grid.appendChild(btn);
         });
     } catch (e) {
@@ -170,6 +237,35 @@ async function loadSlots(date: string) {
     }
 }
 
+// Бронируем слот на время заполнения формы, чтобы его не заняли параллельно
+async function selectSlot(btn: HTMLButtonElement, isoTime: string) {
+    document.querySelectorAll('.slot-btn').forEach(b => b.classList.remove('active'));
+    btn.classList.add('active');
+    selectedSlot = isoTime;
+    bookingKey = crypto.randomUUID();
+
+    try {
+        heldSlot = isoTime;
+        await apiFetch(`/masters/${masterId}/holds`, {
+            method: 'POST',
+            body: JSON.stringify({ service_id: selectedService!.id, starts_at: isoTime }),
+        });
+    } catch (e) {
+        heldSlot = null;
+        if (selectedSlot === isoTime) selectedSlot = null;
+        Telegram.WebApp.showAlert('Это время уже занято, выберите другое');
+        if (selectedDate) loadSlots(selectedDate);
+        return;
+    }
+    if (selectedSlot === isoTime) showBookingForm();
+}
+
+function releaseHold() {
+    if (!heldSlot) return;
+    heldSlot = null;
+    apiFetch(`/masters/${masterId}/holds`, { method: 'DELETE' }).catch(() => {});
+}
+
 function showBookingForm() {
     show('booking-form');
     setTimeout(() => $('booking-form')?.scrollIntoView({ behavior: 'smooth' }), 100);
@@ -202,10 +298,13 @@ async function submitBooking() {
             client_username: Telegram.WebApp.initDataUnsafe?.user?.username || null,
             pet_name: getVal('inp-pet-name').trim(),
             pet_breed: getVal('inp-pet-breed').trim() || null,
-            comment: getVal('inp-comment').trim() || null
+            comment: getVal('inp-comment').trim() || null,
+            idempotency_key: bookingKey
         };
 
         await apiFetch('/appointments', { method: 'POST', body: JSON.stringify(payload) });
+        heldSlot = null; // Бронь погашена записью
+        bookingKey = null;
 
         // Success screen
         if (selectedDate && selectedSlot) {
@@ -4,9 +4,9 @@ import { renderCarousel } from '../../ui/carousel';
 import { getClientServiceSkeleton } from '../../ui/skeletons'; // NEW
 import { Service, MasterProfile } from '../../types';
 
-export async function loadMasterInfo(masterId: string) {
+export async function loadMasterInfo(masterId: string, prefetched?: MasterProfile) {
     try {
-        const data = await apiFetch<MasterProfile>(`/masters/${masterId}`);
+        const data = prefetched ?? await apiFetch<MasterProfile>(`/masters/${masterId}`);
 
         setText('hero-title', data.salon_name || 'Мастер');
 
@@ -73,7 +73,7 @@ function checkOpenStatus(timezone: string) {
     } catch (e) { console.error(e); }
 }
 
-export async function loadServices(masterId: string, onSelect: (s: Service) => void) {
+export async function loadServices(masterId: string, onSelect: (s: Service) => void, prefetched?: Service[]) {
     const list = $('services-list');
     if (!list) return;
 
@@ -81,7 +81,7 @@ export async function loadServices(masterId: string, onSelect: (s: Service) => v
     list.innerHTML = getClientServiceSkeleton(4);
 
     try {
-        const services = await apiFetch<Service[]>(`/masters/${masterId}/services`);
+        const services = prefetched ?? await apiFetch<Service[]>(`/masters/${masterId}/services`);
         list.innerHTML = '';
 
         if (services.length === 0) {
@@ -3,8 +3,10 @@
  */
 import { initTelegram, Telegram } from '../core/tg';
 import { $ } from '../core/dom';
+import { apiFetch } from '../core/api';
 import { loadMasterInfo, loadServices } from '../features/client/home';
-import { setupBooking, openBooking } from '../features/client/booking';
+import { setupBooking, openBooking, primeSlots } from '../features/client/booking';
+import { MasterBootstrap } from '../types';
 
 declare const IMask: any;
 
@@ -28,8 +30,15 @@ async function init() {
         if (nameInput) nameInput.value = `${user.first_name} ${user.last_name || ''}`.trim();
     }
 
-    // 3. Load Data
-    const masterProfile = await loadMasterInfo(masterId);
+    // 3. Load Data: профиль, услуги и ближайшие слоты — одним запросом
+    let boot: MasterBootstrap | null = null;
+    try {
+        boot = await apiFetch<MasterBootstrap>(`/masters/${masterId}/bootstrap`);
+        primeSlots(boot.service_id, boot.availability);
+    } catch (e) {
+        console.error(e); // Фолбэк: отдельные запросы ниже
+    }
+    const masterProfile = await loadMasterInfo(masterId, boot?.profile);
 
     // 4. Init Booking Module with timezone
     const tz = masterProfile?.timezone || 'Asia/Almaty';
@@ -40,7 +49,7 @@ async function init() {
         openBooking(service, () => {
             // Callback when returning from booking (optional)
         });
-    });
+    }, boot?.services);
 }
 
 init();
\ No newline at end of file
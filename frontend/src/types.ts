@@ -9,6 +9,24 @@ export interface Service {
     is_active?: boolean;
 }
 
+// Фото мастера: старые записи — просто URL, новые — манифест вариантов (см. /me/upload-photo)
+export interface PhotoVariant {
+    w: number;
+    h: number;
+    jpeg: string;
+    webp?: string;
+}
+
+export interface PhotoManifest {
+    id: string;
+    url: string;
+    width: number;
+    height: number;
+    variants: PhotoVariant[]; // по возрастанию ширины
+}
+
+export type Photo = string | PhotoManifest;
+
 export interface MasterProfile {
     telegram_id?: number;
     salon_name: string;
@@ -16,7 +34,7 @@ export interface MasterProfile {
     phone: string;
     description: string;
     avatar_url: string;
-    photos: string[];
+    photos: Photo[];
     timezone: string;
     is_premium: boolean;
 }
@@ -30,9 +48,9 @@ export interface WorkingHour {
 
 export interface Appointment {
     id: number;
-    master_telegram_id: number;
-    service_id: number;
-    services?: { name: string };
+    master_telegram_id?: number;
+    service_id?: number;
+    services?: { name: string; category?: string };
     starts_at: string; // ISO string
     status: 'pending' | 'confirmed' | 'completed' | 'cancelled';
     client_name: string;
@@ -41,4 +59,19 @@ export interface Appointment {
     pet_name: string;
     pet_breed?: string;
     comment?: string;
-}
\ No newline at end of file
+}
+
+// Страница GET /me/appointments (курсорная пагинация)
+export interface AppointmentPage {
+    items: Appointment[];
+    next_cursor: string | null;
+}
+
+// GET /masters/{id}/bootstrap — все для первого экрана клиента одним запросом
+export interface MasterBootstrap {
+    profile: MasterProfile;
+    services: Service[];
+    schedule: Pick<WorkingHour, 'day_of_week' | 'start_time' | 'end_time'>[];
+    service_id: number | null;
+    availability: Record<string, string[]>; // YYYY-MM-DD -> ISO слоты
+}
@@ -1,11 +1,29 @@
 import { $ } from '../core/dom';
 import { BASE_URL } from '../core/api'; 
 import { Telegram } from '../core/tg';
+import { Photo, PhotoManifest } from '../types';
+
+// Браузер сам выберет вариант по ширине экрана и поддержке WebP
+function photoMarkup(photo: Photo, alt: string, className: string): string {
+    if (typeof photo === 'string') {
+        return `<img src="${photo}" alt="${alt}" class="${className}">`;
+    }
+    const srcset = (format: 'jpeg' | 'webp') => photo.variants
+        .filter(v => v[format])
+        .map(v => `${v[format]} ${v.w}w`)
+        .join(', ');
+    const webp = srcset('webp');
+    return `
+        <picture class="contents">
+            ${webp ? `<source type="image/webp" srcset="${webp}" sizes="100vw">` : ''}
+            <img src="${photo.url}" srcset="${srcset('jpeg')}" sizes="100vw" width="${photo.width}" height="${photo.height}" alt="${alt}" loading="lazy" class="${className}">
+        </picture>`;
+}
 
 export function renderCarousel(
     trackId: string, 
     indicatorsId: string, 
-    photos: string[], 
+    photos: Photo[], 
     isEditMode = false, 
     onAddClick?: () => void, 
     onRemoveClick?: (index: number) => void
@@ -21,7 +39,7 @@ export function renderCarousel(
         // FIX: Добавил bg-black/20 чтобы границы фото были видны на темном фоне
         slide.className = 'flex-shrink-0 w-full h-full snap-center relative group flex items-center justify-center bg-black/20';
         slide.innerHTML = `
-            <img src="${photo}" alt="Photo ${index + 1}" class="w-full h-full object-contain">
+            ${photoMarkup(photo, `Photo ${index + 1}`, 'w-full h-full object-contain')}
             <div class="absolute inset-0 bg-black/0 group-hover:bg-black/10 transition-colors"></div>
         `;
         
@@ -77,7 +95,7 @@ function renderIndicators(container: HTMLElement | null, count: number, activeIn
     }
 }
 
-export async function uploadPhoto(file: File): Promise<string> {
+export async function uploadPhoto(file: File): Promise<PhotoManifest> {
     const formData = new FormData();
     formData.append('file', file);
     const response = await fetch(`${BASE_URL}/me/upload-photo`, {
@@ -87,5 +105,5 @@ export async function uploadPhoto(file: File): Promise<string> {
     });
     if (!response.ok) throw new Error('Upload failed');
     const res = await response.json();
-    return res.url;
+    return res.photo;
 }